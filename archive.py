@@ -0,0 +1,293 @@
+"""
+Cold archive tier for old sessions
+Sessions are partitioned by month. Once a month is older than the configured
+age it is moved out of the hot database and the dataset/ tree:
+
+- archive/<YYYY-MM>.db  : that month's sessions and line-item rows
+- archive/<YYYY-MM>.zip : that month's session directories (summaries and
+                          page images), deflate-compressed
+
+The hot database keeps per-employee-day totals of archived sessions
+(archived_daily) so employee totals and analytics still cover all history,
+while listings, searches and directory scans only touch recent months.
+Archived months stay queryable on demand through this module.
+"""
+
+import json
+import os
+import re
+import shutil
+import sqlite3
+import zipfile
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import database
+import summary_store
+
+# Hot tables whose rows move with their session, in copy order
+ARCHIVED_TABLES = ('sessions', 'claim_files', 'claim_bill_items', 'claim_matches', 'claim_item_names')
+COPY_BATCH_SIZE = 500
+
+
+def month_db_path(archive_dir: str, month: str) -> str:
+    return os.path.join(archive_dir, f'{month}.db')
+
+
+def month_zip_path(archive_dir: str, month: str) -> str:
+    return os.path.join(archive_dir, f'{month}.zip')
+
+
+def cutoff_month(older_than_months: int, today: datetime = None) -> str:
+    """First month that stays hot: months before it are archived"""
+    today = today or datetime.now()
+    index = today.year * 12 + (today.month - 1) - older_than_months
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+def _month_bounds(month: str):
+    year, mon = int(month[:4]), int(month[5:7])
+    nxt = f'{year + (mon // 12):04d}-{mon % 12 + 1:02d}'
+    return f'{month}-01', f'{nxt}-01'
+
+
+def _dir_month(session_id: str) -> Optional[str]:
+    """Session directories are named %Y%m%d_%H%M%S"""
+    try:
+        return datetime.strptime(session_id[:15], '%Y%m%d_%H%M%S').strftime('%Y-%m')
+    except ValueError:
+        return None
+
+
+def _session_dirs_by_month(dataset_dir: str) -> Dict[str, List[str]]:
+    months: Dict[str, List[str]] = {}
+    if not os.path.isdir(dataset_dir):
+        return months
+    for emp_entry in os.scandir(dataset_dir):
+        if not emp_entry.is_dir():
+            continue
+        for sess_entry in os.scandir(emp_entry.path):
+            month = _dir_month(sess_entry.name) if sess_entry.is_dir() else None
+            if month:
+                months.setdefault(month, []).append(sess_entry.path)
+    return months
+
+
+def candidate_months(db_path: str, dataset_dir: str, before_month: str) -> List[str]:
+    """Months older than before_month that still have hot rows or directories"""
+    with database.connection(db_path) as conn:
+        months = {row[0] for row in conn.execute('''
+            SELECT DISTINCT strftime('%Y-%m', created_at) FROM sessions WHERE created_at < ?
+        ''', (f'{before_month}-01',)) if row[0]}
+    months.update(m for m in _session_dirs_by_month(dataset_dir) if m < before_month)
+    return sorted(months)
+
+
+def _open_month_db(path: str, hot_conn) -> sqlite3.Connection:
+    """Archive database with the hot tables' definitions (ids are kept)"""
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    for table in ARCHIVED_TABLES:
+        sql = hot_conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()[0]
+        conn.execute(sql.replace('CREATE TABLE', 'CREATE TABLE IF NOT EXISTS', 1))
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_session ON {table}(employee_name, session_id)')
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS claim_item_fts USING fts5(
+            name, normalized_name,
+            content='claim_item_names', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    return conn
+
+
+def _copy_rows(hot_conn, month_conn, keys: list) -> int:
+    copied = 0
+    for table in ARCHIVED_TABLES:
+        for start in range(0, len(keys), COPY_BATCH_SIZE):
+            batch = keys[start:start + COPY_BATCH_SIZE]
+            where = ' OR '.join(['(employee_name = ? AND session_id = ?)'] * len(batch))
+            params = [value for key in batch for value in key]
+            rows = hot_conn.execute(f'SELECT * FROM {table} WHERE {where}', params).fetchall()
+            if not rows:
+                continue
+            placeholders = ', '.join('?' * len(rows[0]))
+            # Same ids as the hot rows, so re-running an interrupted archive is harmless
+            month_conn.executemany(f'INSERT OR REPLACE INTO {table} VALUES ({placeholders})',
+                                   [tuple(row) for row in rows])
+            copied += len(rows)
+    month_conn.execute("INSERT INTO claim_item_fts (claim_item_fts) VALUES ('rebuild')")
+    month_conn.commit()
+    return copied
+
+
+def _zip_session_dirs(zip_path: str, dataset_dir: str, session_dirs: List[str]) -> int:
+    added = 0
+    with zipfile.ZipFile(zip_path, 'a', compression=zipfile.ZIP_DEFLATED) as zf:
+        existing = set(zf.namelist())
+        for session_dir in session_dirs:
+            for root, _, files in os.walk(session_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    arcname = os.path.relpath(path, dataset_dir).replace(os.sep, '/')
+                    if arcname not in existing:
+                        zf.write(path, arcname)
+                        added += 1
+    return added
+
+
+def _write_move_out(conn, keys: list, month: str, db_file: str, zip_file: str):
+    """Writer job: drop archived sessions from the hot tables, keeping their totals"""
+    conn.execute("INSERT OR REPLACE INTO maintenance_flags (name) VALUES ('archiving')")
+    try:
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS archiving_keys (employee_name TEXT, session_id TEXT)')
+        conn.execute('DELETE FROM archiving_keys')
+        conn.executemany('INSERT INTO archiving_keys VALUES (?, ?)', keys)
+        conn.execute('''
+            INSERT INTO archived_daily (employee_name, day, sessions, files, amount, last_activity)
+            SELECT s.employee_name, DATE(s.created_at), COUNT(*), COALESCE(SUM(s.file_count), 0),
+                   COALESCE(SUM(s.total_amount), 0.0), MAX(s.created_at)
+            FROM sessions s
+            JOIN archiving_keys k ON k.employee_name = s.employee_name AND k.session_id = s.session_id
+            GROUP BY s.employee_name, DATE(s.created_at)
+            ON CONFLICT(employee_name, day) DO UPDATE SET
+                sessions = sessions + excluded.sessions,
+                files = files + excluded.files,
+                amount = amount + excluded.amount,
+                last_activity = MAX(last_activity, excluded.last_activity)
+        ''')
+        # Line items and search rows follow through the session delete triggers
+        deleted = conn.execute('''
+            DELETE FROM sessions
+            WHERE (employee_name, session_id) IN (SELECT employee_name, session_id FROM archiving_keys)
+        ''').rowcount
+        conn.execute('DELETE FROM archiving_keys')
+    finally:
+        conn.execute("DELETE FROM maintenance_flags WHERE name = 'archiving'")
+    conn.execute('''
+        INSERT INTO archive_months (month, sessions, db_path, files_path, archived_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(month) DO UPDATE SET
+            sessions = sessions + excluded.sessions,
+            files_path = excluded.files_path,
+            archived_at = excluded.archived_at
+    ''', (month, deleted, db_file, zip_file))
+    return deleted
+
+
+def archive_month(db_path: str, dataset_dir: str, archive_dir: str, month: str) -> Dict:
+    """
+    Move one month to the archive tier. Each step is idempotent: rows are
+    copied before they are deleted and files zipped before they are removed,
+    so an interrupted run can simply be repeated.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    start, end = _month_bounds(month)
+    db_file = month_db_path(archive_dir, month)
+    zip_file = month_zip_path(archive_dir, month)
+
+    with database.connection(db_path) as hot_conn:
+        keys = [tuple(row) for row in hot_conn.execute('''
+            SELECT employee_name, session_id FROM sessions WHERE created_at >= ? AND created_at < ?
+        ''', (start, end))]
+        month_conn = _open_month_db(db_file, hot_conn)
+        try:
+            rows_copied = _copy_rows(hot_conn, month_conn, keys)
+        finally:
+            month_conn.close()
+
+    session_dirs = _session_dirs_by_month(dataset_dir).get(month, [])
+    files_added = _zip_session_dirs(zip_file, dataset_dir, session_dirs) if session_dirs else 0
+
+    sessions_moved = database.get_writer(db_path).submit(
+        _write_move_out, keys, month, db_file, zip_file if os.path.exists(zip_file) else None, wait=True
+    )
+    for session_dir in session_dirs:
+        shutil.rmtree(session_dir, ignore_errors=True)
+        employee_dir = os.path.dirname(session_dir)
+        if os.path.isdir(employee_dir) and not os.listdir(employee_dir):
+            os.rmdir(employee_dir)
+
+    return {
+        "month": month,
+        "sessions": sessions_moved,
+        "rowsCopied": rows_copied,
+        "directories": len(session_dirs),
+        "filesArchived": files_added
+    }
+
+
+def archive_older_than(db_path: str, dataset_dir: str, archive_dir: str, older_than_months: int,
+                       dry_run: bool = False) -> Dict:
+    """Archive every month older than the given age"""
+    before = cutoff_month(older_than_months)
+    months = candidate_months(db_path, dataset_dir, before)
+    result = {"cutoff": before, "months": months, "archived": []}
+    if dry_run:
+        return result
+    for month in months:
+        moved = archive_month(db_path, dataset_dir, archive_dir, month)
+        print(f"🧊 Archived {month}: {moved['sessions']} sessions, {moved['directories']} directories")
+        result["archived"].append(moved)
+    return result
+
+
+# On-demand access to archived months
+def month_connection(archive_dir: str, month: str) -> Optional[sqlite3.Connection]:
+    """Read-only connection to one archived month, or None if it was never archived"""
+    path = month_db_path(archive_dir, month)
+    if not os.path.isfile(path):
+        return None
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def archived_months(archive_dir: str, start: str = None, end: str = None) -> List[str]:
+    """Archived months, oldest first, that overlap created_at bounds [start, end)"""
+    months = []
+    for name in os.listdir(archive_dir) if os.path.isdir(archive_dir) else []:
+        if not re.fullmatch(r'\d{4}-\d{2}\.db', name):
+            continue
+        first, following = _month_bounds(name[:7])
+        if (end is None or first < end) and (start is None or following > start):
+            months.append(name[:7])
+    return sorted(months)
+
+
+def list_sessions(archive_dir: str, month: str, employee: str = None) -> Optional[List[Dict]]:
+    conn = month_connection(archive_dir, month)
+    if conn is None:
+        return None
+    try:
+        sql = '''
+            SELECT employee_name, session_id, created_at, file_count, prescription_count,
+                   bill_count, total_amount
+            FROM sessions
+        '''
+        params = ()
+        if employee:
+            sql += ' WHERE employee_name = ?'
+            params = (employee,)
+        return [dict(row) for row in conn.execute(sql + ' ORDER BY created_at DESC', params)]
+    finally:
+        conn.close()
+
+
+def read_summary(archive_dir: str, month: str, employee_dir: str, session_id: str) -> Optional[Dict]:
+    """Summary of an archived session, straight from the month's zip"""
+    zip_file = month_zip_path(archive_dir, month)
+    if not os.path.isfile(zip_file):
+        return None
+    with zipfile.ZipFile(zip_file) as zf:
+        for name in summary_store.SUMMARY_FILES:
+            try:
+                data = zf.read(f'{employee_dir}/{session_id}/{name}')
+            except KeyError:
+                continue
+            if name == summary_store.SUMMARY_FILE:
+                return summary_store.decode(data)
+            return json.loads(data)
+    return None
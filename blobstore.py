@@ -0,0 +1,190 @@
+"""
+Content-addressed blob store for page images and uploads
+Every distinct file content is stored once, named by its SHA-256 and sharded
+by hash prefix:
+
+- blobs/<aa>/<bb>/<sha256>
+
+A session directory holds a hard link to the blob instead of its own copy
+(a plain copy where the filesystem cannot link), so existing readers of
+dataset/ keep working. The database counts references: blob_refs has one row
+per (session, file name) and triggers keep blobs.refs in step. Deleting a
+session drops its references, and gc() removes blobs nobody references.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Tuple
+
+import database
+import summary_store
+
+GC_BATCH_SIZE = 500
+# Files that belong to the session itself and are never shared
+SESSION_OWN_FILES = summary_store.SUMMARY_FILES
+
+
+def digest_of(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def blob_path(store_dir: str, digest: str) -> str:
+    return os.path.join(store_dir, digest[:2], digest[2:4], digest)
+
+
+def put(store_dir: str, data: bytes, digest: str = None) -> str:
+    """Store data once under its hash; returns the digest"""
+    digest = digest or digest_of(data)
+    path = blob_path(store_dir, digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    return digest
+
+
+def _link(source: str, dest: str) -> bool:
+    """Hard-link source to dest (replacing dest); falls back to a copy. True if linked."""
+    tmp = f'{dest}.tmp-link'
+    try:
+        os.link(source, tmp)
+        linked = True
+    except OSError:
+        shutil.copyfile(source, tmp)
+        linked = False
+    os.replace(tmp, dest)
+    return linked
+
+
+def _write_refs(conn, rows: List[Tuple]):
+    """Writer job: rows are (digest, size, employee_name, session_id, name)"""
+    conn.executemany('''
+        INSERT INTO blobs (digest, size) VALUES (?, ?)
+        ON CONFLICT(digest) DO NOTHING
+    ''', [(row[0], row[1]) for row in rows])
+    conn.executemany('''
+        INSERT INTO blob_refs (employee_name, session_id, name, digest) VALUES (?, ?, ?, ?)
+        ON CONFLICT(employee_name, session_id, name) DO UPDATE SET digest = excluded.digest
+    ''', [(row[2], row[3], row[4], row[0]) for row in rows])
+
+
+def store_files(db_path: str, store_dir: str, session_dir: str, employee: str, session_id: str,
+                files: List[Tuple[str, bytes]]) -> int:
+    """Write (name, bytes) files into a session directory as references to blobs"""
+    rows = []
+    for name, data in files:
+        digest = put(store_dir, data)
+        _link(blob_path(store_dir, digest), os.path.join(session_dir, name))
+        rows.append((digest, len(data), employee, session_id, name))
+    if rows:
+        database.get_writer(db_path).submit(_write_refs, rows)
+    return len(rows)
+
+
+def link_session_files(db_path: str, store_dir: str, source: Tuple[str, str], session_dir: str,
+                       employee: str, session_id: str) -> int:
+    """Give a new session references to every blob another session holds"""
+    with database.connection(db_path) as conn:
+        refs = conn.execute('''
+            SELECT r.name, r.digest, b.size FROM blob_refs r JOIN blobs b ON b.digest = r.digest
+            WHERE r.employee_name = ? AND r.session_id = ?
+        ''', source).fetchall()
+    rows = []
+    for name, digest, size in refs:
+        path = blob_path(store_dir, digest)
+        if os.path.exists(path):
+            _link(path, os.path.join(session_dir, name))
+            rows.append((digest, size, employee, session_id, name))
+    if rows:
+        database.get_writer(db_path).submit(_write_refs, rows)
+    return len(rows)
+
+
+def ingest_session_dir(db_path: str, store_dir: str, session_dir: str, employee: str,
+                       session_id: str) -> Dict:
+    """Move a session directory's files into the store, leaving links behind"""
+    result = {"files": 0, "bytes": 0, "alreadyLinked": 0}
+    rows = []
+    for entry in os.scandir(session_dir):
+        if not entry.is_file() or entry.name in SESSION_OWN_FILES or '.tmp-' in entry.name:
+            continue
+        with open(entry.path, 'rb') as f:
+            data = f.read()
+        digest = digest_of(data)
+        path = blob_path(store_dir, digest)
+        if os.path.exists(path) and os.path.samefile(path, entry.path):
+            result["alreadyLinked"] += 1
+        else:
+            put(store_dir, data, digest)
+            _link(path, entry.path)
+        rows.append((digest, len(data), employee, session_id, entry.name))
+        result["files"] += 1
+        result["bytes"] += len(data)
+    if rows:
+        database.get_writer(db_path).submit(_write_refs, rows)
+    return result
+
+
+def _write_drop_unreferenced(conn, digests: List[str]) -> List[str]:
+    """Writer job: forget blobs still unreferenced at commit time; returns the ones dropped"""
+    dropped = []
+    for digest in digests:
+        if conn.execute('DELETE FROM blobs WHERE digest = ? AND refs <= 0', (digest,)).rowcount:
+            dropped.append(digest)
+    return dropped
+
+
+def gc(db_path: str, store_dir: str, batch_size: int = GC_BATCH_SIZE, on_drop=None) -> Dict:
+    """Delete blobs whose last reference is gone; on_drop(digest) runs for each one removed"""
+    result = {"blobs": 0, "bytes": 0}
+    writer = database.get_writer(db_path)
+    while True:
+        with database.connection(db_path) as conn:
+            candidates = conn.execute(
+                'SELECT digest, size FROM blobs WHERE refs <= 0 LIMIT ?', (batch_size,)
+            ).fetchall()
+        if not candidates:
+            break
+        sizes = {row[0]: row[1] for row in candidates}
+        dropped = writer.submit(_write_drop_unreferenced, list(sizes), wait=True)
+        for digest in dropped:
+            try:
+                os.remove(blob_path(store_dir, digest))
+            except FileNotFoundError:
+                pass
+            if on_drop:
+                on_drop(digest)
+            result["blobs"] += 1
+            result["bytes"] += sizes[digest]
+        if len(candidates) < batch_size or not dropped:
+            break
+    return result
+
+
+def stats(db_path: str) -> Dict:
+    """Stored vs referenced bytes: the dedup ratio and the disk it saves"""
+    with database.connection(db_path) as conn:
+        row = conn.execute('''
+            SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(size * refs), 0), COALESCE(SUM(refs), 0)
+            FROM blobs WHERE refs > 0
+        ''').fetchone()
+        unreferenced = conn.execute('SELECT COUNT(*) FROM blobs WHERE refs <= 0').fetchone()[0]
+    blobs, stored, logical, refs = row
+    return {
+        "blobs": blobs,
+        "references": refs,
+        "storedBytes": stored,
+        "referencedBytes": logical,
+        "savedBytes": logical - stored,
+        "dedupRatio": round(logical / stored, 2) if stored else 1.0,
+        "unreferencedBlobs": unreferenced
+    }
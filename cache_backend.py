@@ -0,0 +1,416 @@
+"""
+Document cache backends
+Extraction results are cached by document content hash. The backend is chosen
+with the CACHE_BACKEND setting:
+
+- 'sqlite'     : document_cache table in the main database
+- 'sqlite-wal' : dedicated WAL-mode cache database, safe across processes
+- 'redis'      : shared network key-value store for multi-node deployments
+
+Every backend also keeps a short-lived negative cache of documents whose
+extraction failed, so repeat uploads can fail fast instead of retrying.
+"""
+
+import json
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import database
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    redis = None
+    REDIS_AVAILABLE = False
+
+# (file_hash, filename, file_type, extraction_json, created_at, last_accessed)
+CacheRow = Tuple[str, str, str, str, str, str]
+
+CACHE_TABLE_DDL = '''
+    CREATE TABLE IF NOT EXISTS document_cache (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_hash TEXT UNIQUE NOT NULL,
+        filename TEXT NOT NULL,
+        file_type TEXT NOT NULL,
+        extraction_data TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        access_count INTEGER DEFAULT 1
+    )
+'''
+
+FAILURE_TABLE_DDL = '''
+    CREATE TABLE IF NOT EXISTS extraction_failures (
+        file_hash TEXT PRIMARY KEY,
+        failure_class TEXT NOT NULL,
+        attempts INTEGER DEFAULT 1,
+        last_error TEXT,
+        first_failed_at TIMESTAMP,
+        last_failed_at TIMESTAMP,
+        expires_at TIMESTAMP NOT NULL
+    )
+'''
+
+
+class CacheBackend:
+    """Interface every document cache backend implements"""
+
+    name = 'base'
+
+    def get(self, file_hash: str) -> Optional[Dict]:
+        """Return the cached extraction for a hash, or None. Must not write."""
+        raise NotImplementedError
+
+    def set(self, file_hash: str, filename: str, file_type: str, extraction_data: Dict):
+        """Store (or replace) the extraction for a hash"""
+        raise NotImplementedError
+
+    def add_many(self, rows: List[CacheRow]) -> int:
+        """Insert rows that are not cached yet; returns how many were added"""
+        raise NotImplementedError
+
+    def record_hits(self, hits: Dict[str, Tuple[int, str]]):
+        """Apply batched access statistics: {file_hash: (hit_count, last_accessed)}"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        """Return {'totalCached': int, 'totalAccesses': int, 'negativeEntries': int}"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def prune(self, accessed_before: str, limit: int) -> int:
+        """Delete up to limit entries not accessed since accessed_before (ISO date); returns how many"""
+        raise NotImplementedError
+
+    def get_failure(self, file_hash: str) -> Optional[Dict]:
+        """Return the unexpired failure record for a hash, or None. Must not write."""
+        raise NotImplementedError
+
+    def record_failure(self, file_hash: str, failure_class: str, error: str, ttl_seconds: int) -> Dict:
+        """Record a failed extraction; attempts keep counting until the entry expires"""
+        raise NotImplementedError
+
+    def clear_failure(self, file_hash: str = None):
+        """Forget one failure record, or all of them when no hash is given"""
+        raise NotImplementedError
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """document_cache table in the main database; writes go through its writer thread"""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._write(_create_cache_tables, wait=True)
+
+    def _connect(self):
+        return database.connection(self.db_path)
+
+    def _write(self, fn, *args, wait: bool = False):
+        return database.get_writer(self.db_path).submit(fn, *args, wait=wait)
+
+    def get(self, file_hash: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT extraction_data FROM document_cache WHERE file_hash = ?',
+                (file_hash,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, file_hash: str, filename: str, file_type: str, extraction_data: Dict):
+        now = datetime.now().isoformat()
+        self._write(_store_cache_row, (file_hash, filename, file_type, json.dumps(extraction_data), now, now))
+
+    def add_many(self, rows: List[CacheRow]) -> int:
+        return self._write(_add_cache_rows, rows, wait=True)
+
+    def record_hits(self, hits: Dict[str, Tuple[int, str]]):
+        self._write(_apply_cache_hits, [(last, count, file_hash) for file_hash, (count, last) in hits.items()])
+
+    def stats(self) -> Dict:
+        with self._connect() as conn:
+            total_cached, total_accesses = conn.execute(
+                'SELECT COUNT(*), SUM(access_count) FROM document_cache'
+            ).fetchone()
+            failures = conn.execute(
+                'SELECT COUNT(*) FROM extraction_failures WHERE expires_at > ?',
+                (datetime.now().isoformat(),)
+            ).fetchone()[0]
+        return {
+            "totalCached": total_cached or 0,
+            "totalAccesses": total_accesses or 0,
+            "negativeEntries": failures
+        }
+
+    def clear(self):
+        self._write(_clear_cache_rows, wait=True)
+
+    def prune(self, accessed_before: str, limit: int) -> int:
+        return self._write(_prune_cache_rows, accessed_before, limit, wait=True)
+
+    def get_failure(self, file_hash: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute('''
+                SELECT failure_class, attempts, last_error, last_failed_at, expires_at
+                FROM extraction_failures
+                WHERE file_hash = ? AND expires_at > ?
+            ''', (file_hash, datetime.now().isoformat())).fetchone()
+        return _failure_dict(dict(row)) if row else None
+
+    def record_failure(self, file_hash: str, failure_class: str, error: str, ttl_seconds: int) -> Dict:
+        return self._write(_store_failure, file_hash, failure_class, error, ttl_seconds, wait=True)
+
+    def clear_failure(self, file_hash: str = None):
+        self._write(_clear_failures, file_hash, wait=True)
+
+
+class WALSQLiteCacheBackend(SQLiteCacheBackend):
+    """
+    Dedicated cache database for several processes on one host.
+    The pooled connections run in WAL mode, so readers never wait for the
+    writer, and SQLite's own file locking (with a busy timeout) arbitrates
+    between the writer threads of different processes. Keeping the cache in
+    its own file also keeps its write traffic off the main database.
+    """
+
+    name = 'sqlite-wal'
+
+
+# Write jobs, run on the database writer thread inside its transaction
+def _create_cache_tables(conn):
+    conn.execute(CACHE_TABLE_DDL)
+    conn.execute(FAILURE_TABLE_DDL)
+
+
+def _store_cache_row(conn, row: CacheRow):
+    conn.execute('''
+        INSERT OR REPLACE INTO document_cache
+        (file_hash, filename, file_type, extraction_data, created_at, last_accessed)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', row)
+
+
+def _add_cache_rows(conn, rows: List[CacheRow]) -> int:
+    before = conn.total_changes
+    conn.executemany('''
+        INSERT OR IGNORE INTO document_cache
+        (file_hash, filename, file_type, extraction_data, created_at, last_accessed)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return conn.total_changes - before
+
+
+def _apply_cache_hits(conn, updates: list):
+    conn.executemany('''
+        UPDATE document_cache
+        SET last_accessed = ?, access_count = access_count + ?
+        WHERE file_hash = ?
+    ''', updates)
+
+
+def _clear_cache_rows(conn):
+    conn.execute('DELETE FROM document_cache')
+
+
+def _prune_cache_rows(conn, accessed_before: str, limit: int) -> int:
+    return conn.execute('''
+        DELETE FROM document_cache WHERE id IN (
+            SELECT id FROM document_cache WHERE last_accessed < ? LIMIT ?
+        )
+    ''', (accessed_before, limit)).rowcount
+
+
+def _store_failure(conn, file_hash: str, failure_class: str, error: str, ttl_seconds: int) -> Dict:
+    now = datetime.now()
+    expires_at = (now + timedelta(seconds=ttl_seconds)).isoformat()
+    # An expired record starts counting again from one
+    conn.execute('''
+        INSERT INTO extraction_failures
+        (file_hash, failure_class, attempts, last_error, first_failed_at, last_failed_at, expires_at)
+        VALUES (?, ?, 1, ?, ?, ?, ?)
+        ON CONFLICT(file_hash) DO UPDATE SET
+            attempts = CASE WHEN expires_at > excluded.last_failed_at
+                            THEN attempts + 1 ELSE 1 END,
+            first_failed_at = CASE WHEN expires_at > excluded.last_failed_at
+                                   THEN first_failed_at ELSE excluded.first_failed_at END,
+            failure_class = excluded.failure_class,
+            last_error = excluded.last_error,
+            last_failed_at = excluded.last_failed_at,
+            expires_at = excluded.expires_at
+    ''', (file_hash, failure_class, error[:500], now.isoformat(), now.isoformat(), expires_at))
+    # Expired records are only garbage, drop them while we hold the write lock
+    conn.execute('DELETE FROM extraction_failures WHERE expires_at <= ?', (now.isoformat(),))
+    row = conn.execute('''
+        SELECT failure_class, attempts, last_error, last_failed_at, expires_at
+        FROM extraction_failures WHERE file_hash = ?
+    ''', (file_hash,)).fetchone()
+    return _failure_dict(dict(row))
+
+
+def _clear_failures(conn, file_hash: str = None):
+    if file_hash:
+        conn.execute('DELETE FROM extraction_failures WHERE file_hash = ?', (file_hash,))
+    else:
+        conn.execute('DELETE FROM extraction_failures')
+
+
+def _failure_dict(row: Dict) -> Dict:
+    return {
+        "failureClass": row['failure_class'],
+        "attempts": row['attempts'],
+        "lastError": row['last_error'],
+        "lastFailedAt": row['last_failed_at'],
+        "expiresAt": row['expires_at']
+    }
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Cache shared by every worker and host through Redis.
+    Any client with the redis-py API can be passed in, e.g. fakeredis for a
+    local stand-in.
+    """
+
+    name = 'redis'
+    STATS_BATCH = 1000
+
+    def __init__(self, url: str = 'redis://localhost:6379/0', prefix: str = 'medclaim',
+                 ttl_seconds: int = 0, client=None):
+        if client is None:
+            if not REDIS_AVAILABLE:
+                raise RuntimeError("redis package not installed. Install with: pip install redis")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds or None
+
+    def _doc_key(self, file_hash: str) -> str:
+        return f"{self.prefix}:doc:{file_hash}"
+
+    def _hits_key(self, file_hash: str) -> str:
+        return f"{self.prefix}:hits:{file_hash}"
+
+    def _fail_key(self, file_hash: str) -> str:
+        return f"{self.prefix}:fail:{file_hash}"
+
+    def _entry(self, filename: str, file_type: str, extraction_data, created_at: str) -> str:
+        if not isinstance(extraction_data, str):
+            extraction_data = json.dumps(extraction_data)
+        return json.dumps({
+            "filename": filename,
+            "fileType": file_type,
+            "extractionData": extraction_data,
+            "createdAt": created_at
+        })
+
+    def get(self, file_hash: str) -> Optional[Dict]:
+        raw = self.client.get(self._doc_key(file_hash))
+        if raw is None:
+            return None
+        return json.loads(json.loads(raw)["extractionData"])
+
+    def set(self, file_hash: str, filename: str, file_type: str, extraction_data: Dict):
+        now = datetime.now().isoformat()
+        self.client.set(self._doc_key(file_hash),
+                        self._entry(filename, file_type, extraction_data, now),
+                        ex=self.ttl_seconds)
+
+    def add_many(self, rows: List[CacheRow]) -> int:
+        pipe = self.client.pipeline(transaction=False)
+        for file_hash, filename, file_type, extraction_json, created_at, _ in rows:
+            pipe.set(self._doc_key(file_hash),
+                     self._entry(filename, file_type, extraction_json, created_at),
+                     nx=True, ex=self.ttl_seconds)
+        return sum(1 for added in pipe.execute() if added)
+
+    def record_hits(self, hits: Dict[str, Tuple[int, str]]):
+        pipe = self.client.pipeline(transaction=False)
+        for file_hash, (count, last) in hits.items():
+            key = self._hits_key(file_hash)
+            pipe.hincrby(key, 'count', count)
+            pipe.hset(key, 'last_accessed', last)
+            if self.ttl_seconds:
+                pipe.expire(key, self.ttl_seconds)
+        pipe.execute()
+
+    def _sum_hits(self, keys: list) -> int:
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hget(key, 'count')
+        return sum(int(count or 0) for count in pipe.execute())
+
+    def stats(self) -> Dict:
+        # One SCAN over the prefix, hit counters fetched a pipeline per STATS_BATCH
+        # keys; counting keys rather than keeping counters stays right as keys expire
+        counts = {"doc": 0, "fail": 0}
+        total_accesses, hit_keys = 0, []
+        for key in self.client.scan_iter(match=f"{self.prefix}:*", count=1000):
+            kind = key.decode() if isinstance(key, bytes) else key
+            kind = kind[len(self.prefix) + 1:].split(':', 1)[0]
+            if kind == 'hits':
+                hit_keys.append(key)
+                if len(hit_keys) >= self.STATS_BATCH:
+                    total_accesses += self._sum_hits(hit_keys)
+                    hit_keys = []
+            elif kind in counts:
+                counts[kind] += 1
+        if hit_keys:
+            total_accesses += self._sum_hits(hit_keys)
+        # Every entry starts with one access, as in SQLite
+        return {"totalCached": counts["doc"], "totalAccesses": counts["doc"] + total_accesses,
+                "negativeEntries": counts["fail"]}
+
+    def _delete_matching(self, pattern: str):
+        keys = list(self.client.scan_iter(match=pattern, count=1000))
+        for i in range(0, len(keys), 500):
+            self.client.delete(*keys[i:i + 500])
+
+    def clear(self):
+        for pattern in (f"{self.prefix}:doc:*", f"{self.prefix}:hits:*"):
+            self._delete_matching(pattern)
+
+    def prune(self, accessed_before: str, limit: int) -> int:
+        # Entries expire on their own with ttl_seconds (CACHE_REDIS_TTL); Redis
+        # evicts the rest under its maxmemory policy
+        return 0
+
+    def get_failure(self, file_hash: str) -> Optional[Dict]:
+        raw = self.client.get(self._fail_key(file_hash))
+        return json.loads(raw) if raw is not None else None
+
+    def record_failure(self, file_hash: str, failure_class: str, error: str, ttl_seconds: int) -> Dict:
+        # Redis expires the key itself, so a missing key means the TTL has passed
+        previous = self.get_failure(file_hash)
+        now = datetime.now()
+        failure = {
+            "failureClass": failure_class,
+            "attempts": (previous["attempts"] + 1) if previous else 1,
+            "lastError": error[:500],
+            "lastFailedAt": now.isoformat(),
+            "expiresAt": (now + timedelta(seconds=ttl_seconds)).isoformat()
+        }
+        self.client.set(self._fail_key(file_hash), json.dumps(failure), ex=max(1, ttl_seconds))
+        return failure
+
+    def clear_failure(self, file_hash: str = None):
+        if file_hash:
+            self.client.delete(self._fail_key(file_hash))
+        else:
+            self._delete_matching(f"{self.prefix}:fail:*")
+
+
+def create_cache_backend(name: str, db_path: str, wal_db_path: str = None,
+                         redis_url: str = None, redis_ttl: int = 0) -> CacheBackend:
+    """Build the cache backend selected by the CACHE_BACKEND setting"""
+    name = (name or 'sqlite').lower()
+    if name == 'sqlite':
+        return SQLiteCacheBackend(db_path)
+    if name == 'sqlite-wal':
+        return WALSQLiteCacheBackend(wal_db_path or db_path)
+    if name == 'redis':
+        return RedisCacheBackend(redis_url or 'redis://localhost:6379/0', ttl_seconds=redis_ttl)
+    raise ValueError(f"Unknown cache backend: {name}")
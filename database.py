@@ -0,0 +1,459 @@
+"""
+SQLite connection layer
+Connections are pooled per database file and reused across requests instead
+of being opened on every call. Each connection is tuned once when it is opened
+(WAL journaling, relaxed fsync, larger page cache, memory-mapped reads, busy
+timeout) and keeps sqlite3's compiled-statement cache warm, so repeated
+queries skip re-preparing their SQL.
+
+All writes to a database go through a single writer thread fed by a bounded
+queue, which group-commits whatever is waiting in one transaction.
+"""
+
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+BUSY_TIMEOUT_MS = 10000
+STATEMENT_CACHE_SIZE = 256
+MAX_IDLE_CONNECTIONS = 16
+
+# Applied to every new connection, in this order
+PRAGMAS = (
+    ('journal_mode', 'WAL'),       # readers never block the writer
+    ('synchronous', 'NORMAL'),     # fsync on checkpoint only; safe with WAL
+    ('cache_size', -32000),        # 32 MB page cache per connection
+    ('mmap_size', 268435456),      # memory-map up to 256 MB of the file
+    ('busy_timeout', BUSY_TIMEOUT_MS),
+    ('temp_store', 'MEMORY'),
+)
+
+
+def open_connection(db_path: str) -> sqlite3.Connection:
+    """Open and tune a new connection; rows come back as sqlite3.Row"""
+    conn = sqlite3.connect(
+        db_path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,
+    )
+    conn.row_factory = sqlite3.Row
+    for name, value in PRAGMAS:
+        conn.execute(f'PRAGMA {name}={value}')
+    return conn
+
+
+class ConnectionPool:
+    """
+    Pool of tuned connections to one database file.
+    A connection belongs to exactly one thread while it is checked out; nested
+    use on the same thread shares it, so a helper called inside another
+    helper's transaction does not need a second connection.
+    """
+
+    def __init__(self, db_path: str, max_idle: int = MAX_IDLE_CONNECTIONS):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.opened = 0
+
+    def _checkout(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.opened += 1
+        return open_connection(self.db_path)
+
+    def _checkin(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commits on success and rolls back on error"""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self._checkout()
+        self._local.conn = conn
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._local.conn = None
+            self._checkin(conn)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"opened": self.opened, "idle": len(self._idle)}
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    db_path = os.path.abspath(db_path)
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(db_path, ConnectionPool(db_path))
+    return pool
+
+
+def connection(db_path: str):
+    """Context manager yielding a pooled connection to db_path"""
+    return get_pool(db_path).connection()
+
+
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
+
+
+# Single-writer queue
+WRITE_QUEUE_SIZE = 2000
+WRITE_BATCH_SIZE = 200
+WRITE_QUEUE_TIMEOUT = 30  # seconds a producer may block on a full queue
+WRITE_WAIT_TIMEOUT = 120  # seconds submit(wait=True) waits for the commit
+
+
+class WriterStopped(RuntimeError):
+    """The writer thread died; queued and later writes fail with this"""
+
+
+class _WriteJob:
+    __slots__ = ('fn', 'args', 'done', 'result', 'error')
+
+    def __init__(self, fn: Callable, args: tuple, wait: bool):
+        self.fn = fn
+        self.args = args
+        self.done = threading.Event() if wait else None
+        self.result = None
+        self.error = None
+
+
+class DatabaseWriter:
+    """
+    The only thread that writes to a database file.
+    Jobs are functions called as fn(conn, *args) inside the writer's
+    transaction; they must not commit. Everything queued when the writer wakes
+    up is committed together, each job behind its own savepoint so one failing
+    job does not undo the others. A job that submits another write runs it
+    inline, in the same transaction.
+    """
+
+    def __init__(self, db_path: str, max_queue: int = WRITE_QUEUE_SIZE,
+                 batch_size: int = WRITE_BATCH_SIZE):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._conn = None
+        self._batch = []  # the batch being written, failed if the thread dies
+        self._failure = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "jobs": 0,
+            "batches": 0,
+            "errors": 0,
+            "maxQueueDepth": 0,
+            "lastCommitMs": 0.0,
+            "maxCommitMs": 0.0,
+            "totalCommitMs": 0.0
+        }
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f'db-writer:{os.path.basename(self.db_path)}', daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, fn: Callable, *args, wait: bool = False):
+        """
+        Queue a write. With wait=True the call blocks until the write is
+        committed and returns fn's result (or raises its exception); it raises
+        TimeoutError after WRITE_WAIT_TIMEOUT seconds, and WriterStopped once
+        the writer thread has died.
+        """
+        if threading.current_thread() is self._thread:
+            # Queuing from the writer itself would wait on its own commit
+            return self._run_inline(fn, args, wait)
+        if self._failure is not None:
+            raise WriterStopped(f"Database writer for {self.db_path} stopped: {self._failure}")
+        self.start()
+        job = _WriteJob(fn, args, wait)
+        self.queue.put(job, timeout=WRITE_QUEUE_TIMEOUT)
+        depth = self.queue.qsize()
+        if depth > self._stats["maxQueueDepth"]:
+            with self._stats_lock:
+                self._stats["maxQueueDepth"] = max(self._stats["maxQueueDepth"], depth)
+        if not wait:
+            return None
+        deadline = time.monotonic() + WRITE_WAIT_TIMEOUT
+        while not job.done.wait(0.5):
+            if self._failure is not None:
+                # Queued after the dying writer drained its queue
+                raise WriterStopped(f"Database writer for {self.db_path} stopped: {self._failure}")
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Database write ({getattr(fn, '__name__', 'job')}) "
+                                   f"not committed within {WRITE_WAIT_TIMEOUT}s")
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _run_inline(self, fn: Callable, args: tuple, wait: bool):
+        self._conn.execute('SAVEPOINT inline_job')
+        try:
+            result = fn(self._conn, *args)
+            self._conn.execute('RELEASE inline_job')
+            return result
+        except Exception as e:
+            self._conn.execute('ROLLBACK TO inline_job')
+            self._conn.execute('RELEASE inline_job')
+            if wait:
+                raise
+            print(f"Database write error ({getattr(fn, '__name__', 'job')}): {e}")
+            return None
+
+    def flush(self):
+        """Block until everything queued so far is committed"""
+        self.submit(lambda conn: None, wait=True)
+
+    def stop(self):
+        """Flush pending writes and stop the writer thread"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self.flush()
+        finally:
+            self.queue.put(None)
+            self._thread.join(timeout=WRITE_QUEUE_TIMEOUT)
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        total_ms = stats.pop("totalCommitMs")
+        stats["avgCommitMs"] = round(total_ms / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["queueDepth"] = self.queue.qsize()
+        stats["queueCapacity"] = self.queue.maxsize
+        return stats
+
+    def _next_batch(self):
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                # Finish this batch, then stop
+                self.queue.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def _fail(self, error: Exception, batch: list = ()):
+        """Writer thread is dying: fail what it holds and everything still queued"""
+        self._failure = error
+        print(f"❌ Database writer for {self.db_path} stopped: {error}")
+        pending = list(batch)
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                pending.append(job)
+        stopped = WriterStopped(f"Database writer for {self.db_path} stopped: {error}")
+        for job in pending:
+            if job.done is not None and not job.done.is_set():
+                job.error = job.error or stopped
+                job.done.set()
+
+    def _run(self):
+        try:
+            conn = open_connection(self.db_path)
+            conn.isolation_level = None  # transactions are managed explicitly below
+        except Exception as e:
+            self._fail(e)
+            return
+        self._conn = conn
+        try:
+            self._write_batches(conn)
+        except Exception as e:
+            self._fail(e, self._batch)
+        finally:
+            self._conn = None
+            conn.close()
+
+    def _write_batches(self, conn):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            self._batch = batch
+
+            started = time.perf_counter()
+            errors = 0
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                for job in batch:
+                    conn.execute('SAVEPOINT write_job')
+                    try:
+                        job.result = job.fn(conn, *job.args)
+                        conn.execute('RELEASE write_job')
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO write_job')
+                        conn.execute('RELEASE write_job')
+                        job.error = e
+                        errors += 1
+                conn.execute('COMMIT')
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                for job in batch:
+                    job.error = job.error or e
+                errors = len(batch)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            with self._stats_lock:
+                self._stats["jobs"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats["errors"] += errors
+                self._stats["lastCommitMs"] = round(elapsed_ms, 2)
+                self._stats["maxCommitMs"] = round(max(self._stats["maxCommitMs"], elapsed_ms), 2)
+                self._stats["totalCommitMs"] += elapsed_ms
+
+            for job in batch:
+                if job.done is not None:
+                    job.done.set()
+                elif job.error is not None:
+                    print(f"Database write error ({getattr(job.fn, '__name__', 'job')}): {job.error}")
+            self._batch = []
+
+
+_writers: Dict[str, DatabaseWriter] = {}
+
+
+def get_writer(db_path: str) -> DatabaseWriter:
+    db_path = os.path.abspath(db_path)
+    writer = _writers.get(db_path)
+    if writer is None:
+        with _pools_lock:
+            writer = _writers.setdefault(db_path, DatabaseWriter(db_path))
+    return writer
+
+
+def stop_all_writers():
+    """Flush and stop every writer; registered to run at interpreter exit"""
+    with _pools_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        try:
+            writer.stop()
+        except Exception as e:
+            print(f"Database writer shutdown error: {e}")
+
+
+# Micro-benchmark: fresh default connections vs the pooled, tuned layer
+_BENCH_DDL = '''
+    CREATE TABLE IF NOT EXISTS document_cache (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_hash TEXT UNIQUE NOT NULL,
+        filename TEXT NOT NULL,
+        file_type TEXT NOT NULL,
+        extraction_data TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        access_count INTEGER DEFAULT 1
+    )
+'''
+_BENCH_INSERT = '''
+    INSERT OR REPLACE INTO document_cache (file_hash, filename, file_type, extraction_data)
+    VALUES (?, ?, ?, ?)
+'''
+_BENCH_SELECT = 'SELECT extraction_data FROM document_cache WHERE file_hash = ?'
+
+
+def _bench_workload(get_conn, rows: int, reads: int) -> Dict:
+    payload = '{"type": "bill", "billItems": [{"name": "AUGMENTIN 625", "amount": 120.0}]}'
+
+    started = time.perf_counter()
+    for i in range(rows):
+        with get_conn() as conn:
+            conn.execute(_BENCH_INSERT, (f'hash{i}', f'page_{i}.png', 'bill', payload))
+    write_secs = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(reads):
+        with get_conn() as conn:
+            conn.execute(_BENCH_SELECT, (f'hash{i % rows}',)).fetchone()
+    read_secs = time.perf_counter() - started
+
+    return {
+        "writesPerSec": round(rows / write_secs, 1),
+        "readsPerSec": round(reads / read_secs, 1),
+    }
+
+
+def benchmark(rows: int = 2000, reads: int = 20000) -> Dict:
+    """Compare per-call sqlite3.connect() with default settings against the pool"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline_path = os.path.join(tmp, 'baseline.db')
+        pooled_path = os.path.join(tmp, 'pooled.db')
+
+        with sqlite3.connect(baseline_path) as conn:
+            conn.execute(_BENCH_DDL)
+
+        @contextmanager
+        def fresh_connection():
+            conn = sqlite3.connect(baseline_path)
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+        results["before"] = _bench_workload(fresh_connection, rows, reads)
+
+        pool = ConnectionPool(pooled_path)
+        with pool.connection() as conn:
+            conn.execute(_BENCH_DDL)
+        results["after"] = _bench_workload(pool.connection, rows, reads)
+        pool.close_all()
+
+    results["speedup"] = {
+        "writes": round(results["after"]["writesPerSec"] / results["before"]["writesPerSec"], 1),
+        "reads": round(results["after"]["readsPerSec"] / results["before"]["readsPerSec"], 1),
+    }
+    return results
@@ -0,0 +1,266 @@
+"""
+Bulk export of claims and line items
+Rows are produced by generators and encoded as they arrive, so an export of
+any size runs in constant memory:
+
+- items  : one row per billed line item with its admissible/inadmissible status
+- claims : one row per session with its admissible and inadmissible totals
+
+Formats are CSV, JSON lines and (with pyarrow installed) Parquet, written one
+row group at a time. Database exports page through sessions by
+(created_at, id) so no read transaction is held for the whole export;
+archived months are read from their archive/<YYYY-MM>.db files the same way.
+"""
+
+import csv
+import io
+import json
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import archive
+import database
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Where rows come from: the database (plus archived months) or the stored summaries
+SOURCES = ('db', 'dataset')
+SESSION_PAGE_SIZE = 200
+CSV_FLUSH_ROWS = 500
+PARQUET_ROW_GROUP = 10000
+
+# (column, type) in output order; types drive the Parquet schema
+ITEM_COLUMNS = (
+    ('employee', 'str'), ('session_id', 'str'), ('created_at', 'str'), ('kind', 'str'),
+    ('prescription_name', 'str'), ('bill_item_name', 'str'), ('amount', 'float'),
+    ('admissible_amount', 'float'), ('excess_amount', 'float'), ('match_score', 'float'),
+    ('status', 'str'), ('reason', 'str'),
+)
+CLAIM_COLUMNS = (
+    ('employee', 'str'), ('session_id', 'str'), ('created_at', 'str'), ('file_count', 'int'),
+    ('prescription_count', 'int'), ('bill_count', 'int'), ('total_amount', 'float'),
+    ('line_items', 'int'), ('admissible_items', 'int'), ('admissible_amount', 'float'),
+    ('inadmissible_items', 'int'), ('inadmissible_amount', 'float'),
+)
+COLUMNS = {'items': ITEM_COLUMNS, 'claims': CLAIM_COLUMNS}
+# claim_matches kinds that describe a billed line item
+LINE_ITEM_KINDS = ('matched', 'inadmissible', 'consultation_adjustment')
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def available_formats() -> List[str]:
+    return [name for name in FORMATS if name != 'parquet' or pa is not None]
+
+
+def date_bounds(date_from: str = None, date_to: str = None) -> Tuple[Optional[str], Optional[str]]:
+    """Inclusive YYYY-MM-DD dates as created_at bounds: [start, end)"""
+    start = datetime.strptime(date_from, '%Y-%m-%d').strftime('%Y-%m-%d') if date_from else None
+    end = None
+    if date_to:
+        end = (datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    return start, end
+
+
+def in_bounds(created_at: Optional[str], start: Optional[str], end: Optional[str]) -> bool:
+    if created_at is None:
+        return start is None and end is None
+    return (start is None or created_at >= start) and (end is None or created_at < end)
+
+
+# Row sources
+def match_rows(employee: str, session_id: str, created_at: str, matches: Iterable[tuple]) -> Iterator[tuple]:
+    """Line-item rows from claim_matches-shaped tuples (kind, prescription, bill item,
+    normalized, amount, admissible, excess, score, status, reason)"""
+    for m in matches:
+        if m[0] in LINE_ITEM_KINDS:
+            yield (employee, session_id, created_at, m[0], m[1], m[2], m[4], m[5], m[6], m[7], m[8], m[9])
+
+
+def claim_row(employee: str, session_id: str, created_at: str, counts: tuple, matches: Iterable[tuple]) -> tuple:
+    """One claim row from session counts and its claim_matches-shaped tuples"""
+    line_items = admissible = inadmissible = 0
+    admissible_amount = inadmissible_amount = 0.0
+    for m in matches:
+        if m[0] not in LINE_ITEM_KINDS:
+            continue
+        line_items += 1
+        if m[0] == 'inadmissible':
+            inadmissible += 1
+            inadmissible_amount += m[4] or 0.0
+        else:
+            admissible += 1
+            admissible_amount += m[5] or 0.0
+            inadmissible_amount += m[6] or 0.0
+    return (employee, session_id, created_at, *counts, line_items,
+            admissible, round(admissible_amount, 2), inadmissible, round(inadmissible_amount, 2))
+
+
+def _session_pages(connect, start: str, end: str, employee: str) -> Iterator[list]:
+    """Sessions in created_at order, a page at a time, each page on a fresh connect()"""
+    where, params = ['created_at IS NOT NULL'], []
+    if start:
+        where.append('created_at >= ?')
+        params.append(start)
+    if end:
+        where.append('created_at < ?')
+        params.append(end)
+    if employee:
+        where.append('employee_name = ?')
+        params.append(employee)
+    after = None
+    while True:
+        clauses, args = list(where), list(params)
+        if after:
+            clauses.append('(created_at, id) > (?, ?)')
+            args.extend(after)
+        with connect() as conn:
+            page = [tuple(row) for row in conn.execute(f'''
+                SELECT id, employee_name, session_id, created_at, file_count, prescription_count,
+                       bill_count, total_amount
+                FROM sessions WHERE {' AND '.join(clauses)}
+                ORDER BY created_at, id LIMIT ?
+            ''', (*args, SESSION_PAGE_SIZE)).fetchall()]
+            if not page:
+                return
+            matches: Dict[tuple, list] = {}
+            for row in conn.execute(f'''
+                SELECT m.employee_name, m.session_id, m.kind, m.prescription_name, m.bill_item_name,
+                       m.normalized_name, m.amount, m.admissible_amount, m.excess_amount, m.match_score,
+                       m.status, m.reason
+                FROM claim_matches m
+                JOIN sessions s ON s.employee_name = m.employee_name AND s.session_id = m.session_id
+                WHERE s.id IN ({', '.join('?' * len(page))})
+                ORDER BY m.id
+            ''', [row[0] for row in page]):
+                matches.setdefault((row[0], row[1]), []).append(tuple(row)[2:])
+        yield [(row, matches.get((row[1], row[2]), [])) for row in page]
+        if len(page) < SESSION_PAGE_SIZE:
+            return
+        after = (page[-1][3], page[-1][0])
+
+
+def _rows(connect, kind: str, start: str, end: str, employee: str) -> Iterator[tuple]:
+    for page in _session_pages(connect, start, end, employee):
+        for session, matches in page:
+            _, name, session_id, created_at = session[:4]
+            if kind == 'claims':
+                yield claim_row(name, session_id, created_at, session[4:], matches)
+            else:
+                yield from match_rows(name, session_id, created_at, matches)
+
+
+def rows_from_db(db_path: str, kind: str, start: str = None, end: str = None,
+                 employee: str = None) -> Iterator[tuple]:
+    """Export rows for hot sessions in the database"""
+    return _rows(lambda: database.connection(db_path), kind, start, end, employee)
+
+
+def rows_from_archive(archive_dir: str, kind: str, start: str = None, end: str = None,
+                      employee: str = None) -> Iterator[tuple]:
+    """Export rows for sessions in archived months, oldest month first"""
+    for month in archive.archived_months(archive_dir, start, end):
+        yield from _rows(lambda month=month: closing(archive.month_connection(archive_dir, month)),
+                         kind, start, end, employee)
+
+
+# Encoders: each takes rows and yields bytes
+def _cell(value):
+    return '' if value is None else value
+
+
+def encode_csv(columns, rows: Iterable[tuple]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    pending = 0
+    for row in rows:
+        writer.writerow([_cell(value) for value in row])
+        pending += 1
+        if pending >= CSV_FLUSH_ROWS:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode('utf-8')
+
+
+def encode_jsonl(columns, rows: Iterable[tuple]) -> Iterator[bytes]:
+    names = [name for name, _ in columns]
+    for row in rows:
+        yield (json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n').encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def encode_parquet(columns, rows: Iterable[tuple]) -> Iterator[bytes]:
+    if pa is None:
+        raise RuntimeError('Parquet export needs pyarrow (pip install pyarrow)')
+    types = {'str': pa.string(), 'int': pa.int64(), 'float': pa.float64()}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+
+    def flush(batch):
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)], schema=schema
+        ))
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= PARQUET_ROW_GROUP:
+            flush(batch)
+            batch = []
+            yield sink.drain()
+    if batch:
+        flush(batch)
+    writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {'csv': encode_csv, 'jsonl': encode_jsonl, 'parquet': encode_parquet}
+
+
+def encode(fmt: str, kind: str, rows: Iterable[tuple]) -> Iterator[bytes]:
+    return ENCODERS[fmt](COLUMNS[kind], rows)
+
+
+def filename(kind: str, fmt: str, date_from: str = None, date_to: str = None, employee: str = None) -> str:
+    parts = ['claims' if kind == 'claims' else 'line-items']
+    if employee:
+        parts.append(employee)
+    if date_from or date_to:
+        parts.append(f"{date_from or 'start'}_{date_to or 'now'}")
+    return f"{'-'.join(parts)}.{FORMATS[fmt][1]}"
@@ -0,0 +1,441 @@
+"""
+Maintenance commands for the Medical Claims server
+Usage: python manage.py <command> [options]
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import database
+import export
+import migrations
+import settings
+import summary_store
+from session_rows import normalize_medicine_name
+
+
+def _server(migrate: bool = True):
+    """
+    The server module, imported only by the commands that need it so that
+    `migrate` sees the schema as it is. Brings the schema up to date first.
+    """
+    import server
+    if migrate:
+        server.init_database()
+    return server
+
+
+def cmd_warm_cache(args):
+    """Populate the document cache from extraction results stored in dataset/"""
+    server = _server()
+    result = server.warm_cache_from_dataset(args.dataset, workers=args.workers or server.CACHE_WARMUP_WORKERS)
+    print(json.dumps(result, indent=2))
+    return 1 if result.get('error') else 0
+
+
+def cmd_migrate(args):
+    """Show or apply pending schema migrations and their backfills"""
+    if args.status:
+        print(json.dumps(migrations.status(settings.DB_PATH), indent=2))
+        return 0
+    result = {"applied": migrations.migrate(settings.DB_PATH, target=args.target)}
+    if not args.skip_backfill:
+        result["backfilled"] = migrations.run_backfills(settings.DB_PATH, batch_size=args.batch_size)
+    result["currentVersion"] = migrations.current_version(settings.DB_PATH)
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+def cmd_backfill_items(args):
+    """Record line items of sessions already stored in dataset/"""
+    server = _server()
+    result = server.backfill_claim_items(args.dataset, force=args.force)
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+def cmd_import_dataset(args):
+    """Bulk-import a dataset tree (parallel parsing, batched writes, resumable)"""
+    server = _server()
+    result = server.bulk_import_dataset(args.dataset, workers=args.workers or server.IMPORT_WORKERS,
+                                        batch_size=args.batch_size or server.IMPORT_BATCH_SIZE,
+                                        resume=not args.restart, with_cache=not args.no_cache)
+    print(json.dumps(result, indent=2))
+    print(f"⏱️  {result['sessionsImported']} sessions in {result['seconds']}s "
+          f"= {result['sessionsPerSec']} sessions/sec ({result['lineItems']} bill items, "
+          f"{result['cacheRows']} cache rows)")
+    return 0
+
+
+def cmd_archive(args):
+    """Move old months to the archive tier"""
+    server = _server()
+    result = server.archive_old_sessions(args.older_than, dry_run=args.dry_run)
+    print(json.dumps(result, indent=2))
+    return 1 if result.get('error') else 0
+
+
+def cmd_dedup(args):
+    """Move dataset/ files into the blob store and report the space saved"""
+    server = _server()
+    result = server.dedup_dataset(args.dataset)
+    if args.gc:
+        result["gc"] = server.collect_blob_garbage()
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+def cmd_compact_summaries(args):
+    """Rewrite legacy summary.json files in the compressed, indexed format"""
+    server = _server()
+    result = {"converted": 0, "bytesBefore": 0, "bytesAfter": 0, "errors": 0}
+    for session_dir in server._list_session_dirs(args.dataset or server.DATASET_DIR):
+        try:
+            sizes = summary_store.convert_legacy(session_dir)
+        except Exception as e:
+            print(f"Skipping {session_dir}: {e}")
+            result["errors"] += 1
+            continue
+        if sizes:
+            result["converted"] += 1
+            result["bytesBefore"] += sizes["before"]
+            result["bytesAfter"] += sizes["after"]
+    print(json.dumps(result, indent=2))
+    return 1 if result["errors"] else 0
+
+
+def cmd_pack(args):
+    """Fold old completed sessions into per employee-month pack files"""
+    server = _server()
+    result = server.pack_old_sessions(args.older_than_days, dry_run=args.dry_run)
+    print(json.dumps(result, indent=2))
+    return 1 if result.get('error') else 0
+
+
+def cmd_retention(args):
+    """Apply the retention policies once (or report what they would remove)"""
+    server = _server()
+    result = server.run_retention(dry_run=args.dry_run)
+    print(json.dumps(result, indent=2))
+    return 1 if result.get('error') else 0
+
+
+def cmd_thumbnails(args):
+    """Render thumbnails and previews for stored pages that lack them"""
+    server = _server()
+    print(json.dumps(server.render_dataset_thumbnails(), indent=2))
+    return 0
+
+
+def cmd_export(args):
+    """Stream line items or claims to a file (or stdout) as CSV, JSON lines or Parquet"""
+    server = _server()
+    if args.format not in export.available_formats():
+        print(f"❌ Format {args.format} is not available (pip install pyarrow for parquet)", file=sys.stderr)
+        return 1
+    try:
+        rows = server.export_rows(args.kind, args.source, args.date_from, args.date_to, args.employee)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    
+    count = 0
+    
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+    
+    started = time.perf_counter()
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in export.encode(args.format, args.kind, counted(rows)):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+        else:
+            out.flush()
+    print(f"📤 Exported {count} rows ({args.kind}, {args.format}) to {args.output or 'stdout'} "
+          f"in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    return 0
+
+
+def cmd_reconcile(args):
+    """Verify employee totals against the sessions table"""
+    server = _server()
+    result = server.reconcile_employee_stats(repair=not args.check_only)
+    print(json.dumps(result, indent=2))
+    return 1 if result['drifted'] and args.check_only else 0
+
+
+def cmd_bench_db(args):
+    """Measure queries per second before and after the pooled connection layer"""
+    result = database.benchmark(rows=args.rows, reads=args.reads)
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+def _legacy_learn(db_path, document_type, entities, entity_type):
+    """The original SELECT-then-UPDATE/INSERT learning loop, kept for comparison"""
+    with sqlite3.connect(db_path) as conn:
+        for entity in entities:
+            entity_text = entity.get('name', str(entity)) if isinstance(entity, dict) else str(entity)
+            normalized = normalize_medicine_name(entity_text)
+            row = conn.execute('''
+                SELECT id, times_seen, confidence FROM extraction_memory
+                WHERE document_type = ? AND normalized_text = ? AND entity_type = ?
+            ''', (document_type, normalized, entity_type)).fetchone()
+            if row:
+                conn.execute('''
+                    UPDATE extraction_memory SET times_seen = ?, confidence = ?, last_seen = ?
+                    WHERE id = ?
+                ''', (row[1] + 1, min(1.0, row[2] + 0.05), datetime.now().isoformat(), row[0]))
+            else:
+                conn.execute('''
+                    INSERT INTO extraction_memory
+                    (document_type, original_text, normalized_text, entity_type, confidence)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (document_type, entity_text, normalized, entity_type, 0.8))
+        conn.commit()
+
+
+def cmd_bench_learning(args):
+    """Measure learn_from_extraction throughput on a synthetic bill workload"""
+    server = _server(migrate=False)
+    rng = random.Random(42)
+    forms = ['TAB', 'CAP', 'SYRUP', 'CREAM', 'INJ']
+    vocabulary = [f"MEDICINE{i} {rng.choice([250, 500, 625, 650])}MG {rng.choice(forms)}"
+                  for i in range(args.distinct)]
+    items = [{"name": rng.choice(vocabulary), "amount": rng.randint(20, 900)} for _ in range(args.items)]
+    pages = [items[i:i + args.page_size] for i in range(0, len(items), args.page_size)]
+
+    results = {"items": len(items), "pages": len(pages), "distinctNames": args.distinct}
+    original_db_path = server.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        # Before: original schema (no unique key) and per-entity statements
+        legacy_path = os.path.join(tmp, 'legacy.db')
+        with sqlite3.connect(legacy_path) as conn:
+            conn.execute('''
+                CREATE TABLE extraction_memory (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    document_type TEXT NOT NULL,
+                    original_text TEXT NOT NULL,
+                    normalized_text TEXT NOT NULL,
+                    entity_type TEXT NOT NULL,
+                    confidence REAL DEFAULT 1.0,
+                    times_seen INTEGER DEFAULT 1,
+                    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('CREATE INDEX idx_extraction_memory_type ON extraction_memory(document_type, entity_type)')
+        started = time.perf_counter()
+        for page in pages:
+            _legacy_learn(legacy_path, 'bill', page, 'medicine')
+        elapsed = time.perf_counter() - started
+        results["before"] = {"seconds": round(elapsed, 3), "itemsPerSec": round(len(items) / elapsed, 1)}
+
+        # After: unique key and one executemany UPSERT per page, via the writer queue
+        server.DB_PATH = os.path.join(tmp, 'upsert.db')
+        try:
+            server.init_database()
+            started = time.perf_counter()
+            for page in pages:
+                server.learn_from_extraction('bill', page, 'medicine')
+            database.get_writer(server.DB_PATH).flush()
+            elapsed = time.perf_counter() - started
+            results["after"] = {"seconds": round(elapsed, 3), "itemsPerSec": round(len(items) / elapsed, 1)}
+            database.get_writer(server.DB_PATH).stop()
+            database.get_pool(server.DB_PATH).close_all()
+        finally:
+            server.DB_PATH = original_db_path
+
+    results["speedup"] = round(results["after"]["itemsPerSec"] / results["before"]["itemsPerSec"], 1)
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+_FIRST_NAMES = ['Arya', 'Athulya', 'Shivani', 'Niveditha', 'Grifith', 'Rahul', 'Priya', 'Karthik',
+                'Meera', 'Anand', 'Divya', 'Suresh', 'Lakshmi', 'Vikram', 'Nisha', 'Arjun']
+_LAST_NAMES = ['Rao', 'Nair', 'Menon', 'Iyer', 'Shetty', 'Kumar', 'Reddy', 'Pillai', 'Das', 'Joshi']
+
+
+def _legacy_search_employees(conn, query, limit):
+    """The LIKE '%q%' employee search from the old server, kept for comparison"""
+    return conn.execute('''
+        SELECT name, total_sessions, total_files, total_amount, last_activity
+        FROM employees 
+        WHERE LOWER(name) LIKE ? 
+        ORDER BY 
+            CASE WHEN LOWER(name) LIKE ? THEN 1 ELSE 2 END,
+            total_sessions DESC
+        LIMIT ?
+    ''', (f'%{query}%', f'{query}%', limit)).fetchall()
+
+
+def _latency_report(samples):
+    samples = sorted(samples)
+    return {
+        "meanMs": round(sum(samples) / len(samples) * 1000, 3),
+        "p50Ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95Ms": round(samples[int(len(samples) * 0.95)] * 1000, 3),
+    }
+
+
+def cmd_bench_search(args):
+    """Measure employee search latency: LIKE scan vs the trigram/prefix index"""
+    server = _server(migrate=False)
+    rng = random.Random(7)
+    names = [f'{rng.choice(_FIRST_NAMES)}_{rng.choice(_LAST_NAMES)}_{i:06d}' for i in range(args.employees)]
+    queries = []
+    for _ in range(args.queries):
+        name = rng.choice(names).lower()
+        start = rng.choice([0, 0, name.index('_') + 1, len(name) - 6])
+        queries.append(name[start:start + rng.randint(2, 8)])
+
+    original_db_path = server.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        server.DB_PATH = os.path.join(tmp, 'search.db')
+        try:
+            server.init_database()
+            rows = [(name, rng.randint(0, 40)) for name in names]
+            server.db_write(lambda conn: conn.executemany(
+                'INSERT INTO employees (name, total_sessions) VALUES (?, ?)', rows
+            ), wait=True)
+
+            results = {"employees": args.employees, "queries": len(queries)}
+            with server.db_connection() as conn:
+                timings = []
+                for query in queries:
+                    started = time.perf_counter()
+                    _legacy_search_employees(conn, query, args.limit)
+                    timings.append(time.perf_counter() - started)
+            results["before"] = _latency_report(timings)
+
+            timings = []
+            for query in queries:
+                started = time.perf_counter()
+                server.search_employees_indexed(query, args.limit)
+                timings.append(time.perf_counter() - started)
+            results["after"] = _latency_report(timings)
+
+            database.get_writer(server.DB_PATH).stop()
+            database.get_pool(server.DB_PATH).close_all()
+        finally:
+            server.DB_PATH = original_db_path
+
+    results["speedup"] = round(results["before"]["meanMs"] / results["after"]["meanMs"], 1)
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Medical Claims server maintenance commands')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    warm = subparsers.add_parser('warm-cache', help='Warm the document cache from the dataset tree')
+    warm.add_argument('--dataset', default=None, help='Dataset directory (default: ./dataset)')
+    warm.add_argument('--workers', type=int, default=None,
+                      help='Parallel session scanners (default: CACHE_WARMUP_WORKERS)')
+    warm.set_defaults(func=cmd_warm_cache)
+
+    migrate = subparsers.add_parser('migrate', help='Inspect or apply schema migrations')
+    migrate.add_argument('--status', action='store_true', help='Only show the schema version and pending migrations')
+    migrate.add_argument('--target', type=int, default=None, help='Migrate up to this version (default: latest)')
+    migrate.add_argument('--batch-size', type=int, default=migrations.BACKFILL_BATCH_SIZE,
+                         help='Rows per backfill transaction')
+    migrate.add_argument('--skip-backfill', action='store_true', help='Apply DDL only')
+    migrate.set_defaults(func=cmd_migrate)
+
+    backfill = subparsers.add_parser('backfill-items', help='Load claim line items from the dataset tree')
+    backfill.add_argument('--dataset', default=None, help='Dataset directory (default: ./dataset)')
+    backfill.add_argument('--force', action='store_true', help='Rewrite sessions that already have line items')
+    backfill.set_defaults(func=cmd_backfill_items)
+
+    importer = subparsers.add_parser('import-dataset', help='Bulk-import a dataset tree into the database')
+    importer.add_argument('--dataset', default=None, help='Dataset directory (default: ./dataset)')
+    importer.add_argument('--workers', type=int, default=None, help='Parser processes (default: CPUs - 1)')
+    importer.add_argument('--batch-size', type=int, default=None,
+                          help='Sessions per transaction (default: IMPORT_BATCH_SIZE)')
+    importer.add_argument('--restart', action='store_true', help='Ignore the saved checkpoint')
+    importer.add_argument('--no-cache', action='store_true', help='Do not load page extractions into the cache')
+    importer.set_defaults(func=cmd_import_dataset)
+
+    archive = subparsers.add_parser('archive', help='Move old sessions to the cold archive tier')
+    archive.add_argument('--older-than', type=int, default=None,
+                         help='Age in months (default: ARCHIVE_AFTER_MONTHS)')
+    archive.add_argument('--dry-run', action='store_true', help='Only list the months that would move')
+    archive.set_defaults(func=cmd_archive)
+
+    dedup = subparsers.add_parser('dedup', help='Deduplicate dataset/ files into the blob store')
+    dedup.add_argument('--dataset', help='Dataset directory (default: dataset/ next to server.py)')
+    dedup.add_argument('--gc', action='store_true', help='Also delete unreferenced blobs')
+    dedup.set_defaults(func=cmd_dedup)
+
+    compact = subparsers.add_parser('compact-summaries', help='Convert summary.json files to summary.jsonz')
+    compact.add_argument('--dataset', help='Dataset directory (default: dataset/ next to server.py)')
+    compact.set_defaults(func=cmd_compact_summaries)
+
+    pack = subparsers.add_parser('pack', help='Pack old sessions into per employee-month archives')
+    pack.add_argument('--older-than-days', type=int, default=None,
+                      help='Age in days (default: PACK_AFTER_DAYS)')
+    pack.add_argument('--dry-run', action='store_true', help='Only list the packs that would be written')
+    pack.set_defaults(func=cmd_pack)
+
+    retain = subparsers.add_parser('retention', help='Delete sessions, cache rows and previews past the RETENTION_* policies')
+    retain.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+    retain.set_defaults(func=cmd_retention)
+
+    thumbs = subparsers.add_parser('thumbnails', help='Render missing page thumbnails and previews')
+    thumbs.set_defaults(func=cmd_thumbnails)
+
+    exporter = subparsers.add_parser('export', help='Export line items or claims (CSV, JSON lines, Parquet)')
+    exporter.add_argument('kind', choices=list(export.COLUMNS), help='items: one row per line item; claims: per session')
+    exporter.add_argument('--format', default='csv', choices=list(export.FORMATS))
+    exporter.add_argument('--from', dest='date_from', default=None, help='First day (YYYY-MM-DD)')
+    exporter.add_argument('--to', dest='date_to', default=None, help='Last day, inclusive (YYYY-MM-DD)')
+    exporter.add_argument('--employee', default=None, help='Only this employee')
+    exporter.add_argument('--source', default='db', choices=export.SOURCES,
+                          help='Read the database or the stored summaries')
+    exporter.add_argument('-o', '--output', default=None, help='Output file (default: stdout)')
+    exporter.set_defaults(func=cmd_export)
+
+    reconcile = subparsers.add_parser('reconcile', help='Check (and repair) employee totals')
+    reconcile.add_argument('--check-only', action='store_true', help='Report drift without repairing it')
+    reconcile.set_defaults(func=cmd_reconcile)
+
+    bench_db = subparsers.add_parser('bench-db', help='Benchmark the SQLite connection layer')
+    bench_db.add_argument('--rows', type=int, default=2000, help='Cache rows to write')
+    bench_db.add_argument('--reads', type=int, default=20000, help='Cache lookups to run')
+    bench_db.set_defaults(func=cmd_bench_db)
+
+    bench_learning = subparsers.add_parser('bench-learning', help='Benchmark pattern learning throughput')
+    bench_learning.add_argument('--items', type=int, default=10000, help='Synthetic bill items')
+    bench_learning.add_argument('--distinct', type=int, default=1500, help='Distinct medicine names')
+    bench_learning.add_argument('--page-size', type=int, default=40, help='Items per bill page')
+    bench_learning.set_defaults(func=cmd_bench_learning)
+
+    bench_search = subparsers.add_parser('bench-search', help='Benchmark employee search latency')
+    bench_search.add_argument('--employees', type=int, default=100000, help='Synthetic employees')
+    bench_search.add_argument('--queries', type=int, default=500, help='Search-as-you-type queries to run')
+    bench_search.add_argument('--limit', type=int, default=50, help='Results per query')
+    bench_search.set_defaults(func=cmd_bench_search)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
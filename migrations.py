@@ -0,0 +1,928 @@
+"""
+Schema migrations for the main database
+The schema version lives in PRAGMA user_version. Each migration brings the
+database from version N-1 to N inside one transaction on the database's
+writer thread, so request traffic keeps flowing while it runs. Migrations
+that need to rewrite existing rows also declare a backfill, which is applied
+afterwards in small batches (one short transaction each) until no rows are
+left, and can be resumed at any time.
+
+Usage (see manage.py):
+    python manage.py migrate --status
+    python manage.py migrate [--target N] [--skip-backfill]
+"""
+
+import time
+from typing import Callable, Dict, List, Optional
+
+import database
+
+BACKFILL_BATCH_SIZE = 500
+BACKFILL_PAUSE = 0.01  # seconds between batches, leaves room for request writes
+
+
+class Migration:
+    """One schema step: apply(conn) runs DDL; backfill_sql updates up to ? rows"""
+
+    def __init__(self, version: int, name: str, apply: Callable,
+                 backfill_sql: Optional[str] = None, remaining_sql: Optional[str] = None):
+        self.version = version
+        self.name = name
+        self.apply = apply
+        self.backfill_sql = backfill_sql
+        self.remaining_sql = remaining_sql
+
+
+def _column_exists(conn, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f'PRAGMA table_info({table})'))
+
+
+def _index_exists(conn, name: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+# 1: tables and indexes as created by init_database before versioning.
+# Everything is IF NOT EXISTS so databases from that era adopt version 1 as-is.
+def _baseline(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS employees (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            total_sessions INTEGER DEFAULT 0,
+            total_files INTEGER DEFAULT 0,
+            total_amount REAL DEFAULT 0.0
+        )
+    ''')
+    
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_name TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            file_count INTEGER DEFAULT 0,
+            prescription_count INTEGER DEFAULT 0,
+            bill_count INTEGER DEFAULT 0,
+            total_amount REAL DEFAULT 0.0,
+            UNIQUE(employee_name, session_id)
+        )
+    ''')
+    
+    # NEW: Document cache table for persistent extraction results
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS document_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_hash TEXT UNIQUE NOT NULL,
+            filename TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            extraction_data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            access_count INTEGER DEFAULT 1
+        )
+    ''')
+    
+    # NEW: Extraction memory table for learning patterns
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS extraction_memory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_type TEXT NOT NULL,
+            original_text TEXT NOT NULL,
+            normalized_text TEXT NOT NULL,
+            entity_type TEXT NOT NULL,
+            confidence REAL DEFAULT 1.0,
+            times_seen INTEGER DEFAULT 1,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Memo of whole-session results for identical resubmissions
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS session_memo (
+            memo_key TEXT PRIMARY KEY,
+            employee_name TEXT,
+            session_id TEXT,
+            result TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Resubmissions that were answered from an earlier session
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS session_links (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_name TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            linked_session_id TEXT NOT NULL,
+            memo_key TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Indexes for performance
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_employee_name ON sessions(employee_name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON sessions(created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_file_hash ON document_cache(file_hash)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_extraction_memory_type ON extraction_memory(document_type, entity_type)')
+
+
+# 2: one row per learned pattern; older databases may hold duplicates to merge first
+def _extraction_memory_key(conn):
+    if _index_exists(conn, 'idx_extraction_memory_key'):
+        return
+    conn.execute('''
+        UPDATE extraction_memory AS m
+        SET times_seen = dup.times_seen, confidence = dup.confidence, last_seen = dup.last_seen
+        FROM (
+            SELECT MIN(id) AS keep_id, SUM(times_seen) AS times_seen,
+                   MAX(confidence) AS confidence, MAX(last_seen) AS last_seen
+            FROM extraction_memory
+            GROUP BY document_type, normalized_text, entity_type
+            HAVING COUNT(*) > 1
+        ) AS dup
+        WHERE m.id = dup.keep_id
+    ''')
+    conn.execute('''
+        DELETE FROM extraction_memory
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM extraction_memory
+            GROUP BY document_type, normalized_text, entity_type
+        )
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX idx_extraction_memory_key
+        ON extraction_memory(document_type, normalized_text, entity_type)
+    ''')
+
+
+# 3: employee totals follow the sessions table through deltas, so cost no
+# longer grows with an employee's history. last_activity only needs a lookup
+# on delete, answered by idx_sessions_employee_created.
+EMPLOYEE_STATS_TRIGGERS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_sessions_stats_insert AFTER INSERT ON sessions
+    BEGIN
+        INSERT INTO employees (name, total_sessions, total_files, total_amount, last_activity)
+        VALUES (NEW.employee_name, 1, NEW.file_count, NEW.total_amount, NEW.created_at)
+        ON CONFLICT(name) DO UPDATE SET
+            total_sessions = total_sessions + 1,
+            total_files = total_files + excluded.total_files,
+            total_amount = total_amount + excluded.total_amount,
+            last_activity = MAX(COALESCE(last_activity, ''), excluded.last_activity);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_sessions_stats_update
+    AFTER UPDATE OF employee_name, file_count, total_amount, created_at ON sessions
+    BEGIN
+        UPDATE employees SET
+            total_sessions = total_sessions - 1,
+            total_files = total_files - OLD.file_count,
+            total_amount = total_amount - OLD.total_amount
+        WHERE name = OLD.employee_name;
+        INSERT INTO employees (name, total_sessions, total_files, total_amount, last_activity)
+        VALUES (NEW.employee_name, 1, NEW.file_count, NEW.total_amount, NEW.created_at)
+        ON CONFLICT(name) DO UPDATE SET
+            total_sessions = total_sessions + 1,
+            total_files = total_files + excluded.total_files,
+            total_amount = total_amount + excluded.total_amount,
+            last_activity = MAX(COALESCE(last_activity, ''), excluded.last_activity);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_sessions_stats_delete AFTER DELETE ON sessions
+    BEGIN
+        UPDATE employees SET
+            total_sessions = total_sessions - 1,
+            total_files = total_files - OLD.file_count,
+            total_amount = total_amount - OLD.total_amount,
+            last_activity = COALESCE(
+                (SELECT MAX(created_at) FROM sessions WHERE employee_name = OLD.employee_name),
+                last_activity
+            )
+        WHERE name = OLD.employee_name;
+    END
+    ''',
+)
+
+
+def _employee_stats_triggers(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_employee_created ON sessions(employee_name, created_at)')
+    for trigger_sql in EMPLOYEE_STATS_TRIGGERS:
+        conn.execute(trigger_sql)
+
+
+# 4: integer (unix seconds) timestamps on sessions for cheap range scans.
+# New rows get theirs from a trigger; existing rows are backfilled in batches.
+def _sessions_created_ts(conn):
+    if not _column_exists(conn, 'sessions', 'created_ts'):
+        conn.execute('ALTER TABLE sessions ADD COLUMN created_ts INTEGER')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_created_ts ON sessions(created_ts)')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_sessions_created_ts AFTER INSERT ON sessions
+        WHEN NEW.created_ts IS NULL
+        BEGIN
+            UPDATE sessions SET created_ts = CAST(strftime('%s', NEW.created_at) AS INTEGER)
+            WHERE id = NEW.id;
+        END
+    ''')
+
+
+# 5: line items of every claim as rows, so analytics can run as SQL instead
+# of parsing summary.json files. Rows go away with their session.
+def _claim_line_items(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS claim_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_name TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            file_index INTEGER NOT NULL,
+            filename TEXT,
+            original_filename TEXT,
+            file_type TEXT,
+            page INTEGER,
+            is_pdf INTEGER DEFAULT 0,
+            is_claim_form INTEGER DEFAULT 0,
+            bill_item_count INTEGER DEFAULT 0,
+            prescription_count INTEGER DEFAULT 0,
+            error TEXT,
+            created_ts INTEGER,
+            UNIQUE(employee_name, session_id, file_index)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS claim_bill_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_name TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            file_index INTEGER NOT NULL,
+            item_index INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            normalized_name TEXT,
+            amount REAL DEFAULT 0.0,
+            is_consultation INTEGER DEFAULT 0,
+            is_test INTEGER DEFAULT 0,
+            created_ts INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS claim_matches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_name TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            prescription_name TEXT,
+            bill_item_name TEXT,
+            normalized_name TEXT,
+            amount REAL,
+            admissible_amount REAL,
+            excess_amount REAL,
+            match_score REAL,
+            status TEXT,
+            reason TEXT,
+            created_ts INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_claim_files_session ON claim_files(employee_name, session_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_claim_bill_items_session ON claim_bill_items(employee_name, session_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_claim_bill_items_name ON claim_bill_items(normalized_name, created_ts)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_claim_bill_items_created ON claim_bill_items(created_ts)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_claim_matches_session ON claim_matches(employee_name, session_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_claim_matches_kind ON claim_matches(kind, created_ts)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_claim_matches_name ON claim_matches(normalized_name)')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_sessions_claim_rows_delete AFTER DELETE ON sessions
+        BEGIN
+            DELETE FROM claim_files WHERE employee_name = OLD.employee_name AND session_id = OLD.session_id;
+            DELETE FROM claim_bill_items WHERE employee_name = OLD.employee_name AND session_id = OLD.session_id;
+            DELETE FROM claim_matches WHERE employee_name = OLD.employee_name AND session_id = OLD.session_id;
+        END
+    ''')
+
+
+# 6: searchable item names (bill items, prescriptions, tests) with an
+# external-content FTS5 index kept in sync by triggers.
+def _item_search(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS claim_item_names (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_name TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            normalized_name TEXT,
+            amount REAL,
+            created_ts INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_claim_item_names_session ON claim_item_names(employee_name, session_id)')
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS claim_item_fts USING fts5(
+            name, normalized_name,
+            content='claim_item_names', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_claim_item_names_insert AFTER INSERT ON claim_item_names
+        BEGIN
+            INSERT INTO claim_item_fts (rowid, name, normalized_name)
+            VALUES (NEW.id, NEW.name, NEW.normalized_name);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_claim_item_names_delete AFTER DELETE ON claim_item_names
+        BEGIN
+            INSERT INTO claim_item_fts (claim_item_fts, rowid, name, normalized_name)
+            VALUES ('delete', OLD.id, OLD.name, OLD.normalized_name);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_claim_item_names_update AFTER UPDATE ON claim_item_names
+        BEGIN
+            INSERT INTO claim_item_fts (claim_item_fts, rowid, name, normalized_name)
+            VALUES ('delete', OLD.id, OLD.name, OLD.normalized_name);
+            INSERT INTO claim_item_fts (rowid, name, normalized_name)
+            VALUES (NEW.id, NEW.name, NEW.normalized_name);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_sessions_item_names_delete AFTER DELETE ON sessions
+        BEGIN
+            DELETE FROM claim_item_names WHERE employee_name = OLD.employee_name AND session_id = OLD.session_id;
+        END
+    ''')
+    # Bill items recorded before this version; prescriptions and tests of older
+    # sessions come from `manage.py backfill-items`
+    conn.execute('''
+        INSERT INTO claim_item_names (employee_name, session_id, kind, name, normalized_name, amount, created_ts)
+        SELECT b.employee_name, b.session_id, 'bill_item', b.name, b.normalized_name, b.amount, b.created_ts
+        FROM claim_bill_items b
+        WHERE NOT EXISTS (
+            SELECT 1 FROM claim_item_names n
+            WHERE n.employee_name = b.employee_name AND n.session_id = b.session_id
+        )
+    ''')
+
+
+# 7: employee search without LIKE '%q%' scans: a NOCASE index for prefix
+# lookups and a trigram FTS5 index for substrings. Stats updates do not touch
+# the index; only name changes do.
+def _employee_search(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_employees_name_nocase ON employees(name COLLATE NOCASE)')
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS employee_fts USING fts5(
+            name, content='employees', content_rowid='id', tokenize='trigram'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_employees_fts_insert AFTER INSERT ON employees
+        BEGIN
+            INSERT INTO employee_fts (rowid, name) VALUES (NEW.id, NEW.name);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_employees_fts_delete AFTER DELETE ON employees
+        BEGIN
+            INSERT INTO employee_fts (employee_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_employees_fts_update AFTER UPDATE OF name ON employees
+        BEGIN
+            INSERT INTO employee_fts (employee_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+            INSERT INTO employee_fts (rowid, name) VALUES (NEW.id, NEW.name);
+        END
+    ''')
+    conn.execute("INSERT INTO employee_fts (employee_fts) VALUES ('rebuild')")
+
+
+# 8: per-day, per-month and per-employee-month rollups plus grand totals,
+# maintained by session triggers so analytics never scan sessions.
+ROLLUP_TABLES = (
+    # (table, key columns, key expressions over a sessions row alias, over session facts)
+    ('rollup_daily', ('day',), ("DATE({r}.created_at)",), ('day',)),
+    ('rollup_monthly', ('month',), ("strftime('%Y-%m', {r}.created_at)",), ('substr(day, 1, 7)',)),
+    ('rollup_employee_monthly', ('employee_name', 'month'),
+     ("{r}.employee_name", "strftime('%Y-%m', {r}.created_at)"), ('employee_name', 'substr(day, 1, 7)')),
+)
+
+# One row per session; from v9 on the session_facts view also covers archived sessions
+_SESSION_FACTS_SQL = '''
+    SELECT employee_name, DATE(created_at) AS day, 1 AS sessions, file_count AS files,
+           total_amount AS amount, created_at AS last_activity
+    FROM sessions
+'''
+
+
+def session_facts(conn) -> str:
+    """FROM-clause source of per-session (or per archived day) totals"""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'session_facts'").fetchone():
+        return 'session_facts'
+    return f'({_SESSION_FACTS_SQL})'
+
+
+def _rollup_add(row: str) -> str:
+    """Statements adding one sessions row (NEW) to every rollup"""
+    statements = []
+    for table, keys, exprs, _ in ROLLUP_TABLES:
+        key_values = ', '.join(e.format(r=row) for e in exprs)
+        statements.append(f'''
+            INSERT INTO {table} ({', '.join(keys)}, sessions, files, amount)
+            VALUES ({key_values}, 1, {row}.file_count, {row}.total_amount)
+            ON CONFLICT({', '.join(keys)}) DO UPDATE SET
+                sessions = sessions + 1,
+                files = files + excluded.files,
+                amount = amount + excluded.amount;''')
+    statements.append(f'''
+            UPDATE rollup_totals SET sessions = sessions + 1, files = files + {row}.file_count,
+                amount = amount + {row}.total_amount WHERE id = 1;''')
+    return ''.join(statements)
+
+
+def _rollup_remove(row: str) -> str:
+    """Statements taking one sessions row (OLD) out of every rollup"""
+    statements = []
+    for table, keys, exprs, _ in ROLLUP_TABLES:
+        where = ' AND '.join(f'{k} = {e.format(r=row)}' for k, e in zip(keys, exprs))
+        statements.append(f'''
+            UPDATE {table} SET sessions = sessions - 1, files = files - {row}.file_count,
+                amount = amount - {row}.total_amount WHERE {where};''')
+    statements.append(f'''
+            UPDATE rollup_totals SET sessions = sessions - 1, files = files - {row}.file_count,
+                amount = amount - {row}.total_amount WHERE id = 1;''')
+    return ''.join(statements)
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup from session facts and employees"""
+    facts = session_facts(conn)
+    for table, keys, _, fact_exprs in ROLLUP_TABLES:
+        key_values = ', '.join(fact_exprs)
+        conn.execute(f'DELETE FROM {table}')
+        conn.execute(f'''
+            INSERT INTO {table} ({', '.join(keys)}, sessions, files, amount)
+            SELECT {key_values}, SUM(sessions), COALESCE(SUM(files), 0), COALESCE(SUM(amount), 0.0)
+            FROM {facts}
+            GROUP BY {key_values}
+        ''')
+    conn.execute(f'''
+        INSERT INTO rollup_totals (id, employees, sessions, files, amount)
+        SELECT 1, (SELECT COUNT(*) FROM employees), COALESCE(SUM(sessions), 0),
+               COALESCE(SUM(files), 0), COALESCE(SUM(amount), 0.0)
+        FROM {facts}
+        WHERE true
+        ON CONFLICT(id) DO UPDATE SET
+            employees = excluded.employees, sessions = excluded.sessions,
+            files = excluded.files, amount = excluded.amount
+    ''')
+
+
+def rollup_drift(conn) -> List[str]:
+    """Names of rollup tables that disagree with a fresh GROUP BY over session facts"""
+    facts = session_facts(conn)
+    drifted = []
+    for table, keys, _, fact_exprs in ROLLUP_TABLES:
+        key_values = ', '.join(fact_exprs)
+        stored = f'''
+            SELECT {', '.join(keys)}, sessions, files, ROUND(amount, 2) FROM {table}
+            WHERE sessions != 0 OR files != 0 OR ROUND(amount, 2) != 0
+        '''
+        expected = f'''
+            SELECT {key_values}, SUM(sessions), COALESCE(SUM(files), 0), ROUND(COALESCE(SUM(amount), 0.0), 2)
+            FROM {facts} GROUP BY {key_values}
+        '''
+        mismatch = conn.execute(f'''
+            SELECT 1 FROM (SELECT * FROM ({stored}) EXCEPT SELECT * FROM ({expected}))
+            UNION ALL
+            SELECT 1 FROM (SELECT * FROM ({expected}) EXCEPT SELECT * FROM ({stored}))
+            LIMIT 1
+        ''').fetchone()
+        if mismatch:
+            drifted.append(table)
+    totals = conn.execute(f'''
+        SELECT t.employees = (SELECT COUNT(*) FROM employees)
+           AND t.sessions = f.sessions AND t.files = f.files AND ROUND(t.amount, 2) = f.amount
+        FROM rollup_totals t,
+             (SELECT COALESCE(SUM(sessions), 0) AS sessions, COALESCE(SUM(files), 0) AS files,
+                     ROUND(COALESCE(SUM(amount), 0.0), 2) AS amount FROM {facts}) f
+        WHERE t.id = 1
+    ''').fetchone()
+    if not totals or not totals[0]:
+        drifted.append('rollup_totals')
+    return drifted
+
+
+def _rollups(conn):
+    for table, keys, _, _ in ROLLUP_TABLES:
+        key_columns = ''.join(f'{k} TEXT NOT NULL, ' for k in keys)
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                {key_columns}
+                sessions INTEGER DEFAULT 0,
+                files INTEGER DEFAULT 0,
+                amount REAL DEFAULT 0.0,
+                PRIMARY KEY ({', '.join(keys)})
+            )
+        ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_totals (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            employees INTEGER DEFAULT 0,
+            sessions INTEGER DEFAULT 0,
+            files INTEGER DEFAULT 0,
+            amount REAL DEFAULT 0.0
+        )
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_sessions_rollup_insert AFTER INSERT ON sessions
+        BEGIN{_rollup_add('NEW')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_sessions_rollup_update
+        AFTER UPDATE OF employee_name, file_count, total_amount, created_at ON sessions
+        BEGIN{_rollup_remove('OLD')}{_rollup_add('NEW')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_sessions_rollup_delete AFTER DELETE ON sessions
+        BEGIN{_rollup_remove('OLD')}
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_employees_rollup_insert AFTER INSERT ON employees
+        BEGIN
+            UPDATE rollup_totals SET employees = employees + 1 WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_employees_rollup_delete AFTER DELETE ON employees
+        BEGIN
+            UPDATE rollup_totals SET employees = employees - 1 WHERE id = 1;
+        END
+    ''')
+    rebuild_rollups(conn)
+
+
+# 9: cold archive tier. Archived sessions leave the hot tables, but their
+# per-employee-day totals stay in archived_daily so employee totals and
+# rollups still cover all history. Deletes made while the 'archiving' flag is
+# set do not decrement totals.
+ARCHIVING_GUARD = "WHEN NOT EXISTS (SELECT 1 FROM maintenance_flags WHERE name = 'archiving')"
+
+
+def _archive_tier(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_flags (
+            name TEXT PRIMARY KEY,
+            set_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archived_daily (
+            employee_name TEXT NOT NULL,
+            day TEXT NOT NULL,
+            sessions INTEGER DEFAULT 0,
+            files INTEGER DEFAULT 0,
+            amount REAL DEFAULT 0.0,
+            last_activity TIMESTAMP,
+            PRIMARY KEY (employee_name, day)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_months (
+            month TEXT PRIMARY KEY,
+            sessions INTEGER DEFAULT 0,
+            db_path TEXT NOT NULL,
+            files_path TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute(f'''
+        CREATE VIEW IF NOT EXISTS session_facts AS
+        {_SESSION_FACTS_SQL}
+        UNION ALL
+        SELECT employee_name, day, sessions, files, amount, last_activity FROM archived_daily
+    ''')
+    
+    conn.execute('DROP TRIGGER IF EXISTS trg_sessions_stats_delete')
+    conn.execute(f'''
+        CREATE TRIGGER trg_sessions_stats_delete AFTER DELETE ON sessions
+        {ARCHIVING_GUARD}
+        BEGIN
+            UPDATE employees SET
+                total_sessions = total_sessions - 1,
+                total_files = total_files - OLD.file_count,
+                total_amount = total_amount - OLD.total_amount,
+                last_activity = COALESCE(
+                    (SELECT MAX(created_at) FROM sessions WHERE employee_name = OLD.employee_name),
+                    last_activity
+                )
+            WHERE name = OLD.employee_name;
+        END
+    ''')
+    conn.execute('DROP TRIGGER IF EXISTS trg_sessions_rollup_delete')
+    conn.execute(f'''
+        CREATE TRIGGER trg_sessions_rollup_delete AFTER DELETE ON sessions
+        {ARCHIVING_GUARD}
+        BEGIN{_rollup_remove('OLD')}
+        END
+    ''')
+
+
+# 10: keyset pagination of the employee listing (newest activity first)
+def _employee_listing_index(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_employees_activity ON employees(last_activity, name)')
+
+
+# 11: change journal and per-directory sync state for incremental dataset/ sync
+def _dataset_journal(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dataset_journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_dir TEXT NOT NULL,
+            session_id TEXT,
+            op TEXT NOT NULL,
+            source TEXT NOT NULL DEFAULT 'server',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            applied_at TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_dataset_journal_pending ON dataset_journal(id) WHERE applied_at IS NULL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dataset_dirs (
+            employee_dir TEXT PRIMARY KEY,
+            employee_name TEXT,
+            mtime_ns INTEGER NOT NULL,
+            synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_session_id ON sessions(session_id)')
+
+
+# 12: content-addressed blob store (see blobstore.py)
+BLOB_REF_TRIGGERS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_blob_refs_insert AFTER INSERT ON blob_refs
+    BEGIN
+        UPDATE blobs SET refs = refs + 1 WHERE digest = NEW.digest;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_blob_refs_delete AFTER DELETE ON blob_refs
+    BEGIN
+        UPDATE blobs SET refs = refs - 1 WHERE digest = OLD.digest;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_blob_refs_update AFTER UPDATE OF digest ON blob_refs
+    WHEN NEW.digest <> OLD.digest
+    BEGIN
+        UPDATE blobs SET refs = refs - 1 WHERE digest = OLD.digest;
+        UPDATE blobs SET refs = refs + 1 WHERE digest = NEW.digest;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_sessions_blob_refs_delete AFTER DELETE ON sessions
+    BEGIN
+        DELETE FROM blob_refs WHERE employee_name = OLD.employee_name AND session_id = OLD.session_id;
+    END
+    ''',
+)
+
+
+def _blob_store(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            digest TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            refs INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs(digest) WHERE refs <= 0')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS blob_refs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_name TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            UNIQUE(employee_name, session_id, name)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_blob_refs_digest ON blob_refs(digest)')
+    for trigger_sql in BLOB_REF_TRIGGERS:
+        conn.execute(trigger_sql)
+
+
+# 13: sessions folded into per employee-month pack files (see packs.py)
+def _packed_sessions(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS packed_sessions (
+            employee_dir TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            employee_name TEXT,
+            pack_file TEXT NOT NULL,
+            files INTEGER DEFAULT 0,
+            packed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (employee_dir, session_id)
+        )
+    ''')
+
+
+# 14: resume points of the bulk dataset importer, committed with each batch
+def _import_checkpoints(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            dataset_dir TEXT PRIMARY KEY,
+            last_session TEXT NOT NULL,
+            sessions INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _idempotency_keys(conn):
+    # One row per client Idempotency-Key on /api/ocr/auto: pending while the
+    # request runs, then the stored response that retries get back
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            idem_key TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            employee_name TEXT,
+            session_id TEXT,
+            response TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys(created_at)')
+
+
+def _retention_indexes(conn):
+    # Retention picks cache rows by last access and joins sessions to packs by employee name
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_document_cache_accessed ON document_cache(last_accessed)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_packed_sessions_name ON packed_sessions(employee_name, session_id)')
+
+
+def _unique_session_links(conn):
+    # A memo-linked session id is reserved by its session_links row, so it
+    # must be unique per employee; keep the first row of any duplicate
+    conn.execute('''
+        DELETE FROM session_links WHERE id NOT IN (
+            SELECT MIN(id) FROM session_links GROUP BY employee_name, session_id
+        )
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_session_links_session
+        ON session_links(employee_name, session_id)
+    ''')
+
+
+def _sql_last_activity(conn):
+    # Older builds stored last_activity as local-time ISO strings ('T',
+    # microseconds), which do not sort against the UTC CURRENT_TIMESTAMP
+    # format that session created_at uses; convert them to that format
+    conn.execute('''
+        UPDATE employees SET last_activity = DATETIME(last_activity, 'utc')
+        WHERE last_activity LIKE '%T%' AND DATETIME(last_activity, 'utc') IS NOT NULL
+    ''')
+
+
+# 19: employee search on short prefixes (a wide name range) walks employees in
+# rank order and stops at the page limit instead of sorting the range
+def _employee_rank_index(conn):
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_employees_rank
+        ON employees(total_sessions DESC, name COLLATE NOCASE)
+    ''')
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'baseline schema', _baseline),
+    Migration(2, 'unique key on extraction_memory', _extraction_memory_key),
+    Migration(3, 'incremental employee totals', _employee_stats_triggers),
+    Migration(
+        4, 'integer created_ts on sessions', _sessions_created_ts,
+        backfill_sql='''
+            UPDATE sessions SET created_ts = CAST(strftime('%s', created_at) AS INTEGER)
+            WHERE id IN (
+                SELECT id FROM sessions WHERE created_ts IS NULL AND created_at IS NOT NULL LIMIT ?
+            )
+        ''',
+        remaining_sql='SELECT COUNT(*) FROM sessions WHERE created_ts IS NULL AND created_at IS NOT NULL'
+    ),
+    Migration(5, 'claim line-item tables', _claim_line_items),
+    Migration(6, 'full-text item search', _item_search),
+    Migration(7, 'indexed employee search', _employee_search),
+    Migration(8, 'analytics rollups', _rollups),
+    Migration(9, 'cold archive tier', _archive_tier),
+    Migration(10, 'employee listing index', _employee_listing_index),
+    Migration(11, 'dataset change journal', _dataset_journal),
+    Migration(12, 'content-addressed blob store', _blob_store),
+    Migration(13, 'packed sessions', _packed_sessions),
+    Migration(14, 'import checkpoints', _import_checkpoints),
+    Migration(15, 'idempotency keys', _idempotency_keys),
+    Migration(16, 'retention indexes', _retention_indexes),
+    Migration(17, 'unique linked session ids', _unique_session_links),
+    Migration(18, 'one last_activity timestamp format', _sql_last_activity),
+    Migration(19, 'employee rank index', _employee_rank_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def _read_version(conn) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def current_version(db_path: str) -> int:
+    with database.connection(db_path) as conn:
+        return _read_version(conn)
+
+
+def _apply_migration(conn, migration: Migration) -> bool:
+    # Re-checked on the writer in case another process got here first
+    if _read_version(conn) >= migration.version:
+        return False
+    migration.apply(conn)
+    conn.execute(f'PRAGMA user_version = {int(migration.version)}')
+    return True
+
+
+def migrate(db_path: str, target: Optional[int] = None) -> List[Dict]:
+    """Apply pending schema migrations up to target (default: latest)"""
+    target = LATEST_VERSION if target is None else target
+    writer = database.get_writer(db_path)
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version > target or current_version(db_path) >= migration.version:
+            continue
+        started = time.time()
+        if writer.submit(_apply_migration, migration, wait=True):
+            print(f"🗄️  Migrated schema to v{migration.version}: {migration.name}")
+            applied.append({
+                "version": migration.version,
+                "name": migration.name,
+                "seconds": round(time.time() - started, 3)
+            })
+    return applied
+
+
+def _remaining(db_path: str, migration: Migration) -> int:
+    with database.connection(db_path) as conn:
+        return conn.execute(migration.remaining_sql).fetchone()[0]
+
+
+def _run_backfill_batch(conn, sql: str, batch_size: int) -> int:
+    return conn.execute(sql, (batch_size,)).rowcount
+
+
+def run_backfills(db_path: str, batch_size: int = BACKFILL_BATCH_SIZE,
+                  pause: float = BACKFILL_PAUSE) -> Dict[str, int]:
+    """Backfill rows for every applied migration; returns rows updated per migration"""
+    version = current_version(db_path)
+    writer = database.get_writer(db_path)
+    updated = {}
+    for migration in MIGRATIONS:
+        if not migration.backfill_sql or migration.version > version:
+            continue
+        total = 0
+        while True:
+            count = writer.submit(_run_backfill_batch, migration.backfill_sql, batch_size, wait=True)
+            total += count
+            if count < batch_size:
+                break
+            time.sleep(pause)
+        if total:
+            print(f"🗄️  Backfilled {total} row(s) for v{migration.version}: {migration.name}")
+        updated[f'v{migration.version}'] = total
+    return updated
+
+
+def status(db_path: str) -> Dict:
+    """Current version plus the state of every known migration"""
+    version = current_version(db_path)
+    migrations = []
+    for migration in MIGRATIONS:
+        entry = {
+            "version": migration.version,
+            "name": migration.name,
+            "applied": migration.version <= version
+        }
+        if migration.backfill_sql and entry["applied"]:
+            entry["backfillRemaining"] = _remaining(db_path, migration)
+        migrations.append(entry)
+    return {
+        "currentVersion": version,
+        "latestVersion": LATEST_VERSION,
+        "pending": [m["version"] for m in migrations if not m["applied"]],
+        "migrations": migrations
+    }
@@ -0,0 +1,182 @@
+"""
+Packed session storage
+Completed sessions older than a configured age are folded out of dataset/
+into one pack file per employee and month:
+
+- packs/<employee_dir>/<YYYY-MM>.pack
+
+    b'MCPK' | uint16 version | uint64 index offset | uint64 index length
+    | file contents ... | zlib-compressed JSON index
+
+The index maps session -> file name -> content digest and digest -> (offset,
+length), so identical pages within a pack are stored once. Readers memory-map
+the pack and slice files out by offset without extracting anything. Packing
+more sessions into an existing pack rewrites it to a temp file and renames it
+over the old one.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+PACK_MAGIC = b'MCPK'
+PACK_VERSION = 1
+_HEADER = struct.Struct('<4sHQQ')
+MAX_OPEN_READERS = 64
+
+
+def pack_path(pack_dir: str, employee_dir: str, month: str) -> str:
+    return os.path.join(pack_dir, employee_dir, f'{month}.pack')
+
+
+def candidate_sessions(dataset_dir: str, older_than_days: int, is_complete, now: datetime = None) -> Dict:
+    """(employee_dir, month) -> {session_id: session_dir} for completed sessions older than the age"""
+    cutoff = (now or datetime.now()) - timedelta(days=older_than_days)
+    groups: Dict = {}
+    if not os.path.isdir(dataset_dir):
+        return groups
+    for emp_entry in os.scandir(dataset_dir):
+        if not emp_entry.is_dir():
+            continue
+        for sess_entry in os.scandir(emp_entry.path):
+            if not sess_entry.is_dir():
+                continue
+            try:
+                started = datetime.strptime(sess_entry.name[:15], '%Y%m%d_%H%M%S')
+            except ValueError:
+                continue
+            if started < cutoff and is_complete(sess_entry.path):
+                key = (emp_entry.name, started.strftime('%Y-%m'))
+                groups.setdefault(key, {})[sess_entry.name] = sess_entry.path
+    return groups
+
+
+class PackReader:
+    """Memory-mapped random access to one pack file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index_offset, index_length = _HEADER.unpack_from(self._map, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            raise ValueError(f'Not a version {PACK_VERSION} pack: {path}')
+        self.index = json.loads(zlib.decompress(self._map[index_offset:index_offset + index_length]))
+
+    def session_ids(self) -> List[str]:
+        return sorted(self.index["sessions"])
+
+    def names(self, session_id: str) -> List[str]:
+        return sorted(self.index["sessions"].get(session_id, {}))
+
+    def digest(self, session_id: str, name: str) -> Optional[str]:
+        return self.index["sessions"].get(session_id, {}).get(name)
+
+    def read(self, session_id: str, name: str) -> Optional[bytes]:
+        digest = self.digest(session_id, name)
+        if digest is None:
+            return None
+        offset, length = self.index["blobs"][digest]
+        return self._map[offset:offset + length]
+
+    def close(self):
+        self._map.close()
+
+
+_readers: Dict[str, tuple] = {}
+_readers_lock = threading.Lock()
+
+
+def open_pack(path: str) -> Optional[PackReader]:
+    """Shared reader for a pack, reopened when the file is replaced"""
+    try:
+        stamp = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _readers_lock:
+        cached = _readers.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+    reader = PackReader(path)
+    with _readers_lock:
+        if len(_readers) >= MAX_OPEN_READERS:
+            _readers.pop(next(iter(_readers)))
+        _readers[path] = (stamp, reader)
+    return reader
+
+
+def write_pack(path: str, sessions: Dict[str, str], drop=()) -> Dict:
+    """
+    Add session directories ({session_id: dir}) to the pack at path, keeping
+    what it already holds except the session ids in drop. Returns what was
+    written; the directories are left for the caller to remove once the pack
+    is recorded. A pack left with no sessions is deleted.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    existing = open_pack(path) if os.path.exists(path) else None
+    index = {"sessions": {}, "blobs": {}}
+    result = {"sessions": 0, "files": 0, "bytesIn": 0, "bytesStored": 0}
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-pack-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(_HEADER.pack(PACK_MAGIC, PACK_VERSION, 0, 0))
+
+            def add_blob(digest, data):
+                if digest not in index["blobs"]:
+                    index["blobs"][digest] = [out.tell(), len(data)]
+                    out.write(data)
+                    result["bytesStored"] += len(data)
+
+            if existing is not None:
+                for session_id, files in existing.index["sessions"].items():
+                    if session_id in sessions or session_id in drop:
+                        continue  # re-packed from its directory below, or dropped
+                    for name, digest in files.items():
+                        offset, length = existing.index["blobs"][digest]
+                        add_blob(digest, existing._map[offset:offset + length])
+                    index["sessions"][session_id] = dict(files)
+
+            for session_id, session_dir in sorted(sessions.items()):
+                files = {}
+                for entry in sorted(os.scandir(session_dir), key=lambda e: e.name):
+                    if not entry.is_file() or entry.name.startswith('.tmp-'):
+                        continue
+                    with open(entry.path, 'rb') as f:
+                        data = f.read()
+                    digest = hashlib.sha256(data).hexdigest()
+                    add_blob(digest, data)
+                    files[entry.name] = digest
+                    result["files"] += 1
+                    result["bytesIn"] += len(data)
+                index["sessions"][session_id] = files
+                result["sessions"] += 1
+
+            index_offset = out.tell()
+            index_bytes = zlib.compress(json.dumps(index, separators=(',', ':')).encode('utf-8'))
+            out.write(index_bytes)
+            out.seek(0)
+            out.write(_HEADER.pack(PACK_MAGIC, PACK_VERSION, index_offset, len(index_bytes)))
+            out.flush()
+            os.fsync(out.fileno())
+        if index["sessions"]:
+            os.replace(tmp, path)
+        else:
+            os.remove(tmp)
+            if os.path.exists(path):
+                os.remove(path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    result["path"] = path
+    result["kept"] = len(index["sessions"])
+    return result
@@ -0,0 +1,146 @@
+"""
+Retention policies for stored sessions
+Hot sessions are removed (directory or pack entry, then their rows) when a
+policy selects them:
+
+- age            : created before now - max_age_days
+- employee quota : beyond an employee's newest max_sessions sessions
+- disk budget    : oldest sessions first while dataset/, blobs/, packs/ and
+                   thumbs/ together exceed the budget, sparing recent sessions
+                   and each employee's newest one
+
+The archive tier is left alone; months moved there have their own lifecycle.
+Everything here works in small batches so the caller can pause between them.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Tuple
+
+import database
+
+# (employee_name, session_id, created_at, pack_file or None)
+Victim = Tuple[str, str, str, str]
+
+_VICTIM_COLUMNS = '''
+    s.employee_name, s.session_id, s.created_at,
+    (SELECT p.pack_file FROM packed_sessions p
+     WHERE p.employee_name = s.employee_name AND p.session_id = s.session_id) AS pack_file
+'''
+
+
+def cutoff(days: int, now: datetime = None) -> str:
+    """created_at bound (UTC, as stored) for sessions older than days"""
+    now = now or datetime.now(timezone.utc)
+    return (now - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def expired_sessions(db_path: str, max_age_days: int, limit: int) -> List[Victim]:
+    with database.connection(db_path) as conn:
+        return [tuple(row) for row in conn.execute(f'''
+            SELECT {_VICTIM_COLUMNS} FROM sessions s
+            WHERE s.created_at < ? ORDER BY s.created_at LIMIT ?
+        ''', (cutoff(max_age_days), limit))]
+
+
+def over_quota_sessions(db_path: str, max_sessions: int, limit: int) -> List[Victim]:
+    """Sessions past each employee's newest max_sessions, oldest first"""
+    with database.connection(db_path) as conn:
+        return [tuple(row) for row in conn.execute(f'''
+            SELECT {_VICTIM_COLUMNS} FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY employee_name ORDER BY created_at DESC, id DESC
+                ) AS newest
+                FROM sessions
+            ) ranked
+            JOIN sessions s ON s.id = ranked.id
+            WHERE ranked.newest > ?
+            ORDER BY s.created_at LIMIT ?
+        ''', (max_sessions, limit))]
+
+
+def oldest_sessions(db_path: str, limit: int, min_age_days: int = 0) -> List[Victim]:
+    """Oldest sessions first, sparing those younger than min_age_days and each employee's newest"""
+    with database.connection(db_path) as conn:
+        return [tuple(row) for row in conn.execute(f'''
+            SELECT {_VICTIM_COLUMNS} FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY employee_name ORDER BY created_at DESC, id DESC
+                ) AS newest
+                FROM sessions
+            ) ranked
+            JOIN sessions s ON s.id = ranked.id
+            WHERE ranked.newest > 1 AND s.created_at < ?
+            ORDER BY s.created_at, s.id LIMIT ?
+        ''', (cutoff(min_age_days), limit))]
+
+
+def tree_size(path: str, seen: set = None) -> int:
+    """Bytes under path, counting hard-linked files once"""
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                total += st.st_size
+    return total
+
+
+def disk_usage(paths: Iterable[str]) -> int:
+    seen = set()
+    return sum(tree_size(path, seen) for path in paths)
+
+
+def old_files(root: str, older_than_days: int, limit: int) -> List[Tuple[str, int]]:
+    """Up to limit (path, size) files under root last modified before the age"""
+    horizon = time.time() - older_than_days * 86400
+    found = []
+    stack = [root]
+    while stack and len(found) < limit:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                st = entry.stat(follow_symlinks=False)
+                if st.st_mtime < horizon:
+                    found.append((entry.path, st.st_size))
+                    if len(found) >= limit:
+                        break
+    return found
+
+
+class Throttle:
+    """Paces deletions: a pause after each batch and at most mb_per_sec of removed data"""
+
+    def __init__(self, mb_per_sec: float = 0, pause_ms: int = 0):
+        self.bytes_per_sec = mb_per_sec * 1048576
+        self.pause = pause_ms / 1000
+        self.started = time.monotonic()
+        self.done = 0
+
+    def batch_done(self, nbytes: int = 0):
+        self.done += nbytes
+        if self.bytes_per_sec:
+            ahead = self.done / self.bytes_per_sec - (time.monotonic() - self.started)
+            if ahead > 0:
+                time.sleep(ahead)
+        if self.pause:
+            time.sleep(self.pause)
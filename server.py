@@ -1,18 +1,52 @@
-from flask import Flask, request, jsonify, send_from_directory, render_template
+from flask import (Flask, request, jsonify, send_from_directory, render_template, send_file, Response,
+                   stream_with_context)
 import os
 import json
 from flask_cors import CORS
 import base64
+import html
 import requests
 import time
 import hashlib
 import re
 import sqlite3
 import threading
-from datetime import datetime, timedelta
+import atexit
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import multiprocessing
 from difflib import SequenceMatcher
 import io
+import itertools
+import shutil
 from PIL import Image
+import archive
+import blobstore
+import database
+import export
+import migrations
+import packs
+import retention
+import session_rows
+import settings
+import summary_store
+import thumbnails
+from cache_backend import create_cache_backend
+from settings import BASE_DIR, get_setting, get_bool_setting, load_env as _load_env
+from session_rows import (
+    SESSION_ID_FORMAT,
+    normalize_medicine_name,
+    sanitize_name as _sanitize_name,
+    hash_document as _hash_document,
+    claim_rows as _claim_rows,
+    session_counts as _session_counts,
+    sql_timestamp as _sql_timestamp,
+    session_created_at as _session_created_at,
+    session_key as _session_key,
+    load_summary as _load_session_summary,
+    cache_rows as _collect_session_cache_rows
+)
 from claim_form_processor import (
     extract_claim_form_data,
     cross_verify_claim,
@@ -28,85 +62,40 @@ except ImportError:
     print("ERROR: PyMuPDF not installed. Install with: pip install PyMuPDF")
 
 try:
-    from dotenv import load_dotenv
+    from inotify_simple import INotify, flags as inotify_flags
 except ImportError:
-    load_dotenv = None
+    INotify = None
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 app = Flask(__name__, static_folder='static', template_folder='templates')
 CORS(app)
 
-# Database setup with enhanced caching
-DB_PATH = os.path.join(BASE_DIR, 'med_claim_data.db')
-db_lock = threading.Lock()
+# Database setup with enhanced caching (DB_PATH setting, see settings.py)
+DB_PATH = settings.DB_PATH
+
+def db_connection():
+    """Pooled, WAL-mode connection to the main database (commits on success)"""
+    return database.connection(DB_PATH)
+
+def db_write(fn, *args, wait: bool = False):
+    """
+    Run fn(conn, *args) on the single writer thread of the main database.
+    Writes are group-committed in the background; pass wait=True when the
+    write must be committed before the response is returned.
+    """
+    return database.get_writer(DB_PATH).submit(fn, *args, wait=wait)
+
+# Pending writes are committed before the process exits (registered first, so it runs last)
+atexit.register(database.stop_all_writers)
 
 def init_database():
-    """Initialize SQLite database with enhanced caching tables"""
-    with sqlite3.connect(DB_PATH) as conn:
-        # Existing tables
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS employees (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                total_sessions INTEGER DEFAULT 0,
-                total_files INTEGER DEFAULT 0,
-                total_amount REAL DEFAULT 0.0
-            )
-        ''')
-        
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_name TEXT NOT NULL,
-                session_id TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                file_count INTEGER DEFAULT 0,
-                prescription_count INTEGER DEFAULT 0,
-                bill_count INTEGER DEFAULT 0,
-                total_amount REAL DEFAULT 0.0,
-                UNIQUE(employee_name, session_id)
-            )
-        ''')
-        
-        # NEW: Document cache table for persistent extraction results
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS document_cache (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                file_hash TEXT UNIQUE NOT NULL,
-                filename TEXT NOT NULL,
-                file_type TEXT NOT NULL,
-                extraction_data TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                access_count INTEGER DEFAULT 1
-            )
-        ''')
-        
-        # NEW: Extraction memory table for learning patterns
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS extraction_memory (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                document_type TEXT NOT NULL,
-                original_text TEXT NOT NULL,
-                normalized_text TEXT NOT NULL,
-                entity_type TEXT NOT NULL,
-                confidence REAL DEFAULT 1.0,
-                times_seen INTEGER DEFAULT 1,
-                last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Indexes for performance
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_employee_name ON sessions(employee_name)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON sessions(created_at)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_file_hash ON document_cache(file_hash)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_extraction_memory_type ON extraction_memory(document_type, entity_type)')
-        
-        conn.commit()
+    """Bring the database schema up to date (see migrations.py); run at startup, not on import"""
+    migrations.migrate(DB_PATH)
 
-init_database()
+def _run_schema_backfills():
+    try:
+        migrations.run_backfills(DB_PATH)
+    except Exception as e:
+        print(f"Schema backfill error: {e}")
 
 # Enhanced API Configuration with Grounding
 GEMINI_API_VERSION = "v1beta"
@@ -124,123 +113,212 @@ GROUNDING_CONFIG = {
 }
 
 def get_api_key() -> str:
-    global _ENV_LOADED
-    if load_dotenv and not globals().get('_ENV_LOADED'):
-        load_dotenv(os.path.join(BASE_DIR, '.env'))
-        _ENV_LOADED = True
+    _load_env()
     api_key = os.getenv('GEMINI_API_KEY', '')
     # Remove quotes if present
     return api_key.strip('"').strip("'")
 
-# Enhanced Document Hash with Persistent Memory
-def _hash_document(data: bytes, filename: str = "") -> str:
-    """Create a unique hash for a document including filename"""
-    hasher = hashlib.sha256()
-    hasher.update(data)
-    if filename:
-        hasher.update(filename.encode('utf-8'))
-    return hasher.hexdigest()
-
 # Document Cache Management
+# CACHE_BACKEND selects where extraction results live: 'sqlite' (default),
+# 'sqlite-wal' for several worker processes, or 'redis' for several hosts.
+CACHE_BACKEND = get_setting('CACHE_BACKEND', 'sqlite')
+cache_backend = create_cache_backend(
+    CACHE_BACKEND,
+    DB_PATH,
+    wal_db_path=get_setting('CACHE_DB_PATH') or os.path.join(BASE_DIR, 'med_claim_cache.db'),
+    redis_url=get_setting('CACHE_REDIS_URL'),
+    redis_ttl=int(get_setting('CACHE_REDIS_TTL', '0') or 0)
+)
+
+# Cache hits only bump access statistics, so they are buffered in memory and
+# written back in one batched transaction instead of turning every read into a write.
+CACHE_STATS_FLUSH_INTERVAL = 30  # seconds
+CACHE_STATS_FLUSH_HITS = 100
+_cache_hit_stats = {}  # file_hash -> [pending_hits, last_accessed]
+_cache_hit_stats_lock = threading.Lock()
+
+def _record_cache_hit(file_hash: str):
+    """Buffer a cache hit; flush once enough hits have accumulated"""
+    with _cache_hit_stats_lock:
+        entry = _cache_hit_stats.setdefault(file_hash, [0, None])
+        entry[0] += 1
+        entry[1] = datetime.now().isoformat()
+        pending = sum(hits for hits, _ in _cache_hit_stats.values())
+    
+    if pending >= CACHE_STATS_FLUSH_HITS:
+        flush_cache_access_stats()
+
+def flush_cache_access_stats() -> int:
+    """Write buffered access statistics to the cache backend in one batch"""
+    global _cache_hit_stats
+    with _cache_hit_stats_lock:
+        pending, _cache_hit_stats = _cache_hit_stats, {}
+    
+    if not pending:
+        return 0
+    
+    try:
+        cache_backend.record_hits({file_hash: (hits, last) for file_hash, (hits, last) in pending.items()})
+        return len(pending)
+    except Exception as e:
+        print(f"Cache stats flush error: {e}")
+        # Put the hits back so they are retried on the next flush
+        with _cache_hit_stats_lock:
+            for file_hash, (hits, last) in pending.items():
+                entry = _cache_hit_stats.setdefault(file_hash, [0, last])
+                entry[0] += hits
+                entry[1] = max(entry[1] or last, last)
+        return 0
+
+def pending_cache_hits() -> int:
+    """Number of cache hits not yet written to the database"""
+    with _cache_hit_stats_lock:
+        return sum(hits for hits, _ in _cache_hit_stats.values())
+
+def _cache_stats_flusher():
+    while True:
+        time.sleep(CACHE_STATS_FLUSH_INTERVAL)
+        flush_cache_access_stats()
+
+atexit.register(flush_cache_access_stats)
+
 def get_cached_extraction(file_hash: str):
-    """Retrieve cached extraction results from database"""
+    """Retrieve cached extraction results from the cache backend"""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute('''
-                SELECT extraction_data, created_at 
-                FROM document_cache 
-                WHERE file_hash = ?
-            ''', (file_hash,))
-            
-            row = cursor.fetchone()
-            if row:
-                # Update access stats
-                conn.execute('''
-                    UPDATE document_cache 
-                    SET last_accessed = ?, access_count = access_count + 1
-                    WHERE file_hash = ?
-                ''', (datetime.now().isoformat(), file_hash))
-                conn.commit()
-                
-                extraction_data = json.loads(row['extraction_data'])
-                print(f"✅ Cache HIT for document {file_hash[:8]}...")
-                return extraction_data
-            
-            print(f"❌ Cache MISS for document {file_hash[:8]}...")
-            return None
+        extraction_data = cache_backend.get(file_hash)
+        if extraction_data is not None:
+            _record_cache_hit(file_hash)
+            print(f"✅ Cache HIT for document {file_hash[:8]}...")
+            return extraction_data
+        
+        print(f"❌ Cache MISS for document {file_hash[:8]}...")
+        return None
     except Exception as e:
         print(f"Cache retrieval error: {e}")
         return None
 
 def cache_extraction(file_hash: str, filename: str, file_type: str, extraction_data: dict):
-    """Cache extraction results in database"""
+    """Cache extraction results in the cache backend"""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO document_cache 
-                (file_hash, filename, file_type, extraction_data, created_at, last_accessed)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                file_hash,
-                filename,
-                file_type,
-                json.dumps(extraction_data),
-                datetime.now().isoformat(),
-                datetime.now().isoformat()
-            ))
-            conn.commit()
-            print(f"💾 Cached extraction for {filename}")
+        cache_backend.set(file_hash, filename, file_type, extraction_data)
+        print(f"💾 Cached extraction for {filename}")
     except Exception as e:
         print(f"Cache storage error: {e}")
 
+# Negative cache: documents whose extraction keeps failing
+NEGATIVE_CACHE_TTL = int(get_setting('NEGATIVE_CACHE_TTL', '900') or 900)  # seconds
+NEGATIVE_CACHE_FAIL_FAST_ATTEMPTS = 2
+# Failures that say nothing about the document itself (bad key, quota) are never cached
+_NON_DOCUMENT_STATUS_CODES = (401, 403, 429)
+
+def classify_extraction_error(error: Exception):
+    """Map an extraction exception to a failure class, or None if it is not document-specific"""
+    if isinstance(error, ExtractionResponseError):
+        return 'json_decode'
+    response = getattr(error, 'response', None)
+    if response is not None:
+        if response.status_code in _NON_DOCUMENT_STATUS_CODES:
+            return None
+        if 400 <= response.status_code < 500:
+            return 'api_rejected'
+    return 'api_error'
+
+def get_extraction_failure(file_hash: str):
+    try:
+        return cache_backend.get_failure(file_hash)
+    except Exception as e:
+        print(f"Negative cache lookup error: {e}")
+        return None
+
+def record_extraction_failure(file_hash: str, failure_class: str, error: str):
+    try:
+        failure = cache_backend.record_failure(file_hash, failure_class, error, NEGATIVE_CACHE_TTL)
+        print(f"🚫 Negative-cached {file_hash[:8]}... ({failure_class}, attempt {failure['attempts']})")
+        return failure
+    except Exception as e:
+        print(f"Negative cache storage error: {e}")
+        return None
+
+def clear_extraction_failure(file_hash: str = None):
+    try:
+        cache_backend.clear_failure(file_hash)
+    except Exception as e:
+        print(f"Negative cache clear error: {e}")
+
+def _failed_recently_result(filename: str, failure: dict) -> dict:
+    return {
+        "filename": filename,
+        "error": "EXTRACTION_RECENTLY_FAILED",
+        "failureClass": failure['failureClass'],
+        "attempts": failure['attempts'],
+        "retryAfter": failure['expiresAt'],
+        "prescriptionNames": [],
+        "testNames": [],
+        "billItems": []
+    }
+
+def _file_metadata(proc_file: dict) -> dict:
+    """Where a result came from, as recorded in claim_files"""
+    return {
+        "originalFilename": proc_file.get('original_filename') or proc_file['filename'],
+        "page": proc_file.get('page'),
+        "isPDF": bool(proc_file.get('is_pdf') or proc_file.get('mime') == 'application/pdf')
+    }
+
 # Learning Memory System
+LEARN_UPSERT_SQL = '''
+    INSERT INTO extraction_memory 
+    (document_type, original_text, normalized_text, entity_type, confidence, times_seen, last_seen)
+    VALUES (?, ?, ?, ?, MIN(1.0, 0.8 + 0.05 * (? - 1)), ?, ?)
+    ON CONFLICT(document_type, normalized_text, entity_type) DO UPDATE SET
+        times_seen = times_seen + excluded.times_seen,
+        confidence = MIN(1.0, confidence + 0.05 * excluded.times_seen),
+        last_seen = excluded.last_seen
+'''
+
+def _learning_rows(document_type: str, entities: list, entity_type: str) -> list:
+    """Collapse a batch of entities into one UPSERT row per normalized name"""
+    now = datetime.now().isoformat()
+    normalized_cache = {}
+    counts = {}
+    originals = {}
+    for entity in entities:
+        if isinstance(entity, dict):
+            entity_text = entity.get('name', str(entity))
+        else:
+            entity_text = str(entity)
+        
+        normalized = normalized_cache.get(entity_text)
+        if normalized is None:
+            normalized = normalized_cache[entity_text] = normalize_medicine_name(entity_text)
+        if not normalized:
+            continue
+        
+        counts[normalized] = counts.get(normalized, 0) + 1
+        originals.setdefault(normalized, entity_text)
+    
+    # New patterns start at 0.8 confidence; every sighting adds 0.05, capped at 1.0
+    return [
+        (document_type, originals[normalized], normalized, entity_type, seen, seen, now)
+        for normalized, seen in counts.items()
+    ]
+
+def _write_learned_patterns(conn, rows: list):
+    conn.executemany(LEARN_UPSERT_SQL, rows)
+
 def learn_from_extraction(document_type: str, entities: list, entity_type: str):
     """Learn and store extraction patterns for future improvements"""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            for entity in entities:
-                if isinstance(entity, dict):
-                    entity_text = entity.get('name', str(entity))
-                else:
-                    entity_text = str(entity)
-                
-                normalized = normalize_medicine_name(entity_text)
-                
-                # Check if we've seen this before
-                cursor = conn.execute('''
-                    SELECT id, times_seen, confidence 
-                    FROM extraction_memory 
-                    WHERE document_type = ? AND normalized_text = ? AND entity_type = ?
-                ''', (document_type, normalized, entity_type))
-                
-                row = cursor.fetchone()
-                if row:
-                    # Update existing entry
-                    new_times = row[1] + 1
-                    new_confidence = min(1.0, row[2] + 0.05)  # Increase confidence
-                    conn.execute('''
-                        UPDATE extraction_memory 
-                        SET times_seen = ?, confidence = ?, last_seen = ?
-                        WHERE id = ?
-                    ''', (new_times, new_confidence, datetime.now().isoformat(), row[0]))
-                else:
-                    # Create new entry
-                    conn.execute('''
-                        INSERT INTO extraction_memory 
-                        (document_type, original_text, normalized_text, entity_type, confidence)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (document_type, entity_text, normalized, entity_type, 0.8))
-            
-            conn.commit()
+        rows = _learning_rows(document_type, entities, entity_type)
+        if rows:
+            db_write(_write_learned_patterns, rows)
     except Exception as e:
         print(f"Learning error: {e}")
 
 def get_learned_patterns(document_type: str, entity_type: str, limit: int = 100):
     """Retrieve learned patterns for better extraction"""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
+        with db_connection() as conn:
             cursor = conn.execute('''
                 SELECT original_text, normalized_text, confidence, times_seen
                 FROM extraction_memory 
@@ -344,7 +422,11 @@ Extract NOW with maximum accuracy and consistency!"""
     return base_prompt
 
 # Enhanced Gemini API call with Grounding
-def call_gemini_with_grounding(image_bytes: bytes, mime: str, prompt: str, api_key: str, use_grounding: bool = True):
+class ExtractionResponseError(ValueError):
+    """The model kept returning a response that is not valid JSON"""
+
+def call_gemini_with_grounding(image_bytes: bytes, mime: str, prompt: str, api_key: str,
+                               use_grounding: bool = True, max_attempts: int = 3):
     """Enhanced Gemini API call with grounding support for medical accuracy"""
     image_b64 = base64.b64encode(image_bytes).decode('utf-8')
     
@@ -368,7 +450,7 @@ def call_gemini_with_grounding(image_bytes: bytes, mime: str, prompt: str, api_k
         body["tools"] = [GROUNDING_CONFIG]
     
     last_error = None
-    for attempt in range(3):
+    for attempt in range(max_attempts):
         try:
             r = requests.post(
                 f"{GEMINI_URL}?key={api_key}",
@@ -402,16 +484,16 @@ def call_gemini_with_grounding(image_bytes: bytes, mime: str, prompt: str, api_k
                 return result
             except json.JSONDecodeError:
                 print(f"JSON decode error on attempt {attempt + 1}")
-                if attempt == 2:
-                    return {}
+                if attempt == max_attempts - 1:
+                    raise ExtractionResponseError(f"Invalid JSON from model after {max_attempts} attempts")
                 continue
                 
         except requests.RequestException as e:
             last_error = e
-            print(f"❌ API Error (attempt {attempt + 1}/3): {str(e)[:100]}")
+            print(f"❌ API Error (attempt {attempt + 1}/{max_attempts}): {str(e)[:100]}")
             if hasattr(e, 'response') and e.response is not None:
                 print(f"   Response: {e.response.text[:200]}")
-            if attempt < 2:
+            if attempt < max_attempts - 1:
                 wait_time = 2 ** attempt  # Exponential backoff
                 print(f"   Retrying after {wait_time}s...")
                 time.sleep(wait_time)
@@ -454,17 +536,19 @@ def extract_images_from_pdf(pdf_bytes: bytes) -> list:
     return images
 
 # Enhanced File Processing with All Document Types
-def process_file_universal(file_obj) -> list:
+def process_file_universal(file_obj, force_retry: bool = False) -> list:
     """Universal file processor for images, PDFs, and Word documents"""
     filename = getattr(file_obj, 'filename', '')
     file_bytes = file_obj.read()
     mime_type = file_obj.mimetype or ''
     
     results = []
-    file_hash = _hash_document(file_bytes, filename)
+    file_hash = _hash_document(file_bytes)
+    is_pdf = mime_type == 'application/pdf' or filename.lower().endswith('.pdf')
     
-    # Check cache first
-    cached = get_cached_extraction(file_hash)
+    # Check cache first. Only page images are ever cached (live extraction and
+    # the warm-up alike), so a PDF is looked up page by page below
+    cached = None if is_pdf else get_cached_extraction(file_hash)
     if cached:
         results.append({
             'bytes': file_bytes,
@@ -478,11 +562,26 @@ def process_file_universal(file_obj) -> list:
         return results
     
     # PDF Processing
-    if mime_type == 'application/pdf' or filename.lower().endswith('.pdf'):
+    if is_pdf:
+        # A PDF that could not be rendered a moment ago will not render now
+        failure = None if force_retry else get_extraction_failure(file_hash)
+        if failure and failure['failureClass'] == 'pdf_extraction_failed':
+            results.append({
+                'bytes': None,
+                'mime': 'application/pdf',
+                'filename': filename,
+                'original_filename': filename,
+                'file_hash': file_hash,
+                'error': 'PDF_EXTRACTION_FAILED',
+                'failure': failure
+            })
+            return results
+        
         print(f"📄 Processing PDF: {filename}")
         images = extract_images_from_pdf(file_bytes)
         
         if not images:
+            record_extraction_failure(file_hash, 'pdf_extraction_failed', 'No pages could be rendered')
             results.append({
                 'bytes': None,
                 'mime': 'application/pdf',
@@ -493,15 +592,25 @@ def process_file_universal(file_obj) -> list:
             })
         else:
             for img_data in images:
-                results.append({
+                page_hash = _hash_document(img_data['bytes'])
+                page_result = {
                     'bytes': img_data['bytes'],
                     'mime': img_data['mime'],
                     'filename': f"{filename}_page_{img_data['page']}",
                     'original_filename': filename,
                     'page': img_data['page'],
-                    'file_hash': f"{file_hash}_p{img_data['page']}",
+                    'file_hash': page_hash,
                     'is_pdf': True
-                })
+                }
+                
+                # Pages are cached by their own content, so a page seen in
+                # another PDF (or restored by the warm-up) is not re-extracted
+                cached_page = get_cached_extraction(page_hash)
+                if cached_page:
+                    page_result['cached_data'] = cached_page
+                    page_result['from_cache'] = True
+                
+                results.append(page_result)
     
     # Word Document Processing - Removed (not supported)
     
@@ -519,36 +628,6 @@ def process_file_universal(file_obj) -> list:
     return results
 
 # Normalized medicine matching (keeping from original)
-def normalize_medicine_name(name):
-    """Enhanced normalize medicine names for better matching"""
-    if not name:
-        return ""
-    
-    name = name.lower().strip()
-    
-    # Remove dosage and forms
-    name = re.sub(r'\s*spf\s*\d+\s*%?\s*', ' ', name)
-    name = re.sub(r'\s*\d+\s*%\s*', ' ', name)
-    name = re.sub(r'\s*\d+\s*mg\s*', ' ', name)
-    name = re.sub(r'\s*\d+\s*gm\s*', ' ', name)
-    name = re.sub(r'\s*\d+\s*ml\s*', ' ', name)
-    name = re.sub(r'\s*\d+\s*mcg\s*', ' ', name)
-    
-    # Remove product types
-    product_types = ['tab', 'tablet', 'tabs', 'cap', 'capsule', 'caps', 'syrup', 'syp', 
-                     'inj', 'injection', 'susp', 'suspension', 'drops', 'sol', 'solution', 
-                     'cream', 'ointment', 'oint', 'lotion', 'gel', 'balm']
-    
-    words = name.split()
-    words = [w for w in words if w not in product_types]
-    name = ' '.join(words)
-    
-    # Remove special characters
-    name = re.sub(r'[^\w\s]', ' ', name)
-    name = ' '.join(name.split())
-    
-    return name
-
 def fuzzy_match_score(str1, str2):
     """Enhanced fuzzy matching with learning"""
     if not str1 or not str2:
@@ -597,39 +676,137 @@ def find_best_match(medicine_name, bill_items, threshold=0.55):
     
     return best_match, best_score
 
+# Idempotent submits: a retried request with the same Idempotency-Key gets
+# the stored response instead of creating another session
+IDEMPOTENCY_TTL_HOURS = int(get_setting('IDEMPOTENCY_TTL_HOURS', '24') or 24)
+# A pending key whose request died without finishing (e.g. the worker was
+# killed) can be taken over by a retry once its claim is this old
+IDEMPOTENCY_LEASE_SECONDS = int(get_setting('IDEMPOTENCY_LEASE_SECONDS', '600') or 600)
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+def _idempotency_fingerprint(employee, content_hashes: list, force_retry: bool) -> str:
+    hasher = hashlib.sha256(f"{employee or ''}|{int(force_retry)}".encode('utf-8'))
+    for content_hash in sorted(content_hashes):
+        hasher.update(content_hash.encode('utf-8'))
+    return hasher.hexdigest()
+
+def _write_claim_idempotency_key(conn, idem_key: str, fingerprint: str, employee):
+    """
+    Writer job: claim a key for this request; returns the existing row if it
+    is taken. created_at is the claim time, renewed when a retry takes over
+    a pending claim past its lease.
+    """
+    conn.execute("DELETE FROM idempotency_keys WHERE created_at < DATETIME('now', ?)",
+                 (f'-{IDEMPOTENCY_TTL_HOURS} hours',))
+    claimed = conn.execute('''
+        INSERT INTO idempotency_keys (idem_key, fingerprint, status, employee_name)
+        VALUES (?, ?, 'pending', ?)
+        ON CONFLICT(idem_key) DO UPDATE SET created_at = CURRENT_TIMESTAMP
+        WHERE status = 'pending' AND fingerprint = excluded.fingerprint
+          AND created_at < DATETIME('now', ?)
+    ''', (idem_key, fingerprint, employee, f'-{IDEMPOTENCY_LEASE_SECONDS} seconds')).rowcount
+    if claimed:
+        return None
+    return tuple(conn.execute('SELECT fingerprint, status, response FROM idempotency_keys WHERE idem_key = ?',
+                              (idem_key,)).fetchone())
+
+def _write_complete_idempotency_key(conn, idem_key: str, session_id, response: str):
+    conn.execute('''
+        UPDATE idempotency_keys
+        SET status = 'done', session_id = ?, response = ?, completed_at = CURRENT_TIMESTAMP
+        WHERE idem_key = ?
+    ''', (session_id, response, idem_key))
+
+def _write_release_idempotency_key(conn, idem_key: str):
+    conn.execute("DELETE FROM idempotency_keys WHERE idem_key = ? AND status = 'pending'", (idem_key,))
+
 # Main OCR endpoint with all enhancements
 @app.post('/api/ocr/auto')
 def ocr_auto():
-    api_key = get_api_key()
     employee = request.form.get('employee')
     files = request.files.getlist('files')
+    # Operators can bypass the negative cache for documents that failed recently
+    force_retry = request.form.get('forceRetry', '').lower() in ('1', 'true', 'yes')
     
     if not files:
         return jsonify({"error": "No files provided"}), 400
+    
+    content_hashes = []
+    for f in files:
+        content_hashes.append(_hash_document(f.read()))
+        f.seek(0)
+    
+    idem_key = (request.headers.get('Idempotency-Key') or '').strip()
+    if not idem_key:
+        return jsonify(_process_ocr_upload(employee, files, content_hashes, force_retry))
+    if len(idem_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return jsonify({"error": f"Idempotency-Key is longer than {IDEMPOTENCY_KEY_MAX_LENGTH} characters"}), 400
+    
+    fingerprint = _idempotency_fingerprint(employee, content_hashes, force_retry)
+    held = db_write(_write_claim_idempotency_key, idem_key, fingerprint, employee, wait=True)
+    if held:
+        held_fingerprint, status, response = held
+        if held_fingerprint != fingerprint:
+            return jsonify({"error": "Idempotency-Key was already used for a different request"}), 422
+        if status != 'done':
+            busy = jsonify({"error": "A request with this Idempotency-Key is still being processed"})
+            busy.headers['Retry-After'] = '2'
+            return busy, 409
+        print(f"♻️  Idempotent replay {idem_key[:16]}")
+        replay = app.response_class(response, mimetype='application/json')
+        replay.headers['Idempotent-Replayed'] = 'true'
+        return replay
+    
+    try:
+        summary = _process_ocr_upload(employee, files, content_hashes, force_retry)
+    except Exception:
+        # Free the key so the client can retry it
+        db_write(_write_release_idempotency_key, idem_key, wait=True)
+        raise
+    saved = summary.get('saved') or {}
+    session_id = saved.get('linkedSession') or os.path.basename(saved.get('sessionDir') or '') or None
+    db_write(_write_complete_idempotency_key, idem_key, session_id, json.dumps(summary), wait=True)
+    return jsonify(summary)
 
+def _process_ocr_upload(employee, files, content_hashes: list, force_retry: bool) -> dict:
+    """Extract, match and (with an employee) save one submitted claim; returns the summary"""
+    api_key = get_api_key()
+    
+    # Identical resubmissions (e.g. after a UI timeout) reuse the earlier result
+    memo_key = _session_memo_key(content_hashes)
+    memo = None if force_retry else get_session_memo(memo_key)
+    if memo:
+        return _answer_from_session_memo(memo, memo_key, employee)
+    
     results = []
     all_prescriptions = []
     all_bills = []
     all_tests = []
     claim_form_data = None
     session_dir = None
+    session_files = []
     
     if employee:
         session_dir = _new_session_dir(employee)
     
     # Process each file
     for f in files:
-        processed_files = process_file_universal(f)
+        processed_files = process_file_universal(f, force_retry=force_retry)
         
         for proc_file in processed_files:
             filename = proc_file['filename']
             file_hash = proc_file.get('file_hash')
+            # Only real pages are kept: anything else uploaded is never stored or served back
+            if session_dir and proc_file.get('bytes') and _sniff_page_type(proc_file['bytes']):
+                session_files.append((_sanitize_name(filename), proc_file['bytes']))
             
             # Check if we have cached data
             if proc_file.get('from_cache'):
                 cached_data = proc_file['cached_data']
                 results.append({
                     "filename": filename,
+                    **_file_metadata(proc_file),
+                    "isClaimForm": cached_data.get('type') == 'claim_form',
                     "type": cached_data.get('type'),
                     "prescriptionNames": cached_data.get('prescriptionNames', []),
                     "testNames": cached_data.get('testNames', []),
@@ -649,13 +826,17 @@ def ocr_auto():
             
             # Check for errors
             if 'error' in proc_file:
-                results.append({
+                error_result = {
                     "filename": filename,
+                    **_file_metadata(proc_file),
                     "error": proc_file['error'],
                     "prescriptionNames": [],
                     "testNames": [],
                     "billItems": []
-                })
+                }
+                if proc_file.get('failure'):
+                    error_result['retryAfter'] = proc_file['failure']['expiresAt']
+                results.append(error_result)
                 continue
             
             file_bytes = proc_file.get('bytes')
@@ -664,6 +845,12 @@ def ocr_auto():
             
             mime_type = proc_file['mime']
             
+            # Repeated failures fail fast; a single recent failure gets one degraded attempt
+            failure = None if force_retry else get_extraction_failure(file_hash)
+            if failure and failure['attempts'] >= NEGATIVE_CACHE_FAIL_FAST_ATTEMPTS:
+                results.append({**_failed_recently_result(filename, failure), **_file_metadata(proc_file)})
+                continue
+            
             # Build enhanced prompt
             enhanced_prompt = build_enhanced_prompt_with_context()
             
@@ -674,11 +861,16 @@ def ocr_auto():
                     mime_type, 
                     enhanced_prompt, 
                     api_key,
-                    use_grounding=False  # Disabled: Search Grounding requires specific API access
+                    use_grounding=False,  # Disabled: Search Grounding requires specific API access
+                    max_attempts=1 if failure else 3
                 )
             except Exception as e:
+                failure_class = classify_extraction_error(e)
+                if failure_class:
+                    record_extraction_failure(file_hash, failure_class, str(e))
                 results.append({
                     "filename": filename,
+                    **_file_metadata(proc_file),
                     "error": f"API Error: {str(e)}",
                     "prescriptionNames": [],
                     "testNames": [],
@@ -686,6 +878,9 @@ def ocr_auto():
                 })
                 continue
             
+            if failure or force_retry:
+                clear_extraction_failure(file_hash)
+            
             # Process results
             typ = data.get('type', 'unknown')
             presc_names = data.get('prescriptionNames', [])
@@ -719,6 +914,8 @@ def ocr_auto():
             
             results.append({
                 "filename": filename,
+                **_file_metadata(proc_file),
+                "isClaimForm": typ == 'claim_form',
                 "type": typ,
                 "prescriptionNames": presc_names,
                 "testNames": test_names,
@@ -755,18 +952,155 @@ def ocr_auto():
         "verification": verification_results
     }
     
+    # Only complete results are worth replaying; failed files should be retried
+    memoizable = not any(r.get('error') for r in results)
+    if memoizable:
+        store_session_memo(memo_key, summary)
+    
     if session_dir:
-        full_summary = {
-            "employee": employee,
-            "createdAt": datetime.now().isoformat(),
-            **summary
-        }
-        _save_json(os.path.join(session_dir, 'summary.json'), full_summary)
-        session_id = os.path.basename(session_dir)
-        record_session(employee, session_id, full_summary)
-        summary['saved'] = {"employee": employee, "sessionDir": os.path.relpath(session_dir, BASE_DIR)}
+        _save_session(employee, session_dir, summary, session_files)
+        if memoizable:
+            store_session_memo(memo_key, summary, employee, os.path.basename(session_dir))
+
+    return summary
+
+def _save_session(employee: str, session_dir: str, summary: dict, files: list = None):
+    """Write page images and the summary for a session, record it and mark the response as saved"""
+    full_summary = {
+        "employee": employee,
+        "createdAt": datetime.now().isoformat(),
+        **summary
+    }
+    session_id = os.path.basename(session_dir)
+    if files:
+        try:
+            blobstore.store_files(DB_PATH, BLOB_DIR, session_dir, employee, session_id, files)
+        except Exception as e:
+            print(f"Blob store error: {e}")
+        queue_thumbnails(files)
+    summary_store.write_summary(session_dir, full_summary)
+    record_session(employee, session_id, full_summary)
+    summary['saved'] = {"employee": employee, "sessionDir": os.path.relpath(session_dir, BASE_DIR)}
+
+# Session-level memoization
+MATCHING_POLICY_VERSION = '1'  # bump whenever matching or verification rules change
+
+def _session_memo_key(content_hashes: list) -> str:
+    hasher = hashlib.sha256()
+    for content_hash in sorted(content_hashes):
+        hasher.update(content_hash.encode('utf-8'))
+    hasher.update(f"policy:{MATCHING_POLICY_VERSION}".encode('utf-8'))
+    return hasher.hexdigest()
+
+def get_session_memo(memo_key: str):
+    """Return the memoized session result for a set of uploads, if any"""
+    try:
+        with db_connection() as conn:
+            row = conn.execute('''
+                SELECT employee_name, session_id, result
+                FROM session_memo
+                WHERE memo_key = ?
+            ''', (memo_key,)).fetchone()
+        if not row:
+            return None
+        return {"employee": row[0], "sessionId": row[1], "summary": json.loads(row[2])}
+    except Exception as e:
+        print(f"Session memo lookup error: {e}")
+        return None
+
+def _write_session_memo(conn, row: tuple):
+    conn.execute('''
+        INSERT OR REPLACE INTO session_memo 
+        (memo_key, employee_name, session_id, result, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', row)
+
+def store_session_memo(memo_key: str, summary: dict, employee: str = None, session_id: str = None):
+    try:
+        result = {k: v for k, v in summary.items() if k != 'saved'}
+        db_write(_write_session_memo,
+                 (memo_key, employee, session_id, json.dumps(result), datetime.now().isoformat()))
+    except Exception as e:
+        print(f"Session memo storage error: {e}")
+
+def _write_session_link(conn, row: tuple):
+    conn.execute('''
+        INSERT INTO session_links 
+        (employee_name, session_id, linked_session_id, memo_key, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', row)
+
+def _write_unlink_session(conn, employee: str, session_id: str):
+    conn.execute('DELETE FROM session_links WHERE employee_name = ? AND session_id = ?', (employee, session_id))
+
+def _session_dir_free(employee: str, session_id: str):
+    if os.path.exists(os.path.join(DATASET_DIR, _sanitize_name(employee), session_id)):
+        raise FileExistsError(session_id)
+
+def link_session(employee: str, session_id: str, linked_session_id: str, memo_key: str):
+    """
+    Record that a resubmission was answered by an existing session. The row
+    reserves session_id: raises FileExistsError when a session directory or
+    another link already uses it.
+    """
+    try:
+        db_write(_write_session_link,
+                 (employee, session_id, linked_session_id, memo_key, datetime.now().isoformat()), wait=True)
+    except sqlite3.IntegrityError:
+        raise FileExistsError(session_id)
+    except Exception as e:
+        print(f"Session link error: {e}")
+        return
+    # A directory created meanwhile checks for this row after its mkdir; one of the two sees the other
+    try:
+        _session_dir_free(employee, session_id)
+    except FileExistsError:
+        db_write(_write_unlink_session, employee, session_id, wait=True)
+        raise
+
+def _answer_from_session_memo(memo: dict, memo_key: str, employee: str = None) -> dict:
+    summary = dict(memo['summary'])
+    summary['memoized'] = True
+    print(f"♻️  Session memo HIT {memo_key[:8]}... (session {memo['sessionId'] or 'unsaved'})")
     
-    return jsonify(summary)
+    if not employee:
+        return summary
+    
+    # Same employee and the original session still exists: link instead of re-saving
+    if memo['employee'] and memo['sessionId'] and \
+            _sanitize_name(memo['employee']) == _sanitize_name(employee):
+        original_dir = os.path.join(DATASET_DIR, _sanitize_name(employee), memo['sessionId'])
+        if os.path.isdir(original_dir):
+            new_session_id = _allocate_session_id(
+                _sanitize_name(employee),
+                lambda sid: _session_dir_free(employee, sid),
+                lambda sid: link_session(employee, sid, memo['sessionId'], memo_key)
+            )
+            summary['saved'] = {
+                "employee": employee,
+                "sessionDir": os.path.relpath(original_dir, BASE_DIR),
+                "linkedSession": new_session_id
+            }
+            return summary
+    
+    # Another employee (or the original was never saved): save without recomputing
+    session_dir = _new_session_dir(employee)
+    result = {k: v for k, v in summary.items() if k != 'memoized'}
+    _save_session(employee, session_dir, result)
+    summary['saved'] = result['saved']
+    original_saved = memo['employee'] and memo['sessionId'] and os.path.isdir(
+        os.path.join(DATASET_DIR, _sanitize_name(memo['employee']), memo['sessionId']))
+    if original_saved:
+        # Same pages as the original session: reference its blobs instead of copying them
+        try:
+            blobstore.link_session_files(DB_PATH, BLOB_DIR, (memo['employee'], memo['sessionId']),
+                                         session_dir, employee, os.path.basename(session_dir))
+        except Exception as e:
+            print(f"Blob store error: {e}")
+    else:
+        # Never saved, or deleted, archived or packed since: later resubmits link to this session
+        store_session_memo(memo_key, result, employee, os.path.basename(session_dir))
+    return summary
 
 def perform_intelligent_matching(prescriptions, bill_items, tests=None):
     """Enhanced intelligent matching with deduplication and vaccination support"""
@@ -1030,77 +1364,1416 @@ def classify_consultation_fee(item_name, amount):
     return False, amount, 0.0
 
 # Helper functions
-def _sanitize_name(name: str) -> str:
-    name = (name or '').strip()
-    name = name.replace(' ', '_')
-    return re.sub(r'[^A-Za-z0-9_.\-]', '', name)[:100] or 'unknown'
-
 def _ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
+# Session ids are the start time (SESSION_ID_FORMAT), with _0001, _0002, ... for
+# further sessions of an employee in the same second. They sort in allocation
+# order, and the first 15 characters still parse as the start time.
+_session_id_lock = threading.Lock()
+_last_session_ids = {}  # employee dir -> last id this process allocated
+
+def _allocate_session_id(emp: str, reserve=None, claim=None) -> str:
+    """
+    Next session id for an employee dir, never below one already handed out
+    (even if the clock steps back). reserve(session_id) runs under the lock
+    and must stay cheap (an os.mkdir); claim(session_id) runs after the lock
+    is released and may do database work. Either raises FileExistsError when
+    another process took the id first, and the next id is tried.
+    """
+    while True:
+        with _session_id_lock:
+            session_id = _next_session_id(emp, reserve)
+        try:
+            if claim:
+                claim(session_id)
+            return session_id
+        except FileExistsError:
+            continue
+
+def _next_session_id(emp: str, reserve=None) -> str:
+    # Called with _session_id_lock held
+    stamp = datetime.now().strftime(SESSION_ID_FORMAT)
+    seq = 0
+    last = _last_session_ids.get(emp)
+    if last and last[:15] >= stamp:
+        stamp, seq = last[:15], int(last[16:] or 0) + 1
+    while True:
+        session_id = f'{stamp}_{seq:04d}' if seq else stamp
+        try:
+            if reserve:
+                reserve(session_id)
+        except FileExistsError:
+            seq += 1
+            continue
+        _last_session_ids[emp] = session_id
+        return session_id
+
+def _claim_session_dir(employee: str, emp_dir: str, session_id: str):
+    # mkdir (under the lock) is atomic, so concurrent workers never share a
+    # directory; ids handed to memo links are reserved in session_links instead
+    with db_connection() as conn:
+        linked = conn.execute('SELECT 1 FROM session_links WHERE employee_name = ? AND session_id = ?',
+                              (employee, session_id)).fetchone()
+    if linked:
+        os.rmdir(os.path.join(emp_dir, session_id))
+        raise FileExistsError(session_id)
+
 def _new_session_dir(employee: str) -> str:
-    emp = _sanitize_name(employee)
-    ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-    path = os.path.join(DATASET_DIR, emp, ts)
-    _ensure_dir(path)
-    return path
+    """Create the directory of a new session under a collision-free id"""
+    emp_dir = os.path.join(DATASET_DIR, _sanitize_name(employee))
+    _ensure_dir(emp_dir)
+    session_id = _allocate_session_id(_sanitize_name(employee),
+                                      lambda sid: os.mkdir(os.path.join(emp_dir, sid)),
+                                      lambda sid: _claim_session_dir(employee, emp_dir, sid))
+    return os.path.join(emp_dir, session_id)
 
-def _save_json(path: str, obj: dict):
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
+# Totals as recomputed from session facts (hot sessions plus archived days), used to check the triggers
+EMPLOYEE_TOTALS_SQL = '''
+    SELECT employee_name AS name,
+           SUM(sessions) AS total_sessions,
+           COALESCE(SUM(files), 0) AS total_files,
+           COALESCE(SUM(amount), 0.0) AS total_amount,
+           MAX(last_activity) AS last_activity
+    FROM session_facts
+'''
+
+def _write_employee_stats(conn, employee_name):
+    """Recompute one employee's totals from scratch (repair path only)"""
+    row = conn.execute(EMPLOYEE_TOTALS_SQL + ' WHERE employee_name = ? GROUP BY employee_name',
+                       (employee_name,)).fetchone()
+    if row:
+        conn.execute('''
+            INSERT INTO employees (name, total_sessions, total_files, total_amount, last_activity)
+            VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            ON CONFLICT(name) DO UPDATE SET
+                total_sessions = excluded.total_sessions,
+                total_files = excluded.total_files,
+                total_amount = excluded.total_amount,
+                last_activity = excluded.last_activity
+        ''', (employee_name, row["total_sessions"], row["total_files"],
+              row["total_amount"], row["last_activity"]))
+    else:
+        conn.execute('''
+            UPDATE employees SET total_sessions = 0, total_files = 0, total_amount = 0.0
+            WHERE name = ?
+        ''', (employee_name,))
 
 def update_employee_stats(employee_name):
-    """Update employee statistics"""
-    with db_lock:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.execute('''
-                SELECT COUNT(*) as total_sessions, 
-                       SUM(file_count) as total_files, 
-                       SUM(total_amount) as total_amount,
-                       MAX(created_at) as last_activity
-                FROM sessions 
-                WHERE employee_name = ?
-            ''', (employee_name,))
-            
-            row = cursor.fetchone()
-            if row:
-                total_sessions, total_files, total_amount, last_activity = row
-                
-                conn.execute('''
-                    INSERT OR REPLACE INTO employees 
-                    (name, total_sessions, total_files, total_amount, last_activity)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (employee_name, total_sessions or 0, total_files or 0, 
-                      total_amount or 0.0, last_activity or datetime.now().isoformat()))
-                
-                conn.commit()
+    """Recompute employee statistics from the sessions table"""
+    db_write(_write_employee_stats, employee_name)
+
+# Line items of a claim (rows built by session_rows.claim_rows)
+def _write_claim_rows(conn, employee_name, session_id, claim_rows: dict):
+    """Replace the line-item rows of one session"""
+    key = (employee_name, session_id)
+    for table in ('claim_files', 'claim_bill_items', 'claim_matches', 'claim_item_names'):
+        conn.execute(f'DELETE FROM {table} WHERE employee_name = ? AND session_id = ?', key)
+    
+    created_ts = conn.execute(
+        'SELECT created_ts FROM sessions WHERE employee_name = ? AND session_id = ?', key
+    ).fetchone()
+    created_ts = created_ts[0] if created_ts else int(time.time())
+    
+    conn.executemany('''
+        INSERT INTO claim_files 
+        (employee_name, session_id, file_index, filename, original_filename, file_type, page,
+         is_pdf, is_claim_form, bill_item_count, prescription_count, error, created_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(*key, *row, created_ts) for row in claim_rows["files"]])
+    conn.executemany('''
+        INSERT INTO claim_bill_items 
+        (employee_name, session_id, file_index, item_index, name, normalized_name, amount,
+         is_consultation, is_test, created_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(*key, *row, created_ts) for row in claim_rows["billItems"]])
+    conn.executemany('''
+        INSERT INTO claim_matches 
+        (employee_name, session_id, kind, prescription_name, bill_item_name, normalized_name, amount,
+         admissible_amount, excess_amount, match_score, status, reason, created_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(*key, *row, created_ts) for row in claim_rows["matches"]])
+    # The FTS index follows claim_item_names through triggers
+    conn.executemany('''
+        INSERT INTO claim_item_names 
+        (employee_name, session_id, kind, name, normalized_name, amount, created_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(*key, *row, created_ts) for row in claim_rows.get("names", [])])
+
+def _write_session(conn, employee_name, session_id, counts: tuple, claim_rows: dict = None,
+                   created_at: str = None):
+    # UPSERT rather than INSERT OR REPLACE: REPLACE deletes silently, without
+    # firing the delete trigger, which would double-count a re-recorded session
+    conn.execute('''
+        INSERT INTO sessions 
+        (employee_name, session_id, file_count, prescription_count, bill_count, total_amount, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ON CONFLICT(employee_name, session_id) DO UPDATE SET
+            file_count = excluded.file_count,
+            prescription_count = excluded.prescription_count,
+            bill_count = excluded.bill_count,
+            total_amount = excluded.total_amount
+    ''', (employee_name, session_id, *counts, created_at))
+    if claim_rows is not None:
+        _write_claim_rows(conn, employee_name, session_id, claim_rows)
 
 def record_session(employee_name, session_id, summary_data):
-    """Record session in database"""
-    with db_lock:
-        with sqlite3.connect(DB_PATH) as conn:
-            file_count = len(summary_data.get('files', []))
-            
-            aggregated = summary_data.get('aggregated', {})
-            prescription_count = len(aggregated.get('prescriptions', []))
-            bill_count = len(aggregated.get('bills', []))
+    """Record session and its line items; committed before returning so listings see it"""
+    db_write(_write_session, employee_name, session_id, _session_counts(summary_data),
+             _claim_rows(summary_data), wait=True)
+    journal_dataset_change(_sanitize_name(employee_name), session_id, 'create')
+
+# Periodic check of the incrementally maintained employee totals
+EMPLOYEE_RECONCILE_INTERVAL = int(get_setting('EMPLOYEE_RECONCILE_INTERVAL', '3600') or 0)
+AMOUNT_TOLERANCE = 0.005
+
+def _employee_drift(conn) -> list:
+    expected = {row["name"]: row for row in conn.execute(EMPLOYEE_TOTALS_SQL + ' GROUP BY employee_name')}
+    drift = []
+    for row in conn.execute('''
+        SELECT name, total_sessions, total_files, total_amount, last_activity FROM employees
+    '''):
+        want = expected.pop(row["name"], None)
+        want_sessions = want["total_sessions"] if want else 0
+        want_files = want["total_files"] if want else 0
+        want_amount = want["total_amount"] if want else 0.0
+        if (row["total_sessions"] != want_sessions or row["total_files"] != want_files
+                or abs((row["total_amount"] or 0.0) - want_amount) > AMOUNT_TOLERANCE
+                or (want and row["last_activity"] != want["last_activity"])):
+            drift.append({
+                "employee": row["name"],
+                "stored": [row["total_sessions"], row["total_files"], row["total_amount"]],
+                "expected": [want_sessions, want_files, want_amount]
+            })
+    # Sessions whose employee row is missing altogether
+    for name, want in expected.items():
+        drift.append({
+            "employee": name,
+            "stored": None,
+            "expected": [want["total_sessions"], want["total_files"], want["total_amount"]]
+        })
+    return drift
+
+def _write_reconcile(conn, repair: bool) -> tuple:
+    drift = _employee_drift(conn)
+    if repair:
+        for entry in drift:
+            _write_employee_stats(conn, entry["employee"])
+    # Checked after the employee repair, which can change the employee count
+    rollups = migrations.rollup_drift(conn)
+    if repair and rollups:
+        migrations.rebuild_rollups(conn)
+    return drift, rollups
+
+def reconcile_employee_stats(repair: bool = True) -> dict:
+    """
+    Verify employee totals and analytics rollups against the sessions table
+    and, if asked, repair what drifted. Runs on the writer so no session can
+    land between the check and the repair.
+    """
+    started = time.time()
+    drift, rollups = db_write(_write_reconcile, repair, wait=True)
+    if drift:
+        print(f"⚠️  Employee totals drifted for {len(drift)} employee(s){' - repaired' if repair else ''}")
+    if rollups:
+        print(f"⚠️  Rollups drifted: {', '.join(rollups)}{' - rebuilt' if repair else ''}")
+    return {
+        "checkedAt": datetime.now().isoformat(),
+        "drifted": len(drift),
+        "repaired": len(drift) if repair else 0,
+        "details": drift[:50],
+        "rollupsDrifted": rollups,
+        "seconds": round(time.time() - started, 3)
+    }
+
+def _employee_reconciler():
+    while True:
+        time.sleep(EMPLOYEE_RECONCILE_INTERVAL)
+        try:
+            reconcile_employee_stats()
+        except Exception as e:
+            print(f"Employee reconcile error: {e}")
+
+DATASET_DIR = os.path.join(BASE_DIR, 'dataset')
+
+# Page images and uploads are stored once in a content-addressed blob store (see blobstore.py)
+BLOB_DIR = get_setting('BLOB_DIR') or os.path.join(BASE_DIR, 'blobs')
+
+def collect_blob_garbage() -> dict:
+    """Remove blobs no session references any more; run after sessions are deleted"""
+    try:
+        # Previews of dropped pages would never be served again
+        result = blobstore.gc(DB_PATH, BLOB_DIR,
+                              on_drop=lambda digest: thumbnails.remove_variants(THUMBNAIL_DIR, digest))
+        if result["blobs"]:
+            print(f"🗑️  Blob GC: removed {result['blobs']} blob(s), {result['bytes'] / 1048576:.1f} MB freed")
+        return result
+    except Exception as e:
+        print(f"Blob GC error: {e}")
+        return {"error": str(e)}
+
+def dedup_dataset(dataset_dir: str = None) -> dict:
+    """Move files already in dataset/ into the blob store, replacing copies with links"""
+    dataset_dir = dataset_dir or DATASET_DIR
+    result = {"sessions": 0, "files": 0, "bytes": 0, "alreadyLinked": 0}
+    for session_dir in _list_session_dirs(dataset_dir):
+        summary = _load_session_summary(session_dir) or {}
+        employee, session_id = _session_key(session_dir, summary)
+        ingested = blobstore.ingest_session_dir(DB_PATH, BLOB_DIR, session_dir, employee, session_id)
+        result["sessions"] += 1
+        for key in ("files", "bytes", "alreadyLinked"):
+            result[key] += ingested[key]
+    database.get_writer(DB_PATH).flush()
+    result["store"] = blobstore.stats(DB_PATH)
+    return result
+
+# Cold archive tier (see archive.py): months older than ARCHIVE_AFTER_MONTHS
+ARCHIVE_DIR = get_setting('ARCHIVE_DIR') or os.path.join(BASE_DIR, 'archive')
+ARCHIVE_AFTER_MONTHS = int(get_setting('ARCHIVE_AFTER_MONTHS', '6') or 6)
+ARCHIVE_INTERVAL = int(get_setting('ARCHIVE_INTERVAL', '0') or 0)  # seconds; 0 = manual only
+_archive_lock = threading.Lock()
+
+def archive_old_sessions(older_than_months: int = None, dry_run: bool = False) -> dict:
+    """Move sessions and session directories older than the configured age to the archive"""
+    if not _archive_lock.acquire(blocking=False):
+        return {"error": "Archiving already running"}
+    try:
+        months = ARCHIVE_AFTER_MONTHS if older_than_months is None else older_than_months
+        result = archive.archive_older_than(DB_PATH, DATASET_DIR, ARCHIVE_DIR, months, dry_run=dry_run)
+        if result["archived"]:
+            result["blobGc"] = collect_blob_garbage()
+        return result
+    finally:
+        _archive_lock.release()
+
+def _archiver():
+    while True:
+        time.sleep(ARCHIVE_INTERVAL)
+        try:
+            archive_old_sessions()
+        except Exception as e:
+            print(f"Archive error: {e}")
+
+# Packed sessions (see packs.py): completed sessions older than PACK_AFTER_DAYS
+# leave dataset/ for one pack file per employee-month
+PACK_DIR = get_setting('PACK_DIR') or os.path.join(BASE_DIR, 'packs')
+PACK_AFTER_DAYS = int(get_setting('PACK_AFTER_DAYS', '30') or 30)
+_pack_lock = threading.Lock()
+
+def _write_packed(conn, rows: list):
+    """rows: (employee_dir, session_id, employee_name, pack_file, files)"""
+    conn.executemany('''
+        INSERT INTO packed_sessions (employee_dir, session_id, employee_name, pack_file, files)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(employee_dir, session_id) DO UPDATE SET
+            pack_file = excluded.pack_file,
+            files = excluded.files,
+            packed_at = CURRENT_TIMESTAMP
+    ''', rows)
+    # The pack holds these bytes now, so the blob store can let go of them
+    conn.executemany('DELETE FROM blob_refs WHERE employee_name = ? AND session_id = ?',
+                     [(row[2], row[1]) for row in rows])
+
+def pack_old_sessions(older_than_days: int = None, dry_run: bool = False) -> dict:
+    """Fold completed sessions older than the configured age into per employee-month packs"""
+    if not _pack_lock.acquire(blocking=False):
+        return {"error": "Packing already running"}
+    try:
+        days = PACK_AFTER_DAYS if older_than_days is None else older_than_days
+        groups = packs.candidate_sessions(DATASET_DIR, days,
+                                          lambda session_dir: summary_store.summary_path(session_dir) is not None)
+        result = {"olderThanDays": days, "sessions": sum(len(s) for s in groups.values()), "packs": []}
+        if dry_run:
+            result["packs"] = [{"employee": employee_dir, "month": month, "sessions": len(sessions)}
+                               for (employee_dir, month), sessions in sorted(groups.items())]
+            return result
+        
+        for (employee_dir, month), sessions in sorted(groups.items()):
+            path = packs.pack_path(PACK_DIR, employee_dir, month)
+            written = packs.write_pack(path, sessions)
+            rows = []
+            for session_id, session_dir in sessions.items():
+                employee = _session_key(session_dir, _load_session_summary(session_dir) or {})[0]
+                rows.append((employee_dir, session_id, employee, os.path.relpath(path, PACK_DIR),
+                             len(os.listdir(session_dir))))
+            db_write(_write_packed, rows, wait=True)
             
-            total_amount = 0
-            for bill in aggregated.get('bills', []):
-                for item in bill.get('items', []):
-                    total_amount += item.get('amount', 0)
+            # Only remove the directories once the pack is recorded
+            for session_dir in sessions.values():
+                shutil.rmtree(session_dir, ignore_errors=True)
+            employee_path = os.path.join(DATASET_DIR, employee_dir)
+            if os.path.isdir(employee_path) and not os.listdir(employee_path):
+                os.rmdir(employee_path)
             
-            conn.execute('''
-                INSERT OR REPLACE INTO sessions 
-                (employee_name, session_id, file_count, prescription_count, bill_count, total_amount)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (employee_name, session_id, file_count, prescription_count, bill_count, total_amount))
+            print(f"📦 Packed {written['sessions']} session(s) of {employee_dir} {month}: "
+                  f"{written['bytesIn'] / 1048576:.1f} MB -> {written['bytesStored'] / 1048576:.1f} MB")
+            result["packs"].append({"employee": employee_dir, "month": month, **written})
+        
+        if result["packs"]:
+            result["blobGc"] = collect_blob_garbage()
+        return result
+    finally:
+        _pack_lock.release()
+
+def _packed_session(employee_dir: str, session_id: str):
+    """Reader of the pack holding a session, or None if the session is not packed"""
+    with db_connection() as conn:
+        row = conn.execute('''
+            SELECT pack_file FROM packed_sessions WHERE employee_dir = ? AND session_id = ?
+        ''', (employee_dir, session_id)).fetchone()
+    if not row:
+        return None
+    reader = packs.open_pack(os.path.join(PACK_DIR, row[0]))
+    return reader if reader and session_id in reader.index["sessions"] else None
+
+def _packed_summary(reader, session_id: str):
+    for name in summary_store.SUMMARY_FILES:
+        data = reader.read(session_id, name)
+        if data is not None:
+            return summary_store.reader_from_bytes(name, data)
+    return None
+
+def _read_session_summary(employee_dir: str, session_id: str):
+    """A session's summary from its directory, or from its pack once packed"""
+    session_dir = os.path.join(DATASET_DIR, employee_dir, session_id)
+    if os.path.isdir(session_dir):
+        return _load_session_summary(session_dir)
+    reader = _packed_session(employee_dir, session_id)
+    summary = _packed_summary(reader, session_id) if reader else None
+    return summary.summary() if summary else None
+
+# Page thumbnails and previews (see thumbnails.py), rendered off the request path
+THUMBNAIL_DIR = get_setting('THUMBNAIL_DIR') or os.path.join(BASE_DIR, 'thumbs')
+THUMBNAIL_WORKERS = int(get_setting('THUMBNAIL_WORKERS', '1') or 1)
+PAGE_CACHE_MAX_AGE = 365 * 24 * 3600
+_thumbnail_executor = ThreadPoolExecutor(max_workers=max(1, THUMBNAIL_WORKERS), thread_name_prefix='thumbnails')
+
+def _render_thumbnails(files: list):
+    for name, data in files:
+        try:
+            thumbnails.ensure_all(THUMBNAIL_DIR, data)
+        except Exception as e:
+            print(f"Thumbnail error ({name}): {e}")
+
+def queue_thumbnails(files: list):
+    """Render previews of (name, bytes) pages in the background"""
+    if files:
+        _thumbnail_executor.submit(_render_thumbnails, files)
+
+def render_dataset_thumbnails() -> dict:
+    """Render missing previews for every stored page, in directories and packs"""
+    result = {"pages": 0, "rendered": 0, "skipped": 0}
+    keys = [(os.path.basename(os.path.dirname(d)), os.path.basename(d)) for d in _list_session_dirs(DATASET_DIR)]
+    with db_connection() as conn:
+        keys += [(row[0], row[1]) for row in conn.execute('SELECT employee_dir, session_id FROM packed_sessions')]
+    for employee_dir, session_id in keys:
+        source = _session_source(employee_dir, session_id)
+        if source is None:
+            continue
+        for name in source.names:
+            if name.endswith(('.json', '.jsonz')):
+                continue
+            result["pages"] += 1
+            data = source.read(name)
+            digest = source.digest(name, data)
+            if all(os.path.exists(thumbnails.variant_path(THUMBNAIL_DIR, digest, v)) for v in thumbnails.VARIANTS):
+                result["skipped"] += 1
+            elif thumbnails.ensure_all(THUMBNAIL_DIR, data, digest).get('thumb'):
+                result["rendered"] += 1
+    return result
+
+# Retention (see retention.py): old and over-quota sessions, stale cache rows and
+# idle previews are removed by a low-priority background job. 0 disables a policy.
+RETENTION_MAX_AGE_DAYS = int(get_setting('RETENTION_MAX_AGE_DAYS', '0') or 0)
+RETENTION_MAX_SESSIONS_PER_EMPLOYEE = int(get_setting('RETENTION_MAX_SESSIONS_PER_EMPLOYEE', '0') or 0)
+RETENTION_DISK_BUDGET_MB = int(get_setting('RETENTION_DISK_BUDGET_MB', '0') or 0)
+RETENTION_CACHE_DAYS = int(get_setting('RETENTION_CACHE_DAYS', '0') or 0)  # by last access
+RETENTION_THUMBNAIL_DAYS = int(get_setting('RETENTION_THUMBNAIL_DAYS', '0') or 0)  # re-rendered on demand
+RETENTION_INTERVAL = int(get_setting('RETENTION_INTERVAL', '0') or 0)  # seconds; 0 = manual only
+RETENTION_BATCH_SIZE = int(get_setting('RETENTION_BATCH_SIZE', '50') or 50)
+RETENTION_BATCH_PAUSE_MS = int(get_setting('RETENTION_BATCH_PAUSE_MS', '200') or 0)
+RETENTION_IO_MB_PER_SEC = float(get_setting('RETENTION_IO_MB_PER_SEC', '20') or 0)
+RETENTION_MAX_BUDGET_ROUNDS = 100
+# Budget deletions spare recent sessions and each employee's newest one, and stop
+# once a batch frees less than this (the rest of the usage is not sessions)
+RETENTION_MIN_AGE_DAYS = int(get_setting('RETENTION_MIN_AGE_DAYS', '7') or 0)
+RETENTION_MIN_FREED_MB = float(get_setting('RETENTION_MIN_FREED_MB', '1') or 0)
+_retention_lock = threading.Lock()
+_retention_last_run = None
+
+def retention_policy() -> dict:
+    return {
+        "maxAgeDays": RETENTION_MAX_AGE_DAYS,
+        "maxSessionsPerEmployee": RETENTION_MAX_SESSIONS_PER_EMPLOYEE,
+        "diskBudgetMb": RETENTION_DISK_BUDGET_MB,
+        "minAgeDays": RETENTION_MIN_AGE_DAYS,
+        "cacheDays": RETENTION_CACHE_DAYS,
+        "thumbnailDays": RETENTION_THUMBNAIL_DAYS,
+        "intervalSeconds": RETENTION_INTERVAL,
+        "batchSize": RETENTION_BATCH_SIZE
+    }
+
+def _storage_dirs() -> list:
+    return [DATASET_DIR, BLOB_DIR, PACK_DIR, THUMBNAIL_DIR]
+
+def _write_forget_sessions(conn, keys: list, employees: list):
+    """Writer job: drop deleted sessions with everything that points at them"""
+    _write_remove_sessions(conn, keys, employees)
+    conn.executemany('DELETE FROM packed_sessions WHERE employee_name = ? AND session_id = ?', keys)
+    conn.executemany('DELETE FROM session_memo WHERE employee_name = ? AND session_id = ?', keys)
+
+def _delete_sessions(victims: list) -> int:
+    """
+    Remove sessions' directories and pack entries, then their rows. Files go
+    first: an interrupted run leaves rows without files, which the next sync
+    drops, never files that a sync would record again. Returns bytes removed.
+    """
+    removed = 0
+    by_pack = {}
+    pack_digests = set()
+    for employee, session_id, _, pack_file in victims:
+        if pack_file:
+            by_pack.setdefault(pack_file, set()).add(session_id)
+            continue
+        session_dir = os.path.join(DATASET_DIR, _sanitize_name(employee), session_id)
+        removed += retention.tree_size(session_dir)
+        shutil.rmtree(session_dir, ignore_errors=True)
+        employee_path = os.path.dirname(session_dir)
+        if os.path.isdir(employee_path) and not os.listdir(employee_path):
+            os.rmdir(employee_path)
+    with _pack_lock:
+        for pack_file, session_ids in by_pack.items():
+            path = os.path.join(PACK_DIR, pack_file)
+            reader = packs.open_pack(path)
+            if reader is None:
+                continue
+            before = reader.size
+            sessions = reader.index["sessions"]
+            dropped = {digest for sid in session_ids for digest in sessions.get(sid, {}).values()}
+            dropped -= {digest for sid, files in sessions.items() if sid not in session_ids
+                        for digest in files.values()}
+            packs.write_pack(path, {}, drop=session_ids)
+            removed += before - (os.path.getsize(path) if os.path.exists(path) else 0)
+            pack_digests.update(dropped)
+    keys = [(employee, session_id) for employee, session_id, _, _ in victims]
+    db_write(_write_forget_sessions, keys, sorted({key[0] for key in keys}), wait=True)
+    
+    # Previews of pages no pack or blob holds any more; blob-backed ones go with blob GC
+    if pack_digests:
+        with db_connection() as conn:
+            live = {row[0] for row in conn.execute(
+                f"SELECT digest FROM blobs WHERE refs > 0 AND digest IN ({', '.join('?' * len(pack_digests))})",
+                list(pack_digests))}
+        for digest in pack_digests - live:
+            removed += thumbnails.remove_variants(THUMBNAIL_DIR, digest)
+    return removed
+
+def _apply_session_policy(name: str, select, result: dict, throttle) -> int:
+    """Delete the sessions select(limit) returns, a batch at a time, until it returns none"""
+    deleted = 0
+    while True:
+        victims = select(RETENTION_BATCH_SIZE)
+        if not victims:
+            break
+        removed = _delete_sessions(victims)
+        deleted += len(victims)
+        result["sessions"] += len(victims)
+        result["sessionBytes"] += removed
+        throttle.batch_done(removed)
+    if deleted:
+        result["byPolicy"][name] = deleted
+    return deleted
+
+def run_retention(dry_run: bool = False) -> dict:
+    """One pass of every enabled retention policy"""
+    global _retention_last_run
+    if not _retention_lock.acquire(blocking=False):
+        return {"error": "Retention already running"}
+    try:
+        started = time.time()
+        result = {"policy": retention_policy(), "dryRun": dry_run, "sessions": 0, "sessionBytes": 0,
+                  "byPolicy": {}, "cacheRows": 0, "thumbnails": 0, "thumbnailBytes": 0}
+        if dry_run:
+            if RETENTION_MAX_AGE_DAYS:
+                result["byPolicy"]["age"] = len(retention.expired_sessions(DB_PATH, RETENTION_MAX_AGE_DAYS, 10 ** 6))
+            if RETENTION_MAX_SESSIONS_PER_EMPLOYEE:
+                result["byPolicy"]["quota"] = len(retention.over_quota_sessions(
+                    DB_PATH, RETENTION_MAX_SESSIONS_PER_EMPLOYEE, 10 ** 6))
+            if RETENTION_DISK_BUDGET_MB:
+                result["diskBytes"] = retention.disk_usage(_storage_dirs())
+            return result
+        
+        throttle = retention.Throttle(RETENTION_IO_MB_PER_SEC, RETENTION_BATCH_PAUSE_MS)
+        if RETENTION_CACHE_DAYS:
+            accessed_before = (datetime.now() - timedelta(days=RETENTION_CACHE_DAYS)).strftime('%Y-%m-%d')
+            while True:
+                pruned = cache_backend.prune(accessed_before, RETENTION_BATCH_SIZE * 20)
+                result["cacheRows"] += pruned
+                if pruned < RETENTION_BATCH_SIZE * 20:
+                    break
+                throttle.batch_done()
+        
+        if RETENTION_THUMBNAIL_DAYS:
+            while True:
+                files = retention.old_files(THUMBNAIL_DIR, RETENTION_THUMBNAIL_DAYS, RETENTION_BATCH_SIZE * 20)
+                for path, size in files:
+                    try:
+                        os.remove(path)
+                        result["thumbnails"] += 1
+                        result["thumbnailBytes"] += size
+                    except FileNotFoundError:
+                        pass
+                throttle.batch_done(sum(size for _, size in files))
+                if len(files) < RETENTION_BATCH_SIZE * 20:
+                    break
+        
+        if RETENTION_MAX_AGE_DAYS:
+            _apply_session_policy('age', lambda limit: retention.expired_sessions(
+                DB_PATH, RETENTION_MAX_AGE_DAYS, limit), result, throttle)
+        if RETENTION_MAX_SESSIONS_PER_EMPLOYEE:
+            _apply_session_policy('quota', lambda limit: retention.over_quota_sessions(
+                DB_PATH, RETENTION_MAX_SESSIONS_PER_EMPLOYEE, limit), result, throttle)
+        if result["sessions"]:
+            result["blobGc"] = collect_blob_garbage()
+        
+        if RETENTION_DISK_BUDGET_MB:
+            budget = RETENTION_DISK_BUDGET_MB * 1048576
+            usage = retention.disk_usage(_storage_dirs())
+            rounds = 0
+            # Deleting a session frees its blobs only once no other session shares them,
+            # so usage is measured again after each batch and its blob GC
+            while usage > budget and rounds < RETENTION_MAX_BUDGET_ROUNDS:
+                victims = retention.oldest_sessions(DB_PATH, RETENTION_BATCH_SIZE, RETENTION_MIN_AGE_DAYS)
+                if not victims:
+                    break
+                removed = _delete_sessions(victims)
+                collect_blob_garbage()
+                result["sessions"] += len(victims)
+                result["sessionBytes"] += removed
+                result["byPolicy"]["budget"] = result["byPolicy"].get("budget", 0) + len(victims)
+                before, usage = usage, retention.disk_usage(_storage_dirs())
+                rounds += 1
+                throttle.batch_done(removed)
+                if before - usage < RETENTION_MIN_FREED_MB * 1048576:
+                    # What is left over budget is not held by deletable sessions
+                    result["budgetStopped"] = "batch freed too little"
+                    break
+            result["diskBytes"] = usage
+            result["overBudget"] = usage > budget
+        
+        result["seconds"] = round(time.time() - started, 2)
+        if result["sessions"] or result["cacheRows"] or result["thumbnails"]:
+            print(f"🧹 Retention: removed {result['sessions']} session(s) "
+                  f"({result['sessionBytes'] / 1048576:.1f} MB) {result['byPolicy']}, "
+                  f"{result['cacheRows']} cache row(s), {result['thumbnails']} preview(s) "
+                  f"({result['thumbnailBytes'] / 1048576:.1f} MB)")
+        _retention_last_run = {"finishedAt": datetime.now().isoformat(), **result}
+        return result
+    finally:
+        _retention_lock.release()
+
+def _retention_worker():
+    # Deletion is background housekeeping: on Linux this lowers only this thread's priority
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (AttributeError, OSError):
+        pass
+    while True:
+        time.sleep(RETENTION_INTERVAL)
+        try:
+            run_retention()
+        except Exception as e:
+            print(f"Retention error: {e}")
+
+# Cache warm-up from the dataset tree
+CACHE_WARMUP_WORKERS = 4
+CACHE_WARMUP_BATCH_SIZE = 500
+_warmup_lock = threading.Lock()
+_warmup_status = {
+    "running": False,
+    "sessionsTotal": 0,
+    "sessionsScanned": 0,
+    "pagesFound": 0,
+    "inserted": 0,
+    "startedAt": None,
+    "finishedAt": None,
+    "error": None
+}
+
+def _list_session_dirs(dataset_dir: str) -> list:
+    session_dirs = []
+    if not os.path.isdir(dataset_dir):
+        return session_dirs
+    for emp_entry in os.scandir(dataset_dir):
+        if not emp_entry.is_dir():
+            continue
+        for sess_entry in os.scandir(emp_entry.path):
+            if sess_entry.is_dir():
+                session_dirs.append(sess_entry.path)
+    return session_dirs
+
+def _insert_warmup_rows(rows: list) -> int:
+    # Never overwrite entries produced by a live extraction
+    return cache_backend.add_many(rows)
+
+def warm_cache_from_dataset(dataset_dir: str = None, workers: int = CACHE_WARMUP_WORKERS,
+                            batch_size: int = CACHE_WARMUP_BATCH_SIZE) -> dict:
+    """Populate document_cache from extraction results already stored under dataset/"""
+    if not _warmup_lock.acquire(blocking=False):
+        return {"error": "Warm-up already running"}
+    _begin_warmup()
+    return _warm_cache(dataset_dir, workers, batch_size)
+
+def _begin_warmup():
+    # Called with _warmup_lock held, so the status reads "running" from the moment a warm-up is claimed
+    _warmup_status.update({
+        "running": True,
+        "sessionsTotal": 0,
+        "sessionsScanned": 0,
+        "pagesFound": 0,
+        "inserted": 0,
+        "startedAt": datetime.now().isoformat(),
+        "finishedAt": None,
+        "error": None
+    })
+
+def _warm_cache(dataset_dir: str, workers: int, batch_size: int) -> dict:
+    # Runs with _warmup_lock held and releases it when done
+    dataset_dir = dataset_dir or DATASET_DIR
+    try:
+        session_dirs = _list_session_dirs(dataset_dir)
+        started = time.time()
+        _warmup_status["sessionsTotal"] = len(session_dirs)
+        print(f"🔥 Cache warm-up: scanning {len(session_dirs)} sessions in {dataset_dir}")
+        
+        progress_every = max(1, len(session_dirs) // 10)
+        pending_rows = []
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for rows in executor.map(_collect_session_cache_rows, session_dirs):
+                pending_rows.extend(rows)
+                _warmup_status["sessionsScanned"] += 1
+                _warmup_status["pagesFound"] += len(rows)
+                
+                # Insert in small batches so request threads are never held up for long
+                if len(pending_rows) >= batch_size:
+                    _warmup_status["inserted"] += _insert_warmup_rows(pending_rows)
+                    pending_rows = []
+                
+                scanned = _warmup_status["sessionsScanned"]
+                if scanned % progress_every == 0 or scanned == len(session_dirs):
+                    print(f"   Warm-up progress: {scanned}/{len(session_dirs)} sessions, "
+                          f"{_warmup_status['pagesFound']} pages, {_warmup_status['inserted']} cached")
+        
+        if pending_rows:
+            _warmup_status["inserted"] += _insert_warmup_rows(pending_rows)
+        
+        elapsed = time.time() - started
+        print(f"✅ Cache warm-up finished in {elapsed:.1f}s: {_warmup_status['inserted']} new cache entries")
+    except Exception as e:
+        _warmup_status["error"] = str(e)
+        print(f"Cache warm-up error: {e}")
+    finally:
+        _warmup_status["running"] = False
+        _warmup_status["finishedAt"] = datetime.now().isoformat()
+        _warmup_lock.release()
+    
+    return dict(_warmup_status)
+
+def start_cache_warmup(dataset_dir: str = None) -> bool:
+    """Run the warm-up on a background thread; returns False if one is already running"""
+    # Check, mark and spawn under the lock the warm-up holds, so two callers never both start one
+    if not _warmup_lock.acquire(blocking=False):
+        return False
+    _begin_warmup()
+    try:
+        threading.Thread(
+            target=_warm_cache,
+            args=(dataset_dir, CACHE_WARMUP_WORKERS, CACHE_WARMUP_BATCH_SIZE),
+            name='cache-warmup',
+            daemon=True
+        ).start()
+    except Exception:
+        _warmup_status["running"] = False
+        _warmup_lock.release()
+        raise
+    return True
+
+# Full-text search over item names (claim_item_fts)
+SEARCH_MODES = ('prefix', 'phrase', 'fuzzy')
+SEARCH_KINDS = ('bill_item', 'prescription', 'test')
+SEARCH_MAX_PAGE_SIZE = 100
+FUZZY_CANDIDATES = 500
+FUZZY_MIN_SCORE = 0.6
+
+# snippet() marks matches with control characters; the item text is OCR output,
+# so it is HTML-escaped before the markers become <mark> tags
+SNIPPET_OPEN, SNIPPET_CLOSE = '\x02', '\x03'
+
+def _snippet_html(snippet: str):
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(SNIPPET_OPEN, '<mark>').replace(SNIPPET_CLOSE, '</mark>')
+
+def _fts_quote(token: str) -> str:
+    return '"' + token.replace('"', '""') + '"'
+
+def _fts_query(query: str, mode: str):
+    """Translate user input into an FTS5 MATCH expression; None if nothing searchable"""
+    tokens = re.findall(r'\w+', query.lower())
+    if not tokens:
+        return None
+    if mode == 'phrase':
+        return _fts_quote(' '.join(tokens))
+    if mode == 'fuzzy':
+        # Broad candidate set: each normalized word by a short prefix, any word may match
+        words = normalize_medicine_name(query).split() or tokens
+        return ' OR '.join(_fts_quote(w[:max(2, min(len(w) - 1, 4))]) + '*' for w in words)
+    return ' AND '.join(_fts_quote(t) + '*' for t in tokens)
+
+def search_claim_items(query: str, mode: str = 'prefix', kind: str = None, employee: str = None,
+                       limit: int = 20, offset: int = 0) -> dict:
+    """Search item names across all sessions; newest-best first with highlight snippets"""
+    match = _fts_query(query, mode)
+    if match is None:
+        return {"results": [], "total": 0}
+    
+    filters, params = '', [match]
+    if kind:
+        filters += ' AND n.kind = ?'
+        params.append(kind)
+    if employee:
+        filters += ' AND n.employee_name = ?'
+        params.append(employee)
+    
+    sql = f'''
+        SELECT n.id, n.kind, n.name, n.normalized_name, n.amount, n.employee_name, n.session_id,
+               n.created_ts, snippet(claim_item_fts, 0, ?, ?, '…', 12) AS snippet,
+               bm25(claim_item_fts, 10.0, 5.0) AS rank
+        FROM claim_item_fts
+        JOIN claim_item_names n ON n.id = claim_item_fts.rowid
+        WHERE claim_item_fts MATCH ?{filters}
+        ORDER BY rank, n.created_ts DESC
+    '''
+    markers = (SNIPPET_OPEN, SNIPPET_CLOSE)
+    with db_connection() as conn:
+        if mode == 'fuzzy':
+            # Re-rank a bounded candidate set with the same scorer used for matching
+            rows = conn.execute(sql + ' LIMIT ?', (*markers, *params, FUZZY_CANDIDATES)).fetchall()
+            scored = []
+            for row in rows:
+                score = fuzzy_match_score(query, row['name'])
+                if score >= FUZZY_MIN_SCORE:
+                    scored.append((score, row))
+            scored.sort(key=lambda pair: (-pair[0], -(pair[1]['created_ts'] or 0)))
+            total = len(scored)
+            page = [(row, score) for score, row in scored[offset:offset + limit]]
+        else:
+            total = conn.execute(f'''
+                SELECT COUNT(*) FROM claim_item_fts
+                JOIN claim_item_names n ON n.id = claim_item_fts.rowid
+                WHERE claim_item_fts MATCH ?{filters}
+            ''', params).fetchone()[0]
+            rows = conn.execute(sql + ' LIMIT ? OFFSET ?', (*markers, *params, limit, offset)).fetchall()
+            page = [(row, None) for row in rows]
+    
+    results = []
+    for row, score in page:
+        entry = {
+            "kind": row['kind'],
+            "name": row['name'],
+            "normalized": row['normalized_name'],
+            "amount": row['amount'],
+            "employee": row['employee_name'],
+            "sessionId": row['session_id'],
+            "createdAt": datetime.fromtimestamp(row['created_ts']).isoformat() if row['created_ts'] else None,
+            "snippet": _snippet_html(row['snippet'])
+        }
+        if score is not None:
+            entry["score"] = round(score, 3)
+        results.append(entry)
+    return {"results": results, "total": total}
+
+# Employee search: NOCASE index for prefixes, trigram FTS5 (employee_fts) for substrings.
+# Relevance is exact 1.0, prefix 0.9, word start 0.7, other substring 0.5; ties
+# go to the employee with more sessions, so ranking is done in SQL over every hit
+TRIGRAM_MIN_LENGTH = 3
+EMPLOYEE_PREFIX_SORT_MAX = 1000  # prefix hits ranked in place; wider ranges walk idx_employees_rank
+EMPLOYEE_SEARCH_COLUMNS = 'e.id, e.name, e.total_sessions, e.total_files, e.total_amount, e.last_activity'
+# Name with word separators as spaces and a leading space: ' ' || query finds word starts
+EMPLOYEE_WORDS_SQL = "' ' || REPLACE(REPLACE(REPLACE(LOWER(e.name), '_', ' '), '.', ' '), '-', ' ')"
+
+def _employee_prefix_rows(conn, query: str, limit: int) -> list:
+    bounds = (query, query + '\uffff')
+    in_range = conn.execute('''
+        SELECT COUNT(*) FROM (
+            SELECT 1 FROM employees WHERE name >= ? COLLATE NOCASE AND name < ? COLLATE NOCASE LIMIT ?
+        )
+    ''', (*bounds, EMPLOYEE_PREFIX_SORT_MAX + 1)).fetchone()[0]
+    if in_range <= EMPLOYEE_PREFIX_SORT_MAX:
+        # Narrow range: walk idx_employees_name_nocase and rank every hit
+        return conn.execute(f'''
+            SELECT {EMPLOYEE_SEARCH_COLUMNS},
+                   CASE WHEN e.name = ? COLLATE NOCASE THEN 1.0 ELSE 0.9 END AS relevance
+            FROM employees e
+            WHERE e.name >= ? COLLATE NOCASE AND e.name < ? COLLATE NOCASE
+            ORDER BY relevance DESC, e.total_sessions DESC, e.name COLLATE NOCASE
+            LIMIT ?
+        ''', (query, *bounds, limit)).fetchall()
+    
+    # Wide range (short queries): exact match first, then walk idx_employees_rank in
+    # rank order and stop at the limit instead of sorting the whole range
+    rows = conn.execute(f'''
+        SELECT {EMPLOYEE_SEARCH_COLUMNS}, 1.0 AS relevance
+        FROM employees e WHERE e.name = ? COLLATE NOCASE
+        ORDER BY e.total_sessions DESC LIMIT ?
+    ''', (query, limit)).fetchall()
+    if len(rows) < limit:
+        rows += conn.execute(f'''
+            SELECT {EMPLOYEE_SEARCH_COLUMNS}, 0.9 AS relevance
+            FROM employees e INDEXED BY idx_employees_rank
+            WHERE e.name > ? COLLATE NOCASE AND e.name < ? COLLATE NOCASE
+            ORDER BY e.total_sessions DESC, e.name COLLATE NOCASE
+            LIMIT ?
+        ''', (*bounds, limit - len(rows))).fetchall()
+    return rows
+
+def _employee_search_rows(conn, query: str, limit: int) -> list:
+    rows = _employee_prefix_rows(conn, query, limit)
+    
+    # Substring hits always rank below prefix hits, so only look when the page isn't full
+    if len(query) >= TRIGRAM_MIN_LENGTH and len(rows) < limit:
+        words = ' ' + re.sub(r'[_.\-]', ' ', query)
+        rows += conn.execute(f'''
+            SELECT {EMPLOYEE_SEARCH_COLUMNS},
+                   CASE WHEN INSTR({EMPLOYEE_WORDS_SQL}, ?) > 0 THEN 0.7 ELSE 0.5 END AS relevance
+            FROM employee_fts
+            JOIN employees e ON e.id = employee_fts.rowid
+            WHERE employee_fts MATCH ?
+              AND NOT (e.name >= ? COLLATE NOCASE AND e.name < ? COLLATE NOCASE)
+            ORDER BY relevance DESC, e.total_sessions DESC, e.name COLLATE NOCASE
+            LIMIT ?
+        ''', (words, _fts_quote(query), query, query + '\uffff', limit - len(rows))).fetchall()
+    return rows
+
+def search_employees_indexed(query: str, limit: int = 20) -> list:
+    """Ranked employee lookup: exact, then prefix, then word start, then substring"""
+    query = query.strip().lower()
+    if not query:
+        return []
+    with db_connection() as conn:
+        rows = _employee_search_rows(conn, query, limit)
+    return [{
+        'name': row['name'],
+        'sessionCount': row['total_sessions'],
+        'fileCount': row['total_files'],
+        'totalAmount': row['total_amount'],
+        'lastActivity': row['last_activity'],
+        'relevance': row['relevance']
+    } for row in rows]
+
+# Line-item backfill from the dataset tree
+def _record_session_dir(session_dir: str, summary: dict) -> dict:
+    """Queue a stored session (and its line items) for recording; returns the line-item rows"""
+    employee, session_id = _session_key(session_dir, summary)
+    claim_rows = _claim_rows(summary)
+    db_write(_write_session, employee, session_id, _session_counts(summary), claim_rows,
+             _session_created_at(session_dir, summary))
+    return claim_rows
+
+def backfill_claim_items(dataset_dir: str = None, force: bool = False) -> dict:
+    """
+    Record every session under dataset/ with its line items. Sessions that
+    already have line-item rows are skipped unless force is set. Writes are
+    queued to the writer, which commits them in small group transactions.
+    """
+    dataset_dir = dataset_dir or DATASET_DIR
+    started = time.time()
+    with db_connection() as conn:
+        # A recorded session has one claim_files row per file (none if it has no files)
+        done = {(row[0], row[1]) for row in conn.execute('''
+            SELECT s.employee_name, s.session_id FROM sessions s
+            WHERE s.file_count = 0 OR EXISTS (
+                SELECT 1 FROM claim_files f
+                WHERE f.employee_name = s.employee_name AND f.session_id = s.session_id
+            )
+        ''')}
+    
+    result = {"sessionsScanned": 0, "sessionsRecorded": 0, "skipped": 0, "billItems": 0, "matches": 0}
+    for session_dir in _list_session_dirs(dataset_dir):
+        result["sessionsScanned"] += 1
+        summary = _load_session_summary(session_dir)
+        if summary is None:
+            result["skipped"] += 1
+            continue
+        
+        employee, session_id = _session_key(session_dir, summary)
+        if not force and (employee, session_id) in done:
+            result["skipped"] += 1
+            continue
+        
+        claim_rows = _record_session_dir(session_dir, summary)
+        result["sessionsRecorded"] += 1
+        result["billItems"] += len(claim_rows["billItems"])
+        result["matches"] += len(claim_rows["matches"])
+    
+    database.get_writer(DB_PATH).flush()
+    result["seconds"] = round(time.time() - started, 2)
+    print(f"✅ Line-item backfill: {result['sessionsRecorded']} sessions, "
+          f"{result['billItems']} bill items, {result['matches']} match rows")
+    return result
+
+# Bulk import of whole dataset trees (manage.py import-dataset)
+IMPORT_BATCH_SIZE = 500
+IMPORT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+def _import_key(dataset_dir: str, session_dir: str) -> str:
+    return os.path.relpath(session_dir, dataset_dir).replace(os.sep, '/')
+
+def _write_import_batch(conn, dataset_dir: str, batch: list, last_key: str = None):
+    """
+    One transaction per batch; the checkpoint commits with the rows it covers.
+    The final batch (last_key None) drops the checkpoint so the next run starts over.
+    """
+    for parsed in batch:
+        _write_session(conn, parsed["employee"], parsed["sessionId"], parsed["counts"],
+                       parsed["claimRows"], parsed["createdAt"])
+    if last_key is None:
+        conn.execute('DELETE FROM import_checkpoints WHERE dataset_dir = ?', (dataset_dir,))
+        return
+    conn.execute('''
+        INSERT INTO import_checkpoints (dataset_dir, last_session, sessions, updated_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(dataset_dir) DO UPDATE SET
+            last_session = excluded.last_session,
+            sessions = sessions + excluded.sessions,
+            updated_at = excluded.updated_at
+    ''', (dataset_dir, last_key, len(batch)))
+
+def bulk_import_dataset(dataset_dir: str = None, workers: int = IMPORT_WORKERS,
+                        batch_size: int = IMPORT_BATCH_SIZE, resume: bool = True,
+                        with_cache: bool = True) -> dict:
+    """
+    Import every session directory under dataset_dir: summaries are parsed in
+    a process pool, then sessions and line items are written batch_size
+    sessions per transaction and page extractions go to the document cache.
+    With resume, sessions up to the checkpoint of an interrupted run are
+    skipped; a run that completes removes its checkpoint.
+    """
+    dataset_dir = os.path.abspath(dataset_dir or DATASET_DIR)
+    session_dirs = sorted(_list_session_dirs(dataset_dir), key=lambda d: _import_key(dataset_dir, d))
+    
+    resume_after = None
+    if resume:
+        with db_connection() as conn:
+            row = conn.execute('SELECT last_session FROM import_checkpoints WHERE dataset_dir = ?',
+                               (dataset_dir,)).fetchone()
+        resume_after = row[0] if row else None
+    todo = [d for d in session_dirs if resume_after is None or _import_key(dataset_dir, d) > resume_after]
+    
+    result = {
+        "dataset": dataset_dir,
+        "resumedAfter": resume_after,
+        "sessionsFound": len(session_dirs),
+        "sessionsImported": 0,
+        "skipped": 0,
+        "lineItems": 0,
+        "cacheRows": 0,
+        "batches": 0
+    }
+    writer = database.get_writer(DB_PATH)
+    batch, cache_rows = [], []
+    
+    def commit(last_key=None):
+        writer.submit(_write_import_batch, dataset_dir, list(batch), last_key, wait=True)
+        if cache_rows:
+            cache_backend.add_many(cache_rows)
+        if batch:
+            result["batches"] += 1
+        batch.clear()
+        cache_rows.clear()
+    
+    # Spawned, not forked: this process already runs the writer and other
+    # threads, and a forked child could inherit one of their locks held
+    context = multiprocessing.get_context('spawn')
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=context) as pool:
+        parse = partial(session_rows.parse_session, with_cache=with_cache)
+        for session_dir, parsed in zip(todo, pool.map(parse, todo, chunksize=16)):
+            last_key = _import_key(dataset_dir, session_dir)
+            if parsed is None:
+                result["skipped"] += 1
+                continue
+            rows = parsed.pop("cacheRows")
+            batch.append(parsed)
+            cache_rows.extend(rows)
+            result["sessionsImported"] += 1
+            result["lineItems"] += len(parsed["claimRows"]["billItems"])
+            result["cacheRows"] += len(rows)
+            if len(batch) >= batch_size:
+                commit(last_key)
+                elapsed = time.perf_counter() - started
+                print(f"📥 Imported {result['sessionsImported']}/{len(todo)} sessions "
+                      f"({result['sessionsImported'] / elapsed:.0f}/s)")
+    commit()
+    
+    elapsed = time.perf_counter() - started
+    result["seconds"] = round(elapsed, 2)
+    result["sessionsPerSec"] = round(result["sessionsImported"] / elapsed, 1) if elapsed else 0.0
+    return result
+
+# Database <-> dataset/ reconciliation
+def _write_remove_sessions(conn, keys: list, employees: list):
+    conn.executemany('DELETE FROM sessions WHERE employee_name = ? AND session_id = ?', keys)
+    conn.executemany('''
+        DELETE FROM employees
+        WHERE name = ? AND total_sessions <= 0
+          AND NOT EXISTS (SELECT 1 FROM archived_daily WHERE employee_name = employees.name)
+    ''', [(name,) for name in employees])
+
+def sync_database_with_filesystem(dataset_dir: str = None) -> dict:
+    """
+    Make the sessions table match the session directories on disk: record
+    directories the database does not know and drop rows whose directory is gone.
+    """
+    dataset_dir = dataset_dir or DATASET_DIR
+    on_disk = {}
+    for session_dir in _list_session_dirs(dataset_dir):
+        emp_dir, session_id = os.path.split(session_dir)
+        on_disk[(os.path.basename(emp_dir), session_id)] = session_dir
+    
+    with db_connection() as conn:
+        recorded = [(row[0], row[1]) for row in conn.execute('SELECT employee_name, session_id FROM sessions')]
+        packed = {(row[0], row[1]) for row in conn.execute('SELECT employee_dir, session_id FROM packed_sessions')}
+    known = {(_sanitize_name(emp), sess) for emp, sess in recorded}
+    
+    removed = [(emp, sess) for emp, sess in recorded
+               if (_sanitize_name(emp), sess) not in on_disk and (_sanitize_name(emp), sess) not in packed]
+    added = 0
+    for key, session_dir in on_disk.items():
+        if key in known:
+            continue
+        summary = _load_session_summary(session_dir)
+        if summary is not None:
+            _record_session_dir(session_dir, summary)
+            added += 1
+    
+    if removed:
+        db_write(_write_remove_sessions, removed, sorted({emp for emp, _ in removed}))
+        database.get_writer(DB_PATH).flush()
+        collect_blob_garbage()
+    # Everything is current now: settle the journal and the directory mtimes
+    names = {_sanitize_name(emp): emp for emp, _ in recorded}
+    dirs = [(entry.name, names.get(entry.name), entry.stat().st_mtime_ns) for entry in os.scandir(dataset_dir)
+            if entry.is_dir()] if os.path.isdir(dataset_dir) else []
+    db_write(_write_sync_marks, None, dirs, True)
+    database.get_writer(DB_PATH).flush()
+    if added or removed:
+        print(f"🔄 Sync: {added} session(s) recorded, {len(removed)} removed")
+    return {"added": added, "removed": len(removed)}
+
+# Incremental sync: only directories named in the change journal, or whose
+# mtime moved since the last sync, are compared with the database
+DATASET_WATCH = get_bool_setting('DATASET_WATCH')
+DATASET_WATCH_DELAY_MS = int(get_setting('DATASET_WATCH_DELAY_MS', '2000') or 0)
+DATASET_JOURNAL_KEEP_DAYS = 30
+SESSION_ID_BATCH = 500
+_dataset_sync_lock = threading.Lock()
+_dataset_watcher = None
+
+def _write_journal(conn, entries: list):
+    conn.executemany('''
+        INSERT INTO dataset_journal (employee_dir, session_id, op, source) VALUES (?, ?, ?, ?)
+    ''', entries)
+
+def journal_dataset_change(employee_dir: str, session_id: str, op: str, source: str = 'server'):
+    """Append a session create/delete to the change journal (session_id None = whole employee dir)"""
+    db_write(_write_journal, [(employee_dir, session_id, op, source)])
+
+def _write_sync_marks(conn, journal_upto, dirs: list, replace_all: bool = False):
+    if replace_all:
+        conn.execute('UPDATE dataset_journal SET applied_at = CURRENT_TIMESTAMP WHERE applied_at IS NULL')
+        conn.execute('DELETE FROM dataset_dirs')
+    elif journal_upto:
+        conn.execute('''
+            UPDATE dataset_journal SET applied_at = CURRENT_TIMESTAMP WHERE applied_at IS NULL AND id <= ?
+        ''', (journal_upto,))
+    conn.executemany('''
+        INSERT INTO dataset_dirs (employee_dir, employee_name, mtime_ns, synced_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(employee_dir) DO UPDATE SET
+            employee_name = COALESCE(excluded.employee_name, employee_name),
+            mtime_ns = excluded.mtime_ns,
+            synced_at = excluded.synced_at
+    ''', [d for d in dirs if d[2] is not None])
+    conn.executemany('DELETE FROM dataset_dirs WHERE employee_dir = ?', [(d[0],) for d in dirs if d[2] is None])
+    conn.execute("DELETE FROM dataset_journal WHERE applied_at < DATETIME('now', ?)",
+                 (f'-{DATASET_JOURNAL_KEEP_DAYS} days',))
+
+def _changed_employee_dirs(conn, dataset_dir: str) -> dict:
+    """Employee dir -> current mtime_ns (None if gone) for dirs that changed since the last sync"""
+    known = dict(conn.execute('SELECT employee_dir, mtime_ns FROM dataset_dirs').fetchall())
+    changed = {}
+    if os.path.isdir(dataset_dir):
+        for entry in os.scandir(dataset_dir):
+            if entry.is_dir():
+                mtime_ns = entry.stat().st_mtime_ns
+                if known.pop(entry.name, None) != mtime_ns:
+                    changed[entry.name] = mtime_ns
+    changed.update((name, None) for name in known)
+    return changed
+
+def _recorded_sessions(conn, employee_dir: str, session_ids: list) -> dict:
+    """session_id -> employee_name of recorded sessions stored under employee_dir"""
+    recorded = {}
+    for start in range(0, len(session_ids), SESSION_ID_BATCH):
+        batch = session_ids[start:start + SESSION_ID_BATCH]
+        for row in conn.execute(f'''
+            SELECT employee_name, session_id FROM sessions WHERE session_id IN ({', '.join('?' * len(batch))})
+        ''', batch):
+            if _sanitize_name(row[0]) == employee_dir:
+                recorded[row[1]] = row[0]
+    return recorded
+
+def _sync_employee_dir(conn, dataset_dir: str, employee_dir: str, only: set = None):
+    """
+    Compare one employee directory with the database, or just the sessions in
+    only. Returns (sessions recorded, (employee, session) keys to remove, employee name).
+    """
+    emp_path = os.path.join(dataset_dir, employee_dir)
+    on_disk = {}
+    if os.path.isdir(emp_path):
+        for entry in os.scandir(emp_path):
+            if entry.is_dir() and (only is None or entry.name in only):
+                on_disk[entry.name] = entry.path
+    
+    row = conn.execute('SELECT employee_name FROM dataset_dirs WHERE employee_dir = ?', (employee_dir,)).fetchone()
+    names = {row[0]} if row and row[0] else set()
+    if not names and only is None and not on_disk:
+        # Directory gone before its owner was ever noted: find it among the employees
+        names = {r[0] for r in conn.execute('SELECT name FROM employees') if _sanitize_name(r[0]) == employee_dir}
+    recorded = _recorded_sessions(conn, employee_dir, sorted(on_disk if only is None else only))
+    names.update(recorded.values())
+    if only is None and names:
+        for rec in conn.execute(f'''
+            SELECT employee_name, session_id FROM sessions WHERE employee_name IN ({', '.join('?' * len(names))})
+        ''', sorted(names)):
+            recorded.setdefault(rec[1], rec[0])
+    
+    added = 0
+    for session_id, session_dir in on_disk.items():
+        if session_id in recorded:
+            continue
+        summary = _load_session_summary(session_dir)
+        if summary is not None:
+            _record_session_dir(session_dir, summary)
+            names.add(_session_key(session_dir, summary)[0])
+            added += 1
+    # Packed sessions have no directory but are still live
+    packed = {row[0] for row in conn.execute(
+        'SELECT session_id FROM packed_sessions WHERE employee_dir = ?', (employee_dir,))}
+    removed = [(emp, sess) for sess, emp in recorded.items() if sess not in on_disk and sess not in packed]
+    return added, removed, min(names) if names else None
+
+def sync_dataset_changes(dataset_dir: str = None, scan_dirs: bool = None) -> dict:
+    """
+    Apply pending journal entries and, unless the watcher keeps the journal
+    complete, re-check employee dirs whose mtime changed. Untouched
+    directories are never opened.
+    """
+    dataset_dir = dataset_dir or DATASET_DIR
+    if scan_dirs is None:
+        scan_dirs = _dataset_watcher is None
+    
+    with _dataset_sync_lock:
+        database.get_writer(DB_PATH).flush()  # journal entries still queued
+        with db_connection() as conn:
+            pending = conn.execute('''
+                SELECT id, employee_dir, session_id FROM dataset_journal WHERE applied_at IS NULL ORDER BY id
+            ''').fetchall()
+            changed = _changed_employee_dirs(conn, dataset_dir) if scan_dirs else {}
+            sessions_by_dir = {}
+            for entry in pending:
+                if entry['session_id'] is None:
+                    path = os.path.join(dataset_dir, entry['employee_dir'])
+                    changed.setdefault(entry['employee_dir'],
+                                       os.stat(path).st_mtime_ns if os.path.isdir(path) else None)
+                else:
+                    sessions_by_dir.setdefault(entry['employee_dir'], set()).add(entry['session_id'])
             
-            conn.commit()
+            added, removed, dirs = 0, [], []
+            for employee_dir, mtime_ns in changed.items():
+                dir_added, dir_removed, name = _sync_employee_dir(conn, dataset_dir, employee_dir)
+                added += dir_added
+                removed.extend(dir_removed)
+                dirs.append((employee_dir, name, mtime_ns))
+            for employee_dir, session_ids in sessions_by_dir.items():
+                if employee_dir in changed:
+                    continue
+                dir_added, dir_removed, _ = _sync_employee_dir(conn, dataset_dir, employee_dir, session_ids)
+                added += dir_added
+                removed.extend(dir_removed)
+        
+        if removed:
+            db_write(_write_remove_sessions, removed, sorted({emp for emp, _ in removed}))
+        if pending or dirs:
+            db_write(_write_sync_marks, pending[-1]['id'] if pending else None, dirs)
+        database.get_writer(DB_PATH).flush()
+        if removed:
+            collect_blob_garbage()
     
-    update_employee_stats(employee_name)
+    if added or removed:
+        print(f"🔄 Incremental sync: {added} session(s) recorded, {len(removed)} removed "
+              f"({len(changed)} employee dir(s), {len(pending)} journal entries)")
+    return {
+        "added": added,
+        "removed": len(removed),
+        "journalEntries": len(pending),
+        "directoriesScanned": len(changed) + len([d for d in sessions_by_dir if d not in changed])
+    }
 
-DATASET_DIR = os.path.join(BASE_DIR, 'dataset')
+def _add_watch(inotify, watches: dict, path: str, key: tuple, mask=None):
+    if mask is None:
+        mask = inotify_flags.CREATE | inotify_flags.DELETE | inotify_flags.MOVED_FROM | inotify_flags.MOVED_TO
+    try:
+        watches[inotify.add_watch(path, mask)] = key
+    except OSError:
+        pass
+
+def _watch_dataset(inotify, watches: dict):
+    """
+    Journal out-of-band edits under dataset/: employee and session dirs being
+    created, removed or moved, and the summary landing in a new session dir.
+    Events are batched for DATASET_WATCH_DELAY_MS before each sync.
+    watches maps wd -> (employee_dir, session_id); (None, None) is dataset/ itself.
+    """
+    while True:
+        entries = []
+        for event in inotify.read(read_delay=DATASET_WATCH_DELAY_MS):
+            if event.mask & inotify_flags.IGNORED:
+                watches.pop(event.wd, None)
+                continue
+            if event.wd not in watches:
+                continue
+            employee_dir, session_id = watches[event.wd]
+            created = bool(event.mask & (inotify_flags.CREATE | inotify_flags.MOVED_TO))
+            is_dir = bool(event.mask & inotify_flags.ISDIR)
+            if session_id is not None:
+                # Session dir created while watching: its summary has arrived
+                if event.name in summary_store.SUMMARY_FILES and not is_dir:
+                    entries.append((employee_dir, session_id, 'create', 'watcher'))
+                    inotify.rm_watch(event.wd)
+            elif employee_dir is None and is_dir:
+                if created:
+                    _add_watch(inotify, watches, os.path.join(DATASET_DIR, event.name), (event.name, None))
+                entries.append((event.name, None, 'create' if created else 'delete', 'watcher'))
+            elif employee_dir is not None and is_dir:
+                if created:
+                    _add_watch(inotify, watches, os.path.join(DATASET_DIR, employee_dir, event.name),
+                               (employee_dir, event.name), inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO)
+                entries.append((employee_dir, event.name, 'create' if created else 'delete', 'watcher'))
+        if entries:
+            db_write(_write_journal, entries)
+            try:
+                sync_dataset_changes(scan_dirs=False)
+            except Exception as e:
+                print(f"Dataset sync error: {e}")
+
+def start_dataset_watcher() -> bool:
+    """Start the inotify watcher thread (Linux, optional inotify_simple package)"""
+    global _dataset_watcher
+    if _dataset_watcher is not None:
+        return True
+    if INotify is None:
+        print("⚠️  DATASET_WATCH needs inotify_simple (pip install inotify_simple); using mtime scans")
+        return False
+    _ensure_dir(DATASET_DIR)
+    inotify, watches = INotify(), {}
+    _add_watch(inotify, watches, DATASET_DIR, (None, None))
+    for entry in os.scandir(DATASET_DIR):
+        if entry.is_dir():
+            _add_watch(inotify, watches, entry.path, (entry.name, None))
+    # Watches are in place; catch up on anything that changed while nobody was watching
+    sync_dataset_changes(scan_dirs=True)
+    _dataset_watcher = threading.Thread(target=_watch_dataset, args=(inotify, watches),
+                                        name='dataset-watcher', daemon=True)
+    _dataset_watcher.start()
+    return True
+
+# Dataset listing: metadata from the database, summaries only on request
+DATASET_PAGE_LIMIT = 1000
+
+def _encode_cursor(*values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor: str):
+    """[sort value, name] from a nextCursor, or None if it is not one we issued"""
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        return None
+    if (isinstance(value, list) and len(value) == 2 and isinstance(value[1], str)
+            and (value[0] is None or isinstance(value[0], (str, int, float)))):
+        return value
+    return None
+
+def _iso_utc(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+def _conditional_json(etag: str, build):
+    """304 when the client's copy is current; otherwise build the body and tag it"""
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _listing_etag(*parts) -> str:
+    return hashlib.sha1(json.dumps(parts, default=str).encode('utf-8')).hexdigest()[:20]
+
+def _employee_page(conn, limit: int, offset: int, cursor):
+    rows_sql = '''
+        SELECT name, total_sessions, total_files, total_amount, last_activity
+        FROM employees
+    '''
+    if cursor:
+        rows = conn.execute(rows_sql + '''
+            WHERE (last_activity, name) < (?, ?)
+            ORDER BY last_activity DESC, name DESC LIMIT ?
+        ''', (cursor[0], cursor[1], limit)).fetchall()
+    else:
+        rows = conn.execute(rows_sql + ' ORDER BY last_activity DESC, name DESC LIMIT ? OFFSET ?',
+                            (limit, offset)).fetchall()
+    return [{
+        'name': row['name'],
+        'sessionCount': row['total_sessions'],
+        'fileCount': row['total_files'],
+        'totalAmount': row['total_amount'],
+        'lastActivity': row['last_activity']
+    } for row in rows]
+
+def _session_page(conn, employee: str, limit: int, offset: int, cursor):
+    rows_sql = '''
+        SELECT s.session_id, s.created_at, s.created_ts, s.file_count, s.prescription_count,
+               s.bill_count, s.total_amount,
+               (SELECT COUNT(*) FROM claim_bill_items b
+                WHERE b.employee_name = s.employee_name AND b.session_id = s.session_id) AS bill_item_count,
+               (SELECT COUNT(*) FROM claim_item_names n
+                WHERE n.employee_name = s.employee_name AND n.session_id = s.session_id
+                  AND n.kind = 'prescription') AS medicine_count
+        FROM sessions s
+        WHERE s.employee_name = ?
+    '''
+    if cursor:
+        rows = conn.execute(rows_sql + '''
+            AND (s.created_at, s.session_id) < (?, ?)
+            ORDER BY s.created_at DESC, s.session_id DESC LIMIT ?
+        ''', (employee, cursor[0], cursor[1], limit)).fetchall()
+    else:
+        rows = conn.execute(rows_sql + ' ORDER BY s.created_at DESC, s.session_id DESC LIMIT ? OFFSET ?',
+                            (employee, limit, offset)).fetchall()
+    return rows
 
 # API Endpoints
 @app.get('/api/health')
@@ -1113,6 +2786,7 @@ def health():
             "pdfSupport": PYMUPDF_AVAILABLE,
             "groundingEnabled": True,
             "cachingEnabled": True,
+            "cacheBackend": cache_backend.name,
             "learningEnabled": True
         }
     })
@@ -1129,21 +2803,19 @@ def employees_page():
 def cache_stats():
     """Get cache statistics"""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.execute('''
-                SELECT 
-                    COUNT(*) as total_cached,
-                    SUM(access_count) as total_accesses,
-                    AVG(access_count) as avg_accesses
-                FROM document_cache
-            ''')
-            stats = cursor.fetchone()
-            
-            return jsonify({
-                "totalCached": stats[0] or 0,
-                "totalAccesses": stats[1] or 0,
-                "avgAccesses": round(stats[2] or 0, 2)
-            })
+        stats = cache_backend.stats()
+        pending_hits = pending_cache_hits()
+        total_cached = stats["totalCached"]
+        total_accesses = stats["totalAccesses"] + pending_hits
+        
+        return jsonify({
+            "backend": cache_backend.name,
+            "totalCached": total_cached,
+            "totalAccesses": total_accesses,
+            "avgAccesses": round(total_accesses / total_cached, 2) if total_cached else 0,
+            "pendingAccessUpdates": pending_hits,
+            "negativeEntries": stats.get("negativeEntries", 0)
+        })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1151,13 +2823,638 @@ def cache_stats():
 def clear_cache():
     """Clear document cache"""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.execute('DELETE FROM document_cache')
-            conn.commit()
+        with _cache_hit_stats_lock:
+            _cache_hit_stats.clear()
+        cache_backend.clear()
+        db_write(lambda conn: conn.execute('DELETE FROM session_memo'), wait=True)
         return jsonify({"status": "success", "message": "Cache cleared"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.post('/api/cache/failures/clear')
+def clear_cache_failures():
+    """Forget recent extraction failures so the next upload is retried in full"""
+    file_hash = (request.get_json(silent=True) or {}).get('fileHash')
+    clear_extraction_failure(file_hash)
+    return jsonify({"status": "success", "cleared": file_hash or "all"})
+
+@app.get('/api/cache/warmup')
+def cache_warmup_status():
+    """Get progress of the cache warm-up"""
+    return jsonify(_warmup_status)
+
+@app.post('/api/cache/warmup')
+def cache_warmup():
+    """Start a background cache warm-up from the dataset tree"""
+    started = start_cache_warmup()
+    return jsonify({
+        "status": "started" if started else "already_running",
+        "progress": _warmup_status
+    }), 202 if started else 409
+
+@app.get('/api/db/stats')
+def db_stats():
+    """Writer queue depth, commit latency and connection pool usage"""
+    return jsonify({
+        "schemaVersion": migrations.current_version(DB_PATH),
+        "writer": database.get_writer(DB_PATH).stats(),
+        "pool": database.get_pool(DB_PATH).stats()
+    })
+
+@app.get('/api/blobs/stats')
+def blob_stats():
+    """Blob store size, dedup ratio and disk saved"""
+    return jsonify(blobstore.stats(DB_PATH))
+
+@app.get('/api/datasets')
+def list_datasets():
+    """
+    Employees (no employee param) or one employee's sessions, from database
+    metadata only. Paginate with limit + cursor (keyset; offset still works).
+    include=summary embeds each session's summary for the returned page.
+    """
+    employee = request.args.get('employee', '').strip()
+    limit = min(DATASET_PAGE_LIMIT, max(1, request.args.get('limit', type=int) or 100))
+    offset = max(0, request.args.get('offset', type=int) or 0)
+    cursor = _decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    if request.args.get('cursor') and cursor is None:
+        return jsonify({"error": "Invalid cursor"}), 400
+    include_summary = request.args.get('include') == 'summary'
+    
+    if request.args.get('sync', '').lower() == 'true':
+        sync_dataset_changes()
+    
+    try:
+        with db_connection() as conn:
+            if not employee:
+                version = conn.execute('''
+                    SELECT t.employees, t.sessions, t.files, t.amount, (SELECT MAX(last_activity) FROM employees)
+                    FROM rollup_totals t WHERE t.id = 1
+                ''').fetchone()
+                etag = _listing_etag('employees', tuple(version) if version else None, limit, offset, cursor)
+                
+                def build():
+                    with db_connection() as conn:
+                        employees_data = _employee_page(conn, limit, offset, cursor)
+                        total = conn.execute('SELECT COUNT(*) FROM employees').fetchone()[0]
+                    last = employees_data[-1] if len(employees_data) == limit else None
+                    return {
+                        "employees": [emp['name'] for emp in employees_data],
+                        "employeesWithStats": employees_data,
+                        "sessions": [],
+                        "total": total,
+                        "hasMore": last is not None,
+                        "nextCursor": _encode_cursor(last['lastActivity'], last['name']) if last else None,
+                        "offset": offset,
+                        "limit": limit
+                    }
+                return _conditional_json(etag, build)
+            
+            # Archived sessions stay in the employee totals but leave the sessions table the
+            # pages read, so the total (and the ETag) counts the rows a client can page through
+            version = conn.execute('''
+                SELECT e.total_sessions, e.total_files, e.total_amount, e.last_activity,
+                       (SELECT COUNT(*) FROM sessions s WHERE s.employee_name = e.name) AS live_sessions
+                FROM employees e WHERE e.name = ?
+            ''', (employee,)).fetchone()
+            etag = _listing_etag('sessions', employee, tuple(version) if version else None,
+                                 limit, offset, cursor, include_summary)
+            
+            def build():
+                with db_connection() as conn:
+                    rows = _session_page(conn, employee, limit, offset, cursor)
+                emp_dir = _sanitize_name(employee)
+                sessions_data = []
+                for row in rows:
+                    sessions_data.append({
+                        "session": row['session_id'],
+                        "summary": _read_session_summary(emp_dir, row['session_id']) if include_summary else None,
+                        "stats": {
+                            "fileCount": row['file_count'],
+                            "prescriptionCount": row['prescription_count'],
+                            "billCount": row['bill_count'],
+                            "billItemCount": row['bill_item_count'],
+                            "medicineCount": row['medicine_count'],
+                            "totalAmount": row['total_amount'],
+                            "createdAt": _iso_utc(row['created_ts']) or row['created_at']
+                        }
+                    })
+                last = rows[-1] if len(rows) == limit else None
+                return {
+                    "employees": [employee],
+                    "sessions": sessions_data,
+                    "total": version['live_sessions'] if version else 0,
+                    "hasMore": last is not None,
+                    "nextCursor": _encode_cursor(last['created_at'], last['session_id']) if last else None,
+                    "offset": offset,
+                    "limit": limit
+                }
+            return _conditional_json(etag, build)
+    
+    except Exception as e:
+        print(f"Database query failed: {e}")
+        return jsonify({"employees": [], "sessions": [], "total": 0, "hasMore": False})
+
+class SessionSource:
+    """Where a hot session's files live: its directory, or its pack once packed"""
+    
+    def __init__(self, session_id: str, session_dir: str = None, pack=None):
+        self.session_id = session_id
+        self.session_dir = session_dir
+        self.pack = pack
+        if pack is not None:
+            self.names = pack.names(session_id)
+            self.mtime = os.stat(pack.path).st_mtime
+            self.stamp = ('pack', pack.path, os.stat(pack.path).st_mtime_ns)
+        else:
+            self.names = sorted(os.listdir(session_dir))
+            summary_path = summary_store.summary_path(session_dir)
+            st = os.stat(summary_path or session_dir)
+            self.mtime = st.st_mtime
+            self.stamp = (st.st_mtime_ns, st.st_size, os.stat(session_dir).st_mtime_ns)
+    
+    def open_summary(self):
+        if self.pack is not None:
+            return _packed_summary(self.pack, self.session_id)
+        return summary_store.open_summary(self.session_dir)
+    
+    def read(self, name: str):
+        if name not in self.names:
+            return None
+        if self.pack is not None:
+            return self.pack.read(self.session_id, name)
+        with open(os.path.join(self.session_dir, name), 'rb') as f:
+            return f.read()
+    
+    def digest(self, name: str, data: bytes = None) -> str:
+        if self.pack is not None:
+            return self.pack.digest(self.session_id, name)
+        return hashlib.sha256(data if data is not None else self.read(name)).hexdigest()
+
+    def stored_names(self, employee_dir: str) -> set:
+        """Names the session actually stored (pack index or blob refs), never stray files"""
+        if self.pack is not None:
+            return set(self.names)
+        with db_connection() as conn:
+            rows = conn.execute('SELECT employee_name, name FROM blob_refs WHERE session_id = ?',
+                                (self.session_id,)).fetchall()
+        return {row[1] for row in rows if _sanitize_name(row[0]) == employee_dir}
+
+def _session_path_key(employee: str, session_id: str):
+    """(employee_dir, session_id) for a path under dataset/, or None for '.', '..' and other dot-only names"""
+    key = (_sanitize_name(employee), _sanitize_name(session_id))
+    return key if all(part.strip('.') for part in key) else None
+
+def _contained_session_dir(employee_dir: str, session_id: str):
+    """Real path of the session directory, or None if it would resolve outside dataset/<employee>/"""
+    root = os.path.realpath(DATASET_DIR)
+    path = os.path.realpath(os.path.join(root, employee_dir, session_id))
+    return path if os.path.dirname(os.path.dirname(path)) == root else None
+
+def _session_source(employee_dir: str, session_id: str):
+    if not all(part.strip('.') for part in (employee_dir, session_id)):
+        return None
+    sess_dir = _contained_session_dir(employee_dir, session_id)
+    if sess_dir is None:
+        return None
+    if os.path.isdir(sess_dir):
+        return SessionSource(session_id, session_dir=sess_dir)
+    reader = _packed_session(employee_dir, session_id)
+    return SessionSource(session_id, pack=reader) if reader else None
+
+@app.get('/api/datasets/<employee>/<session_id>')
+def get_dataset_summary(employee: str, session_id: str):
+    """
+    One session's summary and file list, read only when asked for.
+    section=<key> (e.g. matching) or file=<filename|index> returns just that
+    part, decoding nothing else. Packed sessions are read from their pack.
+    """
+    key = _session_path_key(employee, session_id)
+    if key is None:
+        return jsonify({"error": "Not found"}), 404
+    employee_dir, session_id = key
+    section = request.args.get('section')
+    file_param = request.args.get('file')
+    
+    source = _session_source(employee_dir, session_id)
+    if source is None:
+        # Older sessions may have moved to the archive tier
+        month = archive._dir_month(session_id)
+        summary = archive.read_summary(ARCHIVE_DIR, month, employee_dir, session_id) if month else None
+        if summary is None:
+            return jsonify({"error": "Not found"}), 404
+        return _conditional_json(
+            _listing_etag('archived', employee, session_id),
+            lambda: {"employee": employee, "session": session_id, "summary": summary, "files": [], "archived": True}
+        )
+    
+    etag = _listing_etag('session', employee, session_id, source.stamp, section, file_param)
+    
+    def summary_part(read):
+        reader = source.open_summary()
+        return read(reader) if reader else None
+    
+    if section:
+        return _conditional_json(etag, lambda: {
+            "employee": employee,
+            "session": session_id,
+            "section": section,
+            section: summary_part(lambda reader: reader.section(section))
+        })
+    if file_param is not None:
+        which = int(file_param) if file_param.isdigit() else file_param
+        result = summary_part(lambda reader: reader.file_result(which))
+        if result is None:
+            return jsonify({"error": "Not found"}), 404
+        return _conditional_json(etag, lambda: {"employee": employee, "session": session_id, "file": result})
+    
+    return _conditional_json(etag, lambda: {
+        "employee": employee,
+        "session": session_id,
+        "summary": summary_part(lambda reader: reader.summary()),
+        "files": source.names
+    })
+
+def _sniff_page_type(data: bytes):
+    """MIME type of a storable page (PNG, JPEG or PDF) from its content, else None"""
+    # Page images are stored without an extension (e.g. "bill.pdf_page_3"), so never trust names
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if data[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if data[:4] == b'%PDF':
+        return 'application/pdf'
+    return None
+
+def _page_file_response(data_or_path, name: str, head: bytes, **kwargs):
+    """Pages are served inline only when their content is a known page type"""
+    mime = _sniff_page_type(head)
+    if mime:
+        return send_file(data_or_path, mimetype=mime, **kwargs)
+    return send_file(data_or_path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=name, **kwargs)
+
+@app.get('/api/datasets/<employee>/<session_id>/files/<path:name>')
+def get_session_file(employee: str, session_id: str, name: str):
+    """
+    A stored page image or upload, from the session directory or its pack.
+    size=thumb|preview serves a pre-rendered JPEG instead of the original.
+    Responses carry ETag/Last-Modified, honour Range and are cacheable for a year.
+    """
+    size = request.args.get('size', 'full')
+    if size != 'full' and size not in thumbnails.VARIANTS:
+        return jsonify({"error": f"size must be full or one of {sorted(thumbnails.VARIANTS)}"}), 400
+    
+    key = _session_path_key(employee, session_id)
+    source = _session_source(*key) if key else None
+    name = os.path.basename(name)
+    if source is None or name not in source.names or name not in source.stored_names(key[0]):
+        return jsonify({"error": "Not found"}), 404
+    
+    if size == 'full':
+        if source.pack is None:
+            path = os.path.join(source.session_dir, name)
+            with open(path, 'rb') as f:
+                head = f.read(16)
+            return _cached_file_response(_page_file_response(path, name, head, conditional=True,
+                                                             max_age=PAGE_CACHE_MAX_AGE))
+        data = source.read(name)
+        return _cached_file_response(_page_file_response(io.BytesIO(data), name, data[:16],
+                                                         etag=source.digest(name), last_modified=source.mtime,
+                                                         conditional=True, max_age=PAGE_CACHE_MAX_AGE))
+    
+    # Variants are named by page digest; a pack knows it without reading the page
+    data = source.read(name) if source.pack is None else None
+    digest = source.digest(name, data)
+    path = thumbnails.variant_path(THUMBNAIL_DIR, digest, size)
+    if not os.path.exists(path):
+        # Not rendered yet (older session, or the worker has not got to it)
+        path = thumbnails.ensure_variant(THUMBNAIL_DIR, data if data is not None else source.read(name),
+                                         size, digest)
+        if path is None:
+            return jsonify({"error": "Not an image"}), 415
+    return _cached_file_response(send_file(path, mimetype='image/jpeg', etag=f'{digest[:32]}-{size}',
+                                           conditional=True, max_age=PAGE_CACHE_MAX_AGE))
+
+@app.after_request
+def _no_sniff(response):
+    # Browsers must not second-guess declared types (stored uploads are user content)
+    response.headers.setdefault('X-Content-Type-Options', 'nosniff')
+    return response
+
+def _cached_file_response(response):
+    # Stored pages never change under the same session and name
+    response.cache_control.immutable = True
+    response.cache_control.private = True
+    response.cache_control.public = False
+    return response
+
+@app.route('/api/sync', methods=['POST'])
+def sync_database():
+    try:
+        if request.args.get('full', '').lower() == 'true':
+            changes = sync_database_with_filesystem()
+        else:
+            changes = sync_dataset_changes()
+        return jsonify({
+            "status": "success",
+            "message": "Database synchronized with filesystem",
+            "changes_made": bool(changes["added"] or changes["removed"]),
+            "changes": changes
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/cleanup', methods=['POST'])
+def cleanup_database():
+    try:
+        remove_empty_dirs = (request.get_json(silent=True) or {}).get('removeEmptyDirs', False)
+        changes = sync_database_with_filesystem()
+        
+        removed_dirs = 0
+        if remove_empty_dirs and os.path.isdir(DATASET_DIR):
+            for entry in os.scandir(DATASET_DIR):
+                if entry.is_dir():
+                    try:
+                        os.rmdir(entry.path)
+                        removed_dirs += 1
+                    except OSError:
+                        pass
+        
+        return jsonify({
+            "status": "success",
+            "message": "Database cleanup completed",
+            "database_changes": bool(changes["added"] or changes["removed"]),
+            "removed_directories": removed_dirs
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.get('/api/retention')
+def retention_status():
+    """Retention policies and the outcome of the last pass"""
+    return jsonify({"policy": retention_policy(), "lastRun": _retention_last_run})
+
+@app.post('/api/retention/run')
+def retention_run():
+    """Run one retention pass now (dryRun=true only reports what it would remove)"""
+    dry_run = request.args.get('dryRun', '').lower() in ('1', 'true', 'yes')
+    result = run_retention(dry_run=dry_run)
+    return jsonify(result), 409 if result.get('error') else 200
+
+@app.get('/api/archive')
+def archive_months():
+    """Archived months with their session counts"""
+    with db_connection() as conn:
+        rows = conn.execute(
+            'SELECT month, sessions, archived_at FROM archive_months ORDER BY month DESC'
+        ).fetchall()
+    return jsonify({
+        "afterMonths": ARCHIVE_AFTER_MONTHS,
+        "months": [{"month": r['month'], "sessions": r['sessions'], "archivedAt": r['archived_at']} for r in rows]
+    })
+
+@app.get('/api/archive/<month>/sessions')
+def archive_month_sessions(month):
+    if not re.fullmatch(r'\d{4}-\d{2}', month):
+        return jsonify({"error": "month must be YYYY-MM"}), 400
+    sessions = archive.list_sessions(ARCHIVE_DIR, month, request.args.get('employee') or None)
+    if sessions is None:
+        return jsonify({"error": f"Month {month} is not archived"}), 404
+    return jsonify({"month": month, "sessions": sessions})
+
+@app.get('/api/archive/<month>/<employee>/<session_id>')
+def archive_session_summary(month, employee, session_id):
+    if not re.fullmatch(r'\d{4}-\d{2}', month):
+        return jsonify({"error": "month must be YYYY-MM"}), 400
+    summary = archive.read_summary(ARCHIVE_DIR, month, _sanitize_name(employee), _sanitize_name(session_id))
+    if summary is None:
+        return jsonify({"error": "Archived session not found"}), 404
+    return jsonify(summary)
+
+# Bulk export
+EXPORT_SOURCES = export.SOURCES
+
+def _export_summaries(employee_dir: str = None, start: str = None, end: str = None):
+    """(employee_dir, session_id, summary reader) for session directories and packed sessions"""
+    # Directory names are local time and created_at is UTC: prefilter with a day of slack
+    low = (datetime.strptime(start, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y%m%d') if start else None
+    high = (datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y%m%d') if end else None
+    
+    def wanted(session_id):
+        day = session_id[:8]
+        return (low is None or day >= low) and (high is None or day < high)
+    
+    def employee_dirs(base):
+        if employee_dir:
+            paths = [os.path.join(base, employee_dir)]
+        else:
+            paths = [entry.path for entry in os.scandir(base)] if os.path.isdir(base) else []
+        return sorted(path for path in paths if os.path.isdir(path))
+    
+    for emp_path in employee_dirs(DATASET_DIR):
+        for entry in sorted(os.scandir(emp_path), key=lambda e: e.name):
+            if entry.is_dir() and wanted(entry.name):
+                reader = summary_store.open_summary(entry.path)
+                if reader is not None:
+                    yield os.path.basename(emp_path), entry.name, reader
+    
+    for emp_path in employee_dirs(PACK_DIR):
+        for pack_entry in sorted(os.scandir(emp_path), key=lambda e: e.name):
+            if not pack_entry.name.endswith('.pack'):
+                continue
+            pack = packs.open_pack(pack_entry.path)
+            for session_id in pack.session_ids() if pack else []:
+                reader = _packed_summary(pack, session_id) if wanted(session_id) else None
+                if reader is not None:
+                    yield os.path.basename(emp_path), session_id, reader
+
+def _export_rows_from_dataset(kind: str, start: str = None, end: str = None, employee: str = None):
+    """Export rows read straight from stored summaries, one session at a time"""
+    employee_dir = _sanitize_name(employee) if employee else None
+    for emp_dir, session_id, reader in _export_summaries(employee_dir, start, end):
+        created_at = _session_created_at(session_id, {"createdAt": reader.section('createdAt')})
+        if not export.in_bounds(created_at, start, end):
+            continue
+        name = reader.section('employee') or emp_dir
+        matches = _claim_rows({"matching": reader.section('matching') or {}})["matches"]
+        if kind == 'claims':
+            counts = _session_counts({"files": reader.file_names(),
+                                      "aggregated": reader.section('aggregated') or {}})
+            yield export.claim_row(name, session_id, created_at, counts, matches)
+        else:
+            yield from export.match_rows(name, session_id, created_at, matches)
+
+def export_rows(kind: str, source: str = 'db', date_from: str = None, date_to: str = None,
+                employee: str = None):
+    """
+    Generator of export rows (see export.COLUMNS) for sessions created in
+    [date_from, date_to]. source='db' reads the database, 'dataset' reads the
+    stored summaries and packs; either way archived months come first, from
+    their archive databases. Raises ValueError for bad arguments.
+    """
+    if kind not in export.COLUMNS:
+        raise ValueError(f"kind must be one of {', '.join(export.COLUMNS)}")
+    if source not in EXPORT_SOURCES:
+        raise ValueError(f"source must be one of {', '.join(EXPORT_SOURCES)}")
+    try:
+        start, end = export.date_bounds(date_from, date_to)
+    except ValueError:
+        raise ValueError('from/to must be YYYY-MM-DD')
+    archived = export.rows_from_archive(ARCHIVE_DIR, kind, start, end, employee)
+    if source == 'dataset':
+        return itertools.chain(archived, _export_rows_from_dataset(kind, start, end, employee))
+    return itertools.chain(archived, export.rows_from_db(DB_PATH, kind, start, end, employee))
+
+@app.get('/api/export/<kind>')
+def export_claims(kind):
+    """
+    Stream line items (kind=items) or per-session claims (kind=claims).
+    Query params: format (csv|jsonl|parquet), from/to (YYYY-MM-DD, inclusive),
+    employee, source (db|dataset)
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.available_formats():
+        return jsonify({"error": f"format must be one of {', '.join(export.available_formats())}"}), 400
+    date_from, date_to = request.args.get('from') or None, request.args.get('to') or None
+    employee = request.args.get('employee') or None
+    try:
+        rows = export_rows(kind, request.args.get('source', 'db'), date_from, date_to, employee)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    name = export.filename(kind, fmt, date_from, date_to, _sanitize_name(employee) if employee else None)
+    return Response(stream_with_context(export.encode(fmt, kind, rows)),
+                    content_type=export.FORMATS[fmt][0],
+                    headers={"Content-Disposition": f'attachment; filename="{name}"',
+                             "Cache-Control": "no-store"})
+
+@app.get('/api/analytics/overview')
+def analytics_overview():
+    """Dashboard totals and recent activity, answered from the rollup tables"""
+    months = min(36, max(1, request.args.get('months', type=int, default=12)))
+    try:
+        with db_connection() as conn:
+            totals = conn.execute(
+                'SELECT employees, sessions, files, amount FROM rollup_totals WHERE id = 1'
+            ).fetchone()
+            
+            recent_activity = conn.execute('''
+                SELECT COALESCE(SUM(sessions), 0) FROM rollup_daily WHERE day > DATE('now', '-7 days')
+            ''').fetchone()[0]
+            
+            daily_stats = [{
+                'date': row['day'],
+                'sessions': row['sessions'],
+                'files': row['files'] or 0,
+                'amount': round(row['amount'] or 0, 2)
+            } for row in conn.execute('''
+                SELECT day, sessions, files, amount FROM rollup_daily
+                WHERE day > DATE('now', '-30 days') AND sessions > 0
+                ORDER BY day DESC
+            ''')]
+            
+            monthly_stats = [{
+                'month': row['month'],
+                'sessions': row['sessions'],
+                'files': row['files'] or 0,
+                'amount': round(row['amount'] or 0, 2)
+            } for row in conn.execute('''
+                SELECT month, sessions, files, amount FROM rollup_monthly
+                WHERE sessions > 0
+                ORDER BY month DESC
+                LIMIT ?
+            ''', (months,))]
+        
+        return jsonify({
+            "totalEmployees": totals['employees'] if totals else 0,
+            "totalSessions": totals['sessions'] if totals else 0,
+            "totalFiles": totals['files'] if totals else 0,
+            "totalAmount": round(totals['amount'], 2) if totals else 0,
+            "recentActivity": recent_activity,
+            "dailyStats": daily_stats,
+            "monthlyStats": monthly_stats
+        })
+        
+    except Exception as e:
+        print(f"Analytics failed: {e}")
+        return jsonify({
+            "totalEmployees": 0,
+            "totalSessions": 0,
+            "totalFiles": 0,
+            "totalAmount": 0,
+            "recentActivity": 0,
+            "dailyStats": [],
+            "monthlyStats": [],
+            "error": "Analytics unavailable"
+        })
+
+@app.get('/api/analytics/employees/<employee>/monthly')
+def analytics_employee_monthly(employee):
+    """Per-month session, file and amount totals for one employee"""
+    with db_connection() as conn:
+        rows = conn.execute('''
+            SELECT month, sessions, files, amount FROM rollup_employee_monthly
+            WHERE employee_name = ? AND sessions > 0
+            ORDER BY month DESC
+        ''', (employee,)).fetchall()
+    return jsonify({
+        "employee": employee,
+        "months": [{
+            'month': row['month'],
+            'sessions': row['sessions'],
+            'files': row['files'] or 0,
+            'amount': round(row['amount'] or 0, 2)
+        } for row in rows]
+    })
+
+@app.get('/api/search/employees')
+def search_employees():
+    """Employee search-as-you-type for the employees page"""
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(SEARCH_MAX_PAGE_SIZE, request.args.get('limit', type=int) or 20))
+    if not query:
+        return jsonify({"employees": []})
+    
+    try:
+        return jsonify({"employees": search_employees_indexed(query, limit)})
+    except Exception as e:
+        return jsonify({"error": f"Search failed: {str(e)}"}), 500
+
+@app.get('/api/search/items')
+def search_items():
+    """
+    Full-text search over bill items, prescriptions and tests.
+    Query params: q, mode (prefix|phrase|fuzzy), kind, employee, page, pageSize
+    """
+    query = (request.args.get('q') or '').strip()
+    mode = request.args.get('mode', 'prefix')
+    kind = request.args.get('kind') or None
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    if mode not in SEARCH_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+    if kind and kind not in SEARCH_KINDS:
+        return jsonify({"error": f"kind must be one of {', '.join(SEARCH_KINDS)}"}), 400
+    
+    page = max(1, request.args.get('page', type=int, default=1))
+    page_size = min(SEARCH_MAX_PAGE_SIZE, max(1, request.args.get('pageSize', type=int, default=20)))
+    try:
+        found = search_claim_items(query, mode, kind, request.args.get('employee') or None,
+                                   limit=page_size, offset=(page - 1) * page_size)
+    except sqlite3.OperationalError as e:
+        return jsonify({"error": f"Invalid search: {e}"}), 400
+    
+    return jsonify({
+        "query": query,
+        "mode": mode,
+        "page": page,
+        "pageSize": page_size,
+        "total": found["total"],
+        "hasMore": page * page_size < found["total"],
+        "results": found["results"]
+    })
+
 @app.get('/api/memory/patterns')
 def get_patterns():
     """Get learned extraction patterns"""
@@ -1168,6 +3465,31 @@ def get_patterns():
     patterns = get_learned_patterns(doc_type, entity_type, limit)
     return jsonify({"patterns": patterns})
 
+_background_started = False
+
+def start_background_jobs():
+    """
+    Start the background workers (backfills, cache stats, reconcile, archive,
+    retention, warm-up, dataset watcher). Only the serving process calls this;
+    importing server (manage.py, tests) never starts background work.
+    """
+    global _background_started
+    if _background_started:
+        return
+    _background_started = True
+    threading.Thread(target=_run_schema_backfills, name='schema-backfill', daemon=True).start()
+    threading.Thread(target=_cache_stats_flusher, name='cache-stats-flusher', daemon=True).start()
+    if EMPLOYEE_RECONCILE_INTERVAL > 0:
+        threading.Thread(target=_employee_reconciler, name='employee-reconciler', daemon=True).start()
+    if ARCHIVE_INTERVAL > 0:
+        threading.Thread(target=_archiver, name='session-archiver', daemon=True).start()
+    if RETENTION_INTERVAL > 0:
+        threading.Thread(target=_retention_worker, name='retention-gc', daemon=True).start()
+    if get_bool_setting('CACHE_WARMUP_ON_START'):
+        start_cache_warmup()
+    if DATASET_WATCH:
+        start_dataset_watcher()
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("🚀 MEDICAL CLAIMS PROCESSING SERVER")
@@ -1183,7 +3505,15 @@ if __name__ == '__main__':
         print(f"   Please check your .env file")
     
     print(f"✅ Grounding: Disabled (requires paid API)")
-    print(f"✅ Caching: Enabled")
+    print(f"✅ Caching: Enabled ({cache_backend.name} backend)")
+    print(f"✅ Cache Warm-up on Start: {get_bool_setting('CACHE_WARMUP_ON_START')}")
+    print(f"✅ Dataset Watcher: {DATASET_WATCH}")
     print(f"✅ Learning: Enabled")
     print("="*60 + "\n")
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    
+    # The debug reloader serves from a child process (WERKZEUG_RUN_MAIN); only that one runs the workers
+    debug = True
+    init_database()
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_jobs()
+    app.run(host='0.0.0.0', port=5000, debug=debug)
\ No newline at end of file
@@ -0,0 +1,233 @@
+"""
+Rows recorded for a stored session
+Pure functions from a session directory and its summary to the rows written
+to sessions, claim_files, claim_bill_items, claim_matches, claim_item_names
+and document_cache. Nothing here imports the server, so the bulk importer can
+run parse_session in spawned worker processes.
+"""
+
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timezone
+
+import summary_store
+
+# Session ids are the start time in this format, plus an optional _NNNN suffix
+SESSION_ID_FORMAT = '%Y%m%d_%H%M%S'
+
+
+def sanitize_name(name: str) -> str:
+    name = (name or '').strip()
+    name = name.replace(' ', '_')
+    return re.sub(r'[^A-Za-z0-9_.\-]', '', name)[:100] or 'unknown'
+
+
+def hash_document(data: bytes, filename: str = "") -> str:
+    """Create a unique hash for a document, optionally including filename"""
+    hasher = hashlib.sha256()
+    hasher.update(data)
+    if filename:
+        hasher.update(filename.encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def normalize_medicine_name(name):
+    """Enhanced normalize medicine names for better matching"""
+    if not name:
+        return ""
+
+    name = name.lower().strip()
+
+    # Remove dosage and forms
+    name = re.sub(r'\s*spf\s*\d+\s*%?\s*', ' ', name)
+    name = re.sub(r'\s*\d+\s*%\s*', ' ', name)
+    name = re.sub(r'\s*\d+\s*mg\s*', ' ', name)
+    name = re.sub(r'\s*\d+\s*gm\s*', ' ', name)
+    name = re.sub(r'\s*\d+\s*ml\s*', ' ', name)
+    name = re.sub(r'\s*\d+\s*mcg\s*', ' ', name)
+
+    # Remove product types
+    product_types = ['tab', 'tablet', 'tabs', 'cap', 'capsule', 'caps', 'syrup', 'syp',
+                     'inj', 'injection', 'susp', 'suspension', 'drops', 'sol', 'solution',
+                     'cream', 'ointment', 'oint', 'lotion', 'gel', 'balm']
+
+    words = name.split()
+    words = [w for w in words if w not in product_types]
+    name = ' '.join(words)
+
+    # Remove special characters
+    name = re.sub(r'[^\w\s]', ' ', name)
+    name = ' '.join(name.split())
+
+    return name
+
+
+def _flag(value) -> int:
+    return 1 if value else 0
+
+
+def claim_rows(summary_data: dict) -> dict:
+    """Line items of a claim, as rows for claim_files / claim_bill_items / claim_matches"""
+    files, bill_items, matches, names = [], [], [], []
+    normalized = {}
+
+    def norm(name):
+        if name not in normalized:
+            normalized[name] = normalize_medicine_name(name or '')
+        return normalized[name]
+
+    for file_index, f in enumerate(summary_data.get('files', [])):
+        items = f.get('billItems') or []
+        files.append((
+            file_index, f.get('filename'), f.get('originalFilename'), f.get('type'), f.get('page'),
+            _flag(f.get('isPDF')), _flag(f.get('isClaimForm', f.get('type') == 'claim_form')), len(items),
+            len(f.get('prescriptionNames') or []), f.get('error')
+        ))
+        for item_index, item in enumerate(items):
+            name = item.get('name') or ''
+            bill_items.append((
+                file_index, item_index, name, norm(name), item.get('amount') or 0.0,
+                _flag(item.get('isConsultation')), _flag(item.get('isTest'))
+            ))
+            if name:
+                names.append(('bill_item', name, norm(name), item.get('amount') or 0.0))
+        for name in f.get('prescriptionNames') or []:
+            if name:
+                names.append(('prescription', name, norm(name), None))
+        for name in f.get('testNames') or []:
+            if name:
+                names.append(('test', name, norm(name), None))
+
+    matching = summary_data.get('matching') or {}
+    for m in matching.get('matchedItems', []):
+        amount = m.get('amount') or 0.0
+        matches.append((
+            'matched', m.get('prescriptionName'), m.get('billItemName'), norm(m.get('billItemName')),
+            amount, amount if m.get('status') == 'admissible' else 0.0, None,
+            m.get('matchScore'), m.get('status'), None
+        ))
+    for m in matching.get('unmatchedPrescriptions', []):
+        matches.append((
+            'unmatched_prescription', m.get('prescriptionName'), None, norm(m.get('prescriptionName')),
+            None, None, None, None, m.get('status'), m.get('reason')
+        ))
+    for m in matching.get('unmatchedTests', []):
+        matches.append((
+            'unmatched_test', m.get('testName'), None, norm(m.get('testName')),
+            None, None, None, None, m.get('status'), m.get('reason')
+        ))
+    for m in matching.get('inadmissibleItems', []):
+        matches.append((
+            'inadmissible', None, m.get('billItemName'), norm(m.get('billItemName')),
+            m.get('amount') or 0.0, 0.0, None, None, m.get('status'), m.get('reason')
+        ))
+    for m in matching.get('consultationAdjustments', []):
+        matches.append((
+            'consultation_adjustment', m.get('prescriptionName'), m.get('itemName'), norm(m.get('itemName')),
+            m.get('billedAmount'), m.get('admissibleAmount'), m.get('excessAmount'),
+            m.get('matchScore'), 'capped', m.get('reason')
+        ))
+
+    return {"files": files, "billItems": bill_items, "matches": matches, "names": names}
+
+
+def session_counts(summary_data: dict) -> tuple:
+    file_count = len(summary_data.get('files', []))
+
+    aggregated = summary_data.get('aggregated', {})
+    prescription_count = len(aggregated.get('prescriptions', []))
+    bill_count = len(aggregated.get('bills', []))
+
+    total_amount = 0
+    for bill in aggregated.get('bills', []):
+        for item in bill.get('items', []):
+            total_amount += item.get('amount', 0)
+
+    return (file_count, prescription_count, bill_count, total_amount)
+
+
+def sql_timestamp(iso_value: str = None):
+    """Summary createdAt (local time) -> sessions.created_at format (UTC)"""
+    if not iso_value:
+        return None
+    try:
+        return datetime.fromisoformat(iso_value).astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def load_summary(session_dir: str):
+    try:
+        return summary_store.load_summary(session_dir)
+    except Exception as e:
+        print(f"Skipping {session_dir}: {e}")
+        return None
+
+
+def session_created_at(session_dir: str, summary: dict):
+    created_at = sql_timestamp(summary.get('createdAt'))
+    if created_at:
+        return created_at
+    try:
+        stamp = datetime.strptime(os.path.basename(session_dir)[:15], SESSION_ID_FORMAT)
+        return stamp.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def session_key(session_dir: str, summary: dict) -> tuple:
+    """(employee_name, session_id) as recorded in the sessions table"""
+    employee = summary.get('employee') or os.path.basename(os.path.dirname(session_dir))
+    return employee, os.path.basename(session_dir)
+
+
+def cache_rows(session_dir: str) -> list:
+    """Build document_cache rows for the page images stored in a session directory"""
+    try:
+        # Only the per-file results are needed, not the whole summary
+        file_results = summary_store.load_section(session_dir, 'files', [])
+    except Exception as e:
+        print(f"Warm-up: skipping {session_dir}: {e}")
+        return []
+
+    rows = []
+    now = datetime.now().isoformat()
+    for file_result in file_results or []:
+        filename = file_result.get('filename')
+        typ = file_result.get('type')
+        if not filename or not typ or typ == 'error' or file_result.get('error'):
+            continue
+
+        image_path = os.path.join(session_dir, sanitize_name(filename))
+        if not os.path.isfile(image_path):
+            continue
+
+        with open(image_path, 'rb') as f:
+            file_hash = hash_document(f.read())
+
+        rows.append((file_hash, filename, typ, json.dumps({
+            'type': typ,
+            'prescriptionNames': file_result.get('prescriptionNames', []),
+            'testNames': file_result.get('testNames', []),
+            'billItems': file_result.get('billItems', [])
+        }), now, now))
+
+    return rows
+
+
+def parse_session(session_dir: str, with_cache: bool = True):
+    """Bulk-import worker: everything the importer writes for one session directory"""
+    summary = load_summary(session_dir)
+    if summary is None:
+        return None
+    employee, session_id = session_key(session_dir, summary)
+    return {
+        "employee": employee,
+        "sessionId": session_id,
+        "counts": session_counts(summary),
+        "claimRows": claim_rows(summary),
+        "createdAt": session_created_at(session_dir, summary),
+        "cacheRows": cache_rows(session_dir) if with_cache else []
+    }
@@ -0,0 +1,39 @@
+"""
+Deployment settings shared by the server and the maintenance commands.
+Values come from the environment or a .env file next to this module.
+"""
+
+import os
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_ENV_LOADED = False
+
+
+def load_env():
+    global _ENV_LOADED
+    if load_dotenv and not _ENV_LOADED:
+        load_dotenv(os.path.join(BASE_DIR, '.env'))
+        _ENV_LOADED = True
+
+
+def get_setting(name: str, default: str = '') -> str:
+    """Read a deployment setting from the environment or .env file"""
+    load_env()
+    return os.getenv(name, default).strip().strip('"').strip("'")
+
+
+def get_bool_setting(name: str, default: bool = False) -> bool:
+    value = get_setting(name, '')
+    if not value:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+# The main database; manage.py reads it from here without importing the server
+DB_PATH = get_setting('DB_PATH') or os.path.join(BASE_DIR, 'med_claim_data.db')
@@ -0,0 +1,220 @@
+"""
+Session summary storage
+Summaries are written atomically (temp file, fsync, rename) as summary.jsonz:
+
+    b'MCSZ' | uint32 header length | header JSON | compressed blocks
+
+Each top-level key of the summary and each entry of its "files" list is a
+separate zlib block. The small uncompressed header indexes the blocks by
+offset, so a reader can decode just "matching" or a single file's result
+without inflating the rest. Sessions written before this format keep their
+plain summary.json, which every reader here still accepts.
+"""
+
+import io
+import json
+import os
+import struct
+import tempfile
+import zlib
+from typing import Any, Dict, Optional
+
+SUMMARY_FILE = 'summary.jsonz'
+LEGACY_SUMMARY_FILE = 'summary.json'
+SUMMARY_FILES = (SUMMARY_FILE, LEGACY_SUMMARY_FILE)
+MAGIC = b'MCSZ'
+FORMAT_VERSION = 1
+COMPRESSION_LEVEL = 6
+_PREFIX = struct.Struct('<4sI')
+
+
+def _block(value: Any) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+                         COMPRESSION_LEVEL)
+
+
+def encode(summary: Dict) -> bytes:
+    """Serialize a summary into the indexed, block-compressed format"""
+    blocks = []
+    offset = 0
+
+    def add(value):
+        nonlocal offset
+        data = _block(value)
+        blocks.append(data)
+        entry = [offset, len(data)]
+        offset += len(data)
+        return entry
+
+    header = {"version": FORMAT_VERSION, "keys": [], "sections": {}, "files": []}
+    for key, value in summary.items():
+        header["keys"].append(key)
+        if key == 'files' and isinstance(value, list):
+            header["files"] = [[(item or {}).get('filename'), *add(item)] for item in value]
+        else:
+            header["sections"][key] = add(value)
+    header_bytes = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return _PREFIX.pack(MAGIC, len(header_bytes)) + header_bytes + b''.join(blocks)
+
+
+def write_summary(session_dir: str, summary: Dict) -> str:
+    """Atomically replace the session's summary; returns its path"""
+    path = os.path.join(session_dir, SUMMARY_FILE)
+    fd, tmp = tempfile.mkstemp(dir=session_dir, prefix='.tmp-summary-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(encode(summary))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    _fsync_dir(session_dir)
+    return path
+
+
+def _fsync_dir(path: str):
+    # Makes the rename durable on POSIX; directories cannot be opened on Windows
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def summary_path(session_dir: str) -> Optional[str]:
+    """Path of the session's summary in whichever format it was written, or None"""
+    for name in SUMMARY_FILES:
+        path = os.path.join(session_dir, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+class SummaryReader:
+    """Random access to one summary.jsonz: only the requested blocks are inflated"""
+
+    def __init__(self, f):
+        self._f = f
+        magic, header_len = _PREFIX.unpack(f.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError('Not a summary.jsonz file')
+        self.header = json.loads(f.read(header_len).decode('utf-8'))
+        self._base = _PREFIX.size + header_len
+
+    def _read(self, offset: int, length: int):
+        self._f.seek(self._base + offset)
+        return json.loads(zlib.decompress(self._f.read(length)).decode('utf-8'))
+
+    def keys(self):
+        return list(self.header["keys"])
+
+    def section(self, key: str, default=None):
+        if key == 'files':
+            return [self._read(offset, length) for _, offset, length in self.header["files"]]
+        entry = self.header["sections"].get(key)
+        return self._read(*entry) if entry else default
+
+    def file_names(self):
+        return [name for name, _, _ in self.header["files"]]
+
+    def file_result(self, which) -> Optional[Dict]:
+        """A single file's result, by position or by filename"""
+        files = self.header["files"]
+        if isinstance(which, int):
+            entry = files[which] if 0 <= which < len(files) else None
+        else:
+            entry = next((e for e in files if e[0] == which), None)
+        return self._read(entry[1], entry[2]) if entry else None
+
+    def summary(self) -> Dict:
+        return {key: self.section(key) for key in self.header["keys"]}
+
+
+def open_reader(data_or_file) -> SummaryReader:
+    if isinstance(data_or_file, (bytes, bytearray, memoryview)):
+        return SummaryReader(io.BytesIO(data_or_file))
+    return SummaryReader(data_or_file)
+
+
+def decode(data: bytes) -> Dict:
+    return open_reader(data).summary()
+
+
+class _LegacyReader:
+    """A plain summary.json behind the SummaryReader interface"""
+
+    def __init__(self, summary: Dict):
+        self._summary = summary
+
+    def keys(self):
+        return list(self._summary)
+
+    def section(self, key: str, default=None):
+        return self._summary.get(key, default)
+
+    def file_names(self):
+        return [item.get('filename') for item in self._summary.get('files', [])]
+
+    def file_result(self, which) -> Optional[Dict]:
+        files = self._summary.get('files', [])
+        if isinstance(which, int):
+            return files[which] if 0 <= which < len(files) else None
+        return next((item for item in files if item.get('filename') == which), None)
+
+    def summary(self) -> Dict:
+        return self._summary
+
+
+def reader_from_bytes(name: str, data: bytes):
+    """Reader over a summary held in memory (e.g. sliced out of a pack)"""
+    if name == SUMMARY_FILE:
+        return open_reader(data)
+    return _LegacyReader(json.loads(data))
+
+
+def open_summary(session_dir: str):
+    """Reader over the session's summary in either format; None if it has none"""
+    path = summary_path(session_dir)
+    if path is None:
+        return None
+    with open(path, 'rb') as f:
+        return reader_from_bytes(os.path.basename(path), f.read())
+
+
+def load_summary(session_dir: str) -> Optional[Dict]:
+    """Whole summary of a session in either format; None if it has none"""
+    reader = open_summary(session_dir)
+    return reader.summary() if reader else None
+
+
+def load_section(session_dir: str, key: str, default=None):
+    """One top-level section (e.g. "matching") without decoding the others"""
+    reader = open_summary(session_dir)
+    return reader.section(key, default) if reader else default
+
+
+def load_file_result(session_dir: str, which) -> Optional[Dict]:
+    """One entry of "files", by position or filename"""
+    reader = open_summary(session_dir)
+    return reader.file_result(which) if reader else None
+
+
+def convert_legacy(session_dir: str) -> Optional[Dict]:
+    """Rewrite a plain summary.json as summary.jsonz; returns the sizes, or None if nothing to do"""
+    legacy = os.path.join(session_dir, LEGACY_SUMMARY_FILE)
+    if not os.path.isfile(legacy):
+        return None
+    with open(legacy, 'r', encoding='utf-8') as f:
+        summary = json.load(f)
+    before = os.path.getsize(legacy)
+    path = write_summary(session_dir, summary)
+    os.remove(legacy)
+    return {"before": before, "after": os.path.getsize(path)}
@@ -0,0 +1,99 @@
+"""
+Shared fixtures: each test gets its own database and storage directories
+under tmp_path, so nothing touches dataset/, blobs/ or med_claim_data.db
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Settings are read on import, so the server's own database must point at a
+# scratch file before any test imports settings or server
+SCRATCH_DIR = tempfile.mkdtemp(prefix='med-claim-tests-')
+os.environ['DB_PATH'] = os.path.join(SCRATCH_DIR, 'med_claim_data.db')
+os.environ['CACHE_BACKEND'] = 'sqlite'
+
+import database
+import migrations
+
+SERVER_DIRS = (
+    ('DATASET_DIR', 'dataset'),
+    ('BLOB_DIR', 'blobs'),
+    ('PACK_DIR', 'packs'),
+    ('THUMBNAIL_DIR', 'thumbs'),
+    ('ARCHIVE_DIR', 'archive'),
+)
+
+
+def pytest_unconfigure(config):
+    database.stop_all_writers()
+    shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A database migrated to the latest schema"""
+    path = str(tmp_path / 'med_claim_data.db')
+    migrations.migrate(path)
+    yield path
+    database.get_writer(path).stop()
+
+
+@pytest.fixture
+def server_env(tmp_path, db_path, monkeypatch):
+    """The server module pointed at db_path and empty storage directories"""
+    import server
+    from cache_backend import SQLiteCacheBackend
+
+    for attr, name in SERVER_DIRS:
+        path = tmp_path / name
+        path.mkdir()
+        monkeypatch.setattr(server, attr, str(path))
+    monkeypatch.setattr(server, 'DB_PATH', db_path)
+    monkeypatch.setattr(server, 'cache_backend', SQLiteCacheBackend(db_path))
+    yield server
+    # Buffered cache hits belong to this test's backend
+    server.flush_cache_access_stats()
+
+
+def write_session(dataset_dir: str, employee: str, session_id: str, files=None, summary=None) -> str:
+    """A stored session directory: summary.jsonz plus the given {name: bytes} files"""
+    import summary_store
+
+    session_dir = os.path.join(dataset_dir, employee, session_id)
+    os.makedirs(session_dir, exist_ok=True)
+    for name, data in (files or {}).items():
+        with open(os.path.join(session_dir, name), 'wb') as f:
+            f.write(data)
+    summary_store.write_summary(session_dir, summary or {
+        "employee": employee,
+        "files": [{"filename": name, "type": "bill"} for name in files or {}],
+        "aggregated": {"prescriptions": [], "bills": [], "tests": []},
+        "matching": {}
+    })
+    return session_dir
+
+
+def drain(db_path: str):
+    """Wait until every write queued so far (db_write without wait) is committed"""
+    database.get_writer(db_path).submit(lambda conn: None, wait=True)
+
+
+def add_session(server, employee: str, session_id: str, created_at: str, files=None, summary=None) -> str:
+    """A stored session plus its sessions row and line items, created at created_at (UTC)"""
+    import summary_store
+
+    session_dir = write_session(server.DATASET_DIR, employee, session_id, files or {'page.png': b'x' * 1000}, summary)
+    summary = summary_store.load_summary(session_dir)
+    database.get_writer(server.DB_PATH).submit(
+        server._write_session, employee, session_id, server._session_counts(summary), server._claim_rows(summary),
+        created_at, wait=True
+    )
+    return session_dir
@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import database
+from conftest import add_session
+
+
+def claim(amount: float) -> dict:
+    return {
+        "files": [{"filename": "page.png", "type": "bill"}],
+        "aggregated": {"prescriptions": [], "tests": [], "bills": [{"items": [{"name": "ITEM", "amount": amount}]}]},
+        "matching": {}
+    }
+
+
+@pytest.fixture
+def sessions(server_env):
+    now = datetime.now(timezone.utc)
+    add_session(server_env, 'Asha', '20250105_100000', '2025-01-05 10:00:00', summary=claim(100.0))
+    add_session(server_env, 'Asha', '20250106_100000', '2025-01-06 10:00:00', summary=claim(50.5))
+    add_session(server_env, 'Asha', '20250210_100000', '2025-02-10 10:00:00', summary=claim(20.0))
+    add_session(server_env, 'Ravi', 'today', now.strftime('%Y-%m-%d %H:%M:%S'), summary=claim(7.25))
+    return server_env
+
+
+def test_overview_is_answered_from_rollups(sessions):
+    overview = sessions.app.test_client().get('/api/analytics/overview').get_json()
+    assert (overview["totalEmployees"], overview["totalSessions"], overview["totalFiles"]) == (2, 4, 4)
+    assert overview["totalAmount"] == 177.75
+    assert overview["recentActivity"] == 1
+    months = {m["month"]: (m["sessions"], m["amount"]) for m in overview["monthlyStats"]}
+    assert months["2025-01"] == (2, 150.5) and months["2025-02"] == (1, 20.0)
+
+
+def test_employee_months_follow_deletes(sessions):
+    database.get_writer(sessions.DB_PATH).submit(
+        lambda conn: conn.execute("DELETE FROM sessions WHERE session_id = '20250106_100000'"), wait=True
+    )
+    months = sessions.app.test_client().get('/api/analytics/employees/Asha/monthly').get_json()["months"]
+    assert [(m["month"], m["sessions"], m["amount"]) for m in months] == [('2025-02', 1, 20.0), ('2025-01', 1, 100.0)]
+    assert sessions.reconcile_employee_stats(repair=False)["rollupsDrifted"] == []
+
+
+def test_reconcile_rebuilds_drifted_rollups(sessions):
+    database.get_writer(sessions.DB_PATH).submit(
+        lambda conn: conn.execute("UPDATE rollup_monthly SET sessions = 99 WHERE month = '2025-01'"), wait=True
+    )
+    assert sessions.reconcile_employee_stats(repair=True)["rollupsDrifted"]
+    assert sessions.reconcile_employee_stats(repair=False)["rollupsDrifted"] == []
+    overview = sessions.app.test_client().get('/api/analytics/overview').get_json()
+    assert {m["month"]: m["sessions"] for m in overview["monthlyStats"]}["2025-01"] == 2
@@ -0,0 +1,54 @@
+import os
+from datetime import datetime, timezone
+
+from conftest import add_session
+
+SUMMARY = {
+    "employee": "Asha",
+    "files": [{"filename": "page.png", "type": "bill"}],
+    "aggregated": {"prescriptions": [], "tests": [], "bills": [{"items": [{"name": "ITEM", "amount": 40.0}]}]},
+    "matching": {}
+}
+
+
+def hot_sessions(server):
+    with server.db_connection() as conn:
+        return [row['session_id'] for row in conn.execute('SELECT session_id FROM sessions ORDER BY session_id')]
+
+
+def test_old_months_move_to_the_archive(server_env):
+    now = datetime.now(timezone.utc)
+    recent = now.strftime('%Y%m%d_%H%M%S')
+    old_dir = add_session(server_env, 'Asha', '20240115_090000', '2024-01-15 09:00:00', summary=SUMMARY)
+    add_session(server_env, 'Asha', recent, now.strftime('%Y-%m-%d %H:%M:%S'), summary=SUMMARY)
+
+    assert server_env.archive_old_sessions(6, dry_run=True)["months"] == ['2024-01']
+    assert hot_sessions(server_env) == ['20240115_090000', recent]
+
+    result = server_env.archive_old_sessions(6)
+    assert [(m["month"], m["sessions"], m["directories"]) for m in result["archived"]] == [('2024-01', 1, 1)]
+    assert hot_sessions(server_env) == [recent]
+    assert not os.path.exists(old_dir)
+    assert os.path.isfile(os.path.join(server_env.ARCHIVE_DIR, '2024-01.db'))
+
+    # Employee totals still cover the archived month
+    [asha] = server_env.search_employees_indexed('asha')
+    assert (asha['sessionCount'], asha['totalAmount']) == (2, 80.0)
+
+    client = server_env.app.test_client()
+    months = client.get('/api/archive').get_json()["months"]
+    assert [(m["month"], m["sessions"]) for m in months] == [('2024-01', 1)]
+    listed = client.get('/api/archive/2024-01/sessions?employee=Asha').get_json()["sessions"]
+    assert [(s["session_id"], s["total_amount"]) for s in listed] == [('20240115_090000', 40.0)]
+    # The session endpoint falls back to the archive's zip
+    archived = client.get('/api/datasets/Asha/20240115_090000').get_json()
+    assert archived["archived"] and archived["summary"]["files"][0]["filename"] == 'page.png'
+    assert client.get('/api/archive/2023-12/sessions').status_code == 404
+
+
+def test_archiving_twice_is_a_no_op(server_env):
+    add_session(server_env, 'Asha', '20240115_090000', '2024-01-15 09:00:00', summary=SUMMARY)
+    assert server_env.archive_old_sessions(6)["archived"]
+    assert server_env.archive_old_sessions(6)["archived"] == []
+    [asha] = server_env.search_employees_indexed('asha')
+    assert asha['sessionCount'] == 1
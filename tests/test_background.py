@@ -0,0 +1,63 @@
+import io
+import threading
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from conftest import write_session
+
+WORKERS = {'schema-backfill', 'cache-stats-flusher', 'employee-reconciler', 'session-archiver',
+           'retention-gc', 'cache-warmup', 'dataset-watcher'}
+
+
+def test_import_starts_no_background_workers(server_env):
+    assert not WORKERS & {thread.name for thread in threading.enumerate()}
+
+
+def test_warmup_is_marked_running_before_it_scans(server_env, monkeypatch):
+    listing, release = threading.Event(), threading.Event()
+
+    def slow_listing(dataset_dir):
+        listing.set()
+        release.wait(5)
+        return []
+
+    monkeypatch.setattr(server_env, '_list_session_dirs', slow_listing)
+    assert server_env.start_cache_warmup()
+    # Claimed before the directory listing has even started
+    assert server_env._warmup_status["running"]
+    assert not server_env.start_cache_warmup()
+    assert server_env.warm_cache_from_dataset() == {"error": "Warm-up already running"}
+
+    assert listing.wait(5)
+    release.set()
+    warmup = next(t for t in threading.enumerate() if t.name == 'cache-warmup')
+    warmup.join(5)
+    assert not server_env._warmup_status["running"]
+    assert server_env.warm_cache_from_dataset()["error"] is None
+
+
+def test_warmed_pages_answer_a_resubmitted_pdf(server_env, monkeypatch):
+    fitz = pytest.importorskip('fitz')
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), 'AUGMENTIN 625  120.00')
+    pdf = doc.tobytes()
+    page = server_env.extract_images_from_pdf(pdf)[0]['bytes']
+
+    name = server_env._sanitize_name('claim.pdf_page_1')
+    write_session(server_env.DATASET_DIR, 'Asha', '20251008_100305', {name: page}, {
+        "employee": "Asha",
+        "files": [{"filename": "claim.pdf_page_1", "type": "bill",
+                   "billItems": [{"name": "AUGMENTIN 625", "amount": 120.0}]}],
+    })
+    assert server_env.warm_cache_from_dataset()["inserted"] == 1
+
+    lookups = []
+    lookup = server_env.get_cached_extraction
+    monkeypatch.setattr(server_env, 'get_cached_extraction', lambda h: lookups.append(h) or lookup(h))
+    upload = FileStorage(io.BytesIO(pdf), filename='claim.pdf', content_type='application/pdf')
+    [result] = server_env.process_file_universal(upload)
+    assert result['from_cache']
+    assert result['cached_data']['billItems'] == [{"name": "AUGMENTIN 625", "amount": 120.0}]
+    # Only the page is looked up: whole PDFs are never cached
+    assert lookups == [server_env._hash_document(page)]
@@ -0,0 +1,66 @@
+import os
+
+import blobstore
+import database
+
+
+def refs(db_path):
+    with database.connection(db_path) as conn:
+        return {row[0]: row[1] for row in conn.execute('SELECT digest, refs FROM blobs')}
+
+
+def make_session(db_path, tmp_path, employee, session_id, files):
+    session_dir = tmp_path / 'dataset' / employee / session_id
+    session_dir.mkdir(parents=True)
+    database.get_writer(db_path).submit(lambda conn: conn.execute(
+        'INSERT INTO sessions (employee_name, session_id) VALUES (?, ?)', (employee, session_id)
+    ), wait=True)
+    blobstore.store_files(db_path, str(tmp_path / 'blobs'), str(session_dir), employee, session_id, files)
+    database.get_writer(db_path).flush()
+    return session_dir
+
+
+def test_identical_pages_are_stored_once(db_path, tmp_path):
+    store = str(tmp_path / 'blobs')
+    first = make_session(db_path, tmp_path, 'Asha', 's1', [('page1.png', b'same'), ('page2.png', b'other')])
+    second = make_session(db_path, tmp_path, 'Asha', 's2', [('page1.png', b'same')])
+
+    digest = blobstore.digest_of(b'same')
+    assert refs(db_path) == {digest: 2, blobstore.digest_of(b'other'): 1}
+    assert os.path.samefile(first / 'page1.png', blobstore.blob_path(store, digest))
+    assert os.path.samefile(second / 'page1.png', blobstore.blob_path(store, digest))
+    stats = blobstore.stats(db_path)
+    assert (stats["blobs"], stats["references"], stats["savedBytes"]) == (2, 3, len(b'same'))
+
+
+def test_gc_drops_blobs_only_after_their_last_reference(db_path, tmp_path):
+    store = str(tmp_path / 'blobs')
+    make_session(db_path, tmp_path, 'Asha', 's1', [('page1.png', b'same')])
+    make_session(db_path, tmp_path, 'Ravi', 's2', [('page1.png', b'same')])
+    digest = blobstore.digest_of(b'same')
+    writer = database.get_writer(db_path)
+
+    writer.submit(lambda conn: conn.execute("DELETE FROM sessions WHERE session_id = 's1'"), wait=True)
+    assert blobstore.gc(db_path, store) == {"blobs": 0, "bytes": 0}
+    assert refs(db_path) == {digest: 1}
+
+    dropped = []
+    writer.submit(lambda conn: conn.execute("DELETE FROM sessions WHERE session_id = 's2'"), wait=True)
+    assert blobstore.gc(db_path, store, on_drop=dropped.append) == {"blobs": 1, "bytes": len(b'same')}
+    assert dropped == [digest]
+    assert refs(db_path) == {}
+    assert not os.path.exists(blobstore.blob_path(store, digest))
+
+
+def test_ingest_links_existing_files(db_path, tmp_path):
+    store = str(tmp_path / 'blobs')
+    session_dir = tmp_path / 'dataset' / 'Asha' / 's1'
+    session_dir.mkdir(parents=True)
+    (session_dir / 'page1.png').write_bytes(b'page')
+
+    result = blobstore.ingest_session_dir(db_path, store, str(session_dir), 'Asha', 's1')
+    assert (result["files"], result["alreadyLinked"]) == (1, 0)
+    again = blobstore.ingest_session_dir(db_path, store, str(session_dir), 'Asha', 's1')
+    assert again["alreadyLinked"] == 1
+    database.get_writer(db_path).flush()
+    assert refs(db_path) == {blobstore.digest_of(b'page'): 1}
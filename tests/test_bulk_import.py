@@ -0,0 +1,53 @@
+import database
+from conftest import write_session
+
+SESSIONS = [('Asha', '20251001_090000'), ('Asha', '20251002_090000'), ('Ravi', '20251003_090000')]
+
+
+def claim(employee: str, page: str) -> dict:
+    return {
+        "employee": employee,
+        "files": [{"filename": page, "type": "bill", "billItems": [{"name": "AUGMENTIN 625", "amount": 120.0}]}],
+        "aggregated": {"prescriptions": [], "tests": [],
+                       "bills": [{"items": [{"name": "AUGMENTIN 625", "amount": 120.0}]}]},
+        "matching": {}
+    }
+
+
+def make_dataset(server):
+    for i, (employee, session_id) in enumerate(SESSIONS):
+        write_session(server.DATASET_DIR, employee, session_id, {f'page_{i}.png': b'page %d' % i},
+                      claim(employee, f'page_{i}.png'))
+
+
+def test_import_records_sessions_line_items_and_cache(server_env):
+    make_dataset(server_env)
+    result = server_env.bulk_import_dataset(workers=2, batch_size=2)
+    assert (result["sessionsFound"], result["sessionsImported"], result["batches"]) == (3, 3, 2)
+    assert (result["lineItems"], result["cacheRows"], result["resumedAfter"]) == (3, 3, None)
+
+    with server_env.db_connection() as conn:
+        assert sorted(tuple(r) for r in conn.execute('SELECT employee_name, session_id FROM sessions')) == SESSIONS
+        assert conn.execute('SELECT COUNT(*) FROM claim_bill_items').fetchone()[0] == 3
+        totals = dict(conn.execute('SELECT name, total_sessions FROM employees').fetchall())
+        # A completed run leaves no checkpoint behind
+        assert conn.execute('SELECT COUNT(*) FROM import_checkpoints').fetchone()[0] == 0
+    assert totals == {'Asha': 2, 'Ravi': 1}
+    cached = server_env.get_cached_extraction(server_env._hash_document(b'page 0'))
+    assert cached['billItems'] == [{"name": "AUGMENTIN 625", "amount": 120.0}]
+
+
+def test_interrupted_import_resumes_after_its_checkpoint(server_env):
+    make_dataset(server_env)
+    dataset_dir = server_env.DATASET_DIR
+    # A run that committed its first batch and then died
+    first = [server_env.session_rows.parse_session(f'{dataset_dir}/Asha/20251001_090000')]
+    database.get_writer(server_env.DB_PATH).submit(
+        server_env._write_import_batch, dataset_dir, first, 'Asha/20251001_090000', wait=True
+    )
+
+    result = server_env.bulk_import_dataset(workers=1, batch_size=10)
+    assert (result["resumedAfter"], result["sessionsImported"]) == ('Asha/20251001_090000', 2)
+    with server_env.db_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0] == 3
+    assert server_env.bulk_import_dataset(workers=1)["resumedAfter"] is None
@@ -0,0 +1,80 @@
+import pytest
+
+import database
+from cache_backend import RedisCacheBackend, SQLiteCacheBackend
+
+fakeredis = pytest.importorskip('fakeredis')
+
+EXTRACTION = {"type": "bill", "billItems": [{"name": "AUGMENTIN 625", "amount": 120.0}]}
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def backend(request, db_path):
+    if request.param == 'redis':
+        return RedisCacheBackend(prefix='test', client=fakeredis.FakeRedis())
+    return SQLiteCacheBackend(db_path)
+
+
+def settle(backend):
+    """Wait for the SQLite backend's queued (group-committed) writes"""
+    if isinstance(backend, SQLiteCacheBackend):
+        database.get_writer(backend.db_path).submit(lambda conn: None, wait=True)
+
+
+def test_set_get_and_stats(backend):
+    assert backend.get('h1') is None
+    backend.set('h1', 'bill.png', 'bill', EXTRACTION)
+    settle(backend)
+    assert backend.get('h1') == EXTRACTION
+    backend.record_hits({'h1': (3, '2025-10-08T10:00:00')})
+    backend.record_hits({'h1': (2, '2025-10-08T11:00:00')})
+    settle(backend)
+    stats = backend.stats()
+    assert (stats["totalCached"], stats["totalAccesses"], stats["negativeEntries"]) == (1, 6, 0)
+
+
+def test_add_many_never_overwrites(backend):
+    backend.set('h1', 'bill.png', 'bill', EXTRACTION)
+    settle(backend)
+    rows = [
+        ('h1', 'old.png', 'prescription', '{"type": "prescription"}', '2025-10-01', '2025-10-01'),
+        ('h2', 'new.png', 'bill', '{"type": "bill"}', '2025-10-01', '2025-10-01'),
+    ]
+    assert backend.add_many(rows) == 1
+    assert backend.get('h1') == EXTRACTION
+    assert backend.get('h2') == {"type": "bill"}
+
+
+def test_negative_cache(backend):
+    assert backend.get_failure('h1') is None
+    backend.record_failure('h1', 'rate_limited', 'HTTP 429', ttl_seconds=60)
+    failure = backend.record_failure('h1', 'rate_limited', 'HTTP 429', ttl_seconds=60)
+    assert (failure["failureClass"], failure["attempts"]) == ('rate_limited', 2)
+    assert backend.stats()["negativeEntries"] == 1
+    backend.clear_failure('h1')
+    assert backend.get_failure('h1') is None
+
+
+def test_clear(backend):
+    backend.set('h1', 'bill.png', 'bill', EXTRACTION)
+    backend.clear()
+    assert backend.get('h1') is None
+    assert backend.stats()["totalCached"] == 0
+
+
+def test_redis_stats_fetch_hit_counts_in_pipelines(monkeypatch):
+    client = fakeredis.FakeRedis()
+    backend = RedisCacheBackend(prefix='test', client=client)
+    monkeypatch.setattr(RedisCacheBackend, 'STATS_BATCH', 4)
+    for i in range(10):
+        backend.set(f'h{i}', f'{i}.png', 'bill', EXTRACTION)
+        backend.record_hits({f'h{i}': (1, '2025-10-08T10:00:00')})
+    # A stray key under another prefix is not counted
+    RedisCacheBackend(prefix='other', client=client).set('h0', '0.png', 'bill', EXTRACTION)
+
+    def no_single_gets(*args, **kwargs):
+        raise AssertionError('stats() must not issue an HGET per key')
+
+    monkeypatch.setattr(client, 'hget', no_single_gets)
+    stats = backend.stats()
+    assert (stats["totalCached"], stats["totalAccesses"]) == (10, 20)
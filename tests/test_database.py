@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+import database
+
+
+@pytest.fixture
+def writer(tmp_path):
+    writer = database.DatabaseWriter(str(tmp_path / 'writer.db'))
+    writer.submit(lambda conn: conn.execute('CREATE TABLE t (x INTEGER)'), wait=True)
+    yield writer
+    writer.stop()
+
+
+def values(writer):
+    with database.connection(writer.db_path) as conn:
+        return sorted(row[0] for row in conn.execute('SELECT x FROM t'))
+
+
+def test_submit_returns_the_job_result(writer):
+    assert writer.submit(lambda conn, x: conn.execute('INSERT INTO t VALUES (?)', (x,)).rowcount, 1,
+                         wait=True) == 1
+    assert values(writer) == [1]
+
+
+def test_failing_job_does_not_undo_the_rest_of_its_batch(writer):
+    started = threading.Event()
+    release = threading.Event()
+
+    def block(conn):
+        started.set()
+        release.wait(5)
+
+    def fail(conn):
+        conn.execute('INSERT INTO t VALUES (2)')
+        raise ValueError('boom')
+
+    writer.submit(block)
+    started.wait(5)
+    # Queued behind the blocking job, so all three commit in one batch
+    writer.submit(lambda conn: conn.execute('INSERT INTO t VALUES (1)'))
+    writer.submit(fail)
+    writer.submit(lambda conn: conn.execute('INSERT INTO t VALUES (3)'))
+    release.set()
+    writer.flush()
+    assert values(writer) == [1, 3]
+    assert writer.stats()["errors"] == 1
+
+
+def test_nested_submit_runs_inline(writer):
+    def outer(conn):
+        conn.execute('INSERT INTO t VALUES (1)')
+        return writer.submit(lambda c: c.execute('INSERT INTO t VALUES (2)') and 'inner', wait=True)
+
+    assert writer.submit(outer, wait=True) == 'inner'
+    assert values(writer) == [1, 2]
+
+
+def test_failed_nested_submit_keeps_the_outer_job(writer):
+    def outer(conn):
+        conn.execute('INSERT INTO t VALUES (1)')
+        with pytest.raises(ZeroDivisionError):
+            writer.submit(lambda c: (c.execute('INSERT INTO t VALUES (2)'), 1 / 0), wait=True)
+
+    writer.submit(outer, wait=True)
+    assert values(writer) == [1]
+
+
+def test_wait_is_bounded(writer, monkeypatch):
+    monkeypatch.setattr(database, 'WRITE_WAIT_TIMEOUT', 0.2)
+    with pytest.raises(TimeoutError):
+        writer.submit(lambda conn: time.sleep(1), wait=True)
+
+
+def test_dead_writer_fails_pending_and_later_jobs(tmp_path, monkeypatch):
+    def broken(path):
+        raise OSError('disk gone')
+
+    monkeypatch.setattr(database, 'open_connection', broken)
+    writer = database.DatabaseWriter(str(tmp_path / 'dead.db'))
+    with pytest.raises(database.WriterStopped):
+        writer.submit(lambda conn: None, wait=True)
+    with pytest.raises(database.WriterStopped):
+        writer.submit(lambda conn: None)
@@ -0,0 +1,83 @@
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from conftest import write_session
+
+
+def recorded(server):
+    with server.db_connection() as conn:
+        return sorted(tuple(row) for row in conn.execute('SELECT employee_name, session_id FROM sessions'))
+
+
+def test_mtime_scan_only_opens_changed_dirs(server_env):
+    write_session(server_env.DATASET_DIR, 'Asha', '20251008_100305', {'page.png': b'x'})
+    write_session(server_env.DATASET_DIR, 'Ravi', '20251008_110000', {'page.png': b'x'})
+    assert server_env.sync_dataset_changes(scan_dirs=True)["added"] == 2
+    assert server_env.sync_dataset_changes(scan_dirs=True)["directoriesScanned"] == 0
+
+    shutil.rmtree(os.path.join(server_env.DATASET_DIR, 'Ravi', '20251008_110000'))
+    write_session(server_env.DATASET_DIR, 'Asha', '20251009_090000', {'page.png': b'x'})
+    result = server_env.sync_dataset_changes(scan_dirs=True)
+    assert (result["added"], result["removed"], result["directoriesScanned"]) == (1, 1, 2)
+    assert recorded(server_env) == [('Asha', '20251008_100305'), ('Asha', '20251009_090000')]
+
+
+def test_journal_entries_are_applied_without_a_scan(server_env):
+    write_session(server_env.DATASET_DIR, 'Asha', '20251008_100305', {'page.png': b'x'})
+    # Not journalled and not scanned: stays unseen
+    assert server_env.sync_dataset_changes(scan_dirs=False)["added"] == 0
+    server_env.journal_dataset_change('Asha', '20251008_100305', 'create', 'test')
+    result = server_env.sync_dataset_changes(scan_dirs=False)
+    assert (result["added"], result["journalEntries"]) == (1, 1)
+    assert server_env.sync_dataset_changes(scan_dirs=False)["journalEntries"] == 0
+
+
+class StopWatching(Exception):
+    pass
+
+
+def test_watcher_journals_out_of_band_sessions(server_env, monkeypatch):
+    inotify_simple = pytest.importorskip('inotify_simple')
+    monkeypatch.setattr(server_env, 'DATASET_WATCH_DELAY_MS', 50)
+    inotify, watches, stop = inotify_simple.INotify(), {}, threading.Event()
+    read = inotify.read
+
+    def stoppable_read(*args, **kwargs):
+        events = read(*args, **kwargs)
+        if stop.is_set():
+            raise StopWatching()
+        return events
+
+    inotify.read = stoppable_read
+    server_env._add_watch(inotify, watches, server_env.DATASET_DIR, (None, None))
+
+    def watch():
+        try:
+            server_env._watch_dataset(inotify, watches)
+        except StopWatching:
+            pass
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        # A new employee dir, then a session whose summary lands later
+        session_dir = os.path.join(server_env.DATASET_DIR, 'Asha', '20251008_100305')
+        os.makedirs(os.path.dirname(session_dir))
+        time.sleep(0.3)
+        os.makedirs(session_dir)
+        time.sleep(0.3)
+        write_session(server_env.DATASET_DIR, 'Asha', '20251008_100305', {'page.png': b'x'})
+        deadline = time.time() + 5
+        while not recorded(server_env) and time.time() < deadline:
+            time.sleep(0.05)
+        assert recorded(server_env) == [('Asha', '20251008_100305')]
+    finally:
+        stop.set()
+        os.makedirs(os.path.join(server_env.DATASET_DIR, 'wake'))
+        watcher.join(5)
+        inotify.close()
+    assert not watcher.is_alive()
@@ -0,0 +1,59 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from conftest import add_session
+
+
+@pytest.fixture
+def client(server_env):
+    return server_env.app.test_client()
+
+
+def sessions_page(client, **params):
+    query = '&'.join(f'{k}={v}' for k, v in {'employee': 'Asha', **params}.items())
+    return client.get(f'/api/datasets?{query}')
+
+
+def test_session_listing_pages_by_cursor(server_env, client):
+    for day in (1, 2, 3):
+        add_session(server_env, 'Asha', f'2025010{day}_100000', f'2025-01-0{day} 10:00:00')
+
+    first = sessions_page(client, limit=2).get_json()
+    assert [s["session"] for s in first["sessions"]] == ['20250103_100000', '20250102_100000']
+    assert (first["total"], first["hasMore"]) == (3, True)
+    assert first["sessions"][0]["stats"]["createdAt"].startswith('2025-01-03T10:00:00')
+
+    rest = sessions_page(client, limit=2, cursor=first["nextCursor"]).get_json()
+    assert [s["session"] for s in rest["sessions"]] == ['20250101_100000']
+    assert (rest["hasMore"], rest["nextCursor"]) == (False, None)
+    assert sessions_page(client, cursor='not-a-cursor').status_code == 400
+
+
+def test_unchanged_listing_is_not_modified(server_env, client):
+    add_session(server_env, 'Asha', '20250101_100000', '2025-01-01 10:00:00')
+    first = sessions_page(client)
+    again = client.get('/api/datasets?employee=Asha', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+    add_session(server_env, 'Asha', '20250102_100000', '2025-01-02 10:00:00')
+    changed = client.get('/api/datasets?employee=Asha', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and changed.get_json()["total"] == 2
+
+
+def test_total_counts_only_sessions_that_can_be_paged(server_env, client):
+    add_session(server_env, 'Asha', '20240105_100000', '2024-01-05 10:00:00')
+    add_session(server_env, 'Asha', '20240106_100000', '2024-01-06 10:00:00')
+    now = datetime.now(timezone.utc)
+    add_session(server_env, 'Asha', now.strftime('%Y%m%d_%H%M%S'), now.strftime('%Y-%m-%d %H:%M:%S'))
+    before = sessions_page(client)
+    assert before.get_json()["total"] == 3
+
+    assert server_env.archive_old_sessions(6)["archived"]
+    after = client.get('/api/datasets?employee=Asha', headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    listing = after.get_json()
+    assert (listing["total"], len(listing["sessions"]), listing["hasMore"]) == (1, 1, False)
+    # The employee keeps its lifetime totals
+    employees = client.get('/api/datasets').get_json()["employeesWithStats"]
+    assert employees[0]["sessionCount"] == 3
@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+
+import pytest
+
+from conftest import add_session
+
+
+def claim(employee: str, created_at: str) -> dict:
+    return {
+        "employee": employee,
+        "createdAt": created_at,
+        "files": [{"filename": "page.png", "type": "bill"}],
+        "aggregated": {"prescriptions": [], "tests": [],
+                       "bills": [{"items": [{"name": "AUGMENTIN 625", "amount": 120.0},
+                                            {"name": "COLD DRINK", "amount": 30.0}]}]},
+        "matching": {
+            "matchedItems": [{"prescriptionName": "Augmentin", "billItemName": "AUGMENTIN 625",
+                              "amount": 120.0, "matchScore": 0.95, "status": "admissible"}],
+            "inadmissibleItems": [{"billItemName": "COLD DRINK", "amount": 30.0,
+                                   "status": "inadmissible", "reason": "Not prescribed"}],
+        }
+    }
+
+
+@pytest.fixture
+def claims(server_env):
+    for employee, session_id, created_at in (('Asha', '20240115_090000', '2024-01-15 09:00:00'),
+                                             ('Asha', '20251001_090000', '2025-10-01 09:00:00'),
+                                             ('Ravi', '20251005_090000', '2025-10-05 09:00:00')):
+        add_session(server_env, employee, session_id, created_at, summary=claim(employee, created_at))
+    return server_env
+
+
+@pytest.mark.parametrize('source', ['db', 'dataset'])
+def test_claims_csv_streams_every_source_in_order(claims, source):
+    # The oldest month is archived first: it is exported from its archive database
+    claims.archive_old_sessions(6)
+    response = claims.app.test_client().get(f'/api/export/claims?format=csv&source={source}')
+    assert response.status_code == 200 and response.is_streamed
+    assert 'attachment' in response.headers['Content-Disposition']
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [r['session_id'] for r in rows] == ['20240115_090000', '20251001_090000', '20251005_090000']
+    assert rows[1]['line_items'] == '2'
+    assert (float(rows[1]['admissible_amount']), float(rows[1]['inadmissible_amount'])) == (120.0, 30.0)
+
+
+def test_items_jsonl_filters_by_date_and_employee(claims):
+    client = claims.app.test_client()
+    response = client.get('/api/export/items?format=jsonl&from=2025-10-01&to=2025-10-31&employee=Asha')
+    items = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(i['session_id'], i['kind'], i['bill_item_name']) for i in items] == [
+        ('20251001_090000', 'matched', 'AUGMENTIN 625'),
+        ('20251001_090000', 'inadmissible', 'COLD DRINK'),
+    ]
+    assert client.get('/api/export/items?from=2025-13-01').status_code == 400
+    assert client.get('/api/export/nothing').status_code == 400
+
+
+def test_parquet_export(claims):
+    pq = pytest.importorskip('pyarrow.parquet')
+    response = claims.app.test_client().get('/api/export/items?format=parquet')
+    table = pq.read_table(io.BytesIO(response.data))
+    assert table.num_rows == 6
+    assert table.schema.field('amount').type == 'double'
@@ -0,0 +1,110 @@
+import io
+import os
+
+import pytest
+
+import database
+
+
+@pytest.fixture
+def client(server_env, monkeypatch):
+    calls = []
+
+    def process(employee, files, content_hashes, force_retry):
+        calls.append(content_hashes)
+        return {"files": [], "saved": {"employee": employee, "sessionDir": f"dataset/{employee}/s{len(calls)}"}}
+
+    monkeypatch.setattr(server_env, '_process_ocr_upload', process)
+    client = server_env.app.test_client()
+    client.calls = calls
+    return client
+
+
+def upload(client, key=None, content=b'page'):
+    headers = {'Idempotency-Key': key} if key else {}
+    return client.post('/api/ocr/auto', headers=headers, content_type='multipart/form-data',
+                       data={'employee': 'Asha', 'files': [(io.BytesIO(content), 'a.png', 'image/png')]})
+
+
+def test_retry_with_the_same_key_replays(client):
+    first = upload(client, 'key-1')
+    second = upload(client, 'key-1')
+    assert first.status_code == second.status_code == 200
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert second.get_json() == first.get_json()
+    assert len(client.calls) == 1
+
+
+def test_without_a_key_every_request_runs(client):
+    upload(client)
+    upload(client)
+    assert len(client.calls) == 2
+
+
+def test_key_reused_for_another_request_is_rejected(client):
+    upload(client, 'key-1')
+    assert upload(client, 'key-1', content=b'other page').status_code == 422
+
+
+def test_pending_key_is_busy_until_its_lease_expires(server_env, client):
+    claim = server_env._write_claim_idempotency_key
+    fingerprint = server_env._idempotency_fingerprint('Asha', [server_env._hash_document(b'page')], False)
+    writer = database.get_writer(server_env.DB_PATH)
+    assert writer.submit(claim, 'key-1', fingerprint, 'Asha', wait=True) is None
+
+    busy = upload(client, 'key-1')
+    assert busy.status_code == 409
+    assert busy.headers['Retry-After']
+
+    # The first request died without finishing: after the lease a retry takes over
+    writer.submit(lambda conn: conn.execute(
+        "UPDATE idempotency_keys SET created_at = DATETIME('now', ?)",
+        (f'-{server_env.IDEMPOTENCY_LEASE_SECONDS + 1} seconds',)
+    ), wait=True)
+    assert upload(client, 'key-1').status_code == 200
+    assert len(client.calls) == 1
+    assert upload(client, 'key-1').headers['Idempotent-Replayed'] == 'true'
+
+
+def test_failed_request_releases_its_key(server_env, client, monkeypatch):
+    def broken(*args):
+        raise RuntimeError('extraction failed')
+
+    monkeypatch.setattr(server_env, '_process_ocr_upload', broken)
+    monkeypatch.setattr(server_env.app, 'testing', False)
+    assert upload(client, 'key-1').status_code == 500
+    with database.connection(server_env.DB_PATH) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM idempotency_keys').fetchone()[0] == 0
+
+
+def test_session_ids_skip_taken_ids_without_holding_the_lock(server_env, monkeypatch):
+    emp_dir = os.path.join(server_env.DATASET_DIR, 'Asha')
+    os.makedirs(emp_dir)
+    claimed = []
+
+    def claim(session_id):
+        # Database work runs after the allocation lock is released
+        assert not server_env._session_id_lock.locked()
+        claimed.append(session_id)
+        if len(claimed) == 1:
+            raise FileExistsError(session_id)
+
+    first = server_env._allocate_session_id('Asha', lambda sid: os.mkdir(os.path.join(emp_dir, sid)), claim)
+    assert claimed == [claimed[0], first] and first > claimed[0]
+
+
+def test_directory_and_link_never_share_an_id(server_env):
+    taken = os.path.basename(server_env._new_session_dir('Asha'))
+    server_env._last_session_ids.clear()
+    # The next link starts at the same second, finds the directory and moves on
+    linked = server_env._allocate_session_id(
+        'Asha', lambda sid: server_env._session_dir_free('Asha', sid),
+        lambda sid: server_env.link_session('Asha', sid, taken, 'memo')
+    )
+    assert linked != taken
+
+    server_env._last_session_ids.clear()
+    with database.connection(server_env.DB_PATH) as conn:
+        links = [row[0] for row in conn.execute('SELECT session_id FROM session_links')]
+    new_dir = os.path.basename(server_env._new_session_dir('Asha'))
+    assert new_dir not in links + [taken]
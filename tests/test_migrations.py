@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+
+import database
+import migrations
+from conftest import ROOT
+
+
+def test_migrate_reaches_latest_and_is_idempotent(tmp_path):
+    path = str(tmp_path / 'fresh.db')
+    applied = migrations.migrate(path)
+    assert [m["version"] for m in applied] == [m.version for m in migrations.MIGRATIONS]
+    assert migrations.current_version(path) == migrations.LATEST_VERSION
+    assert migrations.migrate(path) == []
+    database.get_writer(path).stop()
+
+
+def test_migrate_stops_at_target_and_resumes(tmp_path):
+    path = str(tmp_path / 'stepwise.db')
+    migrations.migrate(path, target=5)
+    assert migrations.current_version(path) == 5
+    applied = migrations.migrate(path)
+    assert applied[0]["version"] == 6
+    status = migrations.status(path)
+    assert status["currentVersion"] == migrations.LATEST_VERSION
+    assert all(m["applied"] for m in status["migrations"])
+    database.get_writer(path).stop()
+
+
+def _add_session(conn, employee, session_id, files, amount, created_at='2025-10-08 10:00:00'):
+    conn.execute('''
+        INSERT INTO sessions (employee_name, session_id, file_count, prescription_count, bill_count,
+                              total_amount, created_at)
+        VALUES (?, ?, ?, 0, 1, ?, ?)
+    ''', (employee, session_id, files, amount, created_at))
+
+
+def test_triggers_keep_employee_totals_and_rollups(db_path):
+    writer = database.get_writer(db_path)
+    writer.submit(_add_session, 'Asha', 's1', 2, 100.0, wait=True)
+    writer.submit(_add_session, 'Asha', 's2', 1, 50.5, wait=True)
+    writer.submit(_add_session, 'Ravi', 's3', 3, 10.0, wait=True)
+    writer.submit(lambda conn: conn.execute("DELETE FROM sessions WHERE session_id = 's3'"), wait=True)
+
+    with database.connection(db_path) as conn:
+        asha = conn.execute(
+            "SELECT total_sessions, total_files, total_amount FROM employees WHERE name = 'Asha'"
+        ).fetchone()
+        assert tuple(asha) == (2, 3, 150.5)
+        assert migrations.rollup_drift(conn) == []
+
+
+def test_legacy_iso_last_activity_is_converted(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    migrations.migrate(path, target=17)
+    writer = database.get_writer(path)
+    writer.submit(lambda conn: conn.execute(
+        "INSERT INTO employees (name, last_activity) VALUES ('Asha', '2025-10-08T10:00:00.123456')"
+    ), wait=True)
+    migrations.migrate(path)
+    writer.submit(_add_session, 'Asha', 's1', 1, 10.0, '2025-10-08 09:00:00', wait=True)
+
+    with database.connection(path) as conn:
+        last = conn.execute("SELECT last_activity FROM employees WHERE name = 'Asha'").fetchone()[0]
+    # Local time converted to the UTC 'YYYY-MM-DD HH:MM:SS' form the triggers compare against
+    assert 'T' not in last and len(last) == 19
+    writer.stop()
+
+
+def manage(db_path, *args):
+    """Run manage.py in a fresh interpreter against db_path and parse its JSON output"""
+    result = subprocess.run([sys.executable, os.path.join(ROOT, 'manage.py'), *args],
+                            env={**os.environ, 'DB_PATH': db_path}, capture_output=True, text=True, check=True)
+    # The JSON report follows any progress lines
+    return json.loads(result.stdout[result.stdout.index('{'):])
+
+
+def test_manage_migrate_sees_the_schema_as_it_is(tmp_path):
+    path = str(tmp_path / 'empty.db')
+    status = manage(path, 'migrate', '--status')
+    assert status["currentVersion"] == 0
+    assert status["pending"] == [m.version for m in migrations.MIGRATIONS]
+
+    assert manage(path, 'migrate', '--target', '3')["currentVersion"] == 3
+    status = manage(path, 'migrate', '--status')
+    assert status["currentVersion"] == 3
+    assert status["pending"][0] == 4
@@ -0,0 +1,75 @@
+import io
+
+import pytest
+import requests
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+
+def png(color='white') -> bytes:
+    out = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(out, 'PNG')
+    return out.getvalue()
+
+
+@pytest.fixture
+def gemini(server_env, monkeypatch):
+    """call_gemini_with_grounding replaced by a scripted outcome; records max_attempts per call"""
+    calls = []
+
+    def call(image_bytes, mime, prompt, api_key, use_grounding=False, max_attempts=3):
+        calls.append(max_attempts)
+        outcome = gemini.outcome
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    gemini.outcome = server_env.ExtractionResponseError('no JSON in response')
+    monkeypatch.setattr(server_env, 'call_gemini_with_grounding', call)
+    monkeypatch.setattr(server_env, 'build_enhanced_prompt_with_context', lambda: 'prompt')
+    gemini.calls = calls
+    return gemini
+
+
+def upload(server, page: bytes, force_retry=False) -> dict:
+    files = [FileStorage(io.BytesIO(page), filename='bill.png', content_type='image/png')]
+    return server._process_ocr_upload(None, files, [server._hash_document(page)], force_retry)["files"][0]
+
+
+def test_repeated_failures_fail_fast_until_a_forced_retry(server_env, gemini):
+    page = png()
+    assert upload(server_env, page)["error"].startswith('API Error')
+    # One recent failure: a single degraded attempt
+    assert upload(server_env, page)["error"].startswith('API Error')
+    assert gemini.calls == [3, 1]
+
+    result = upload(server_env, page)
+    assert result["error"] == 'EXTRACTION_RECENTLY_FAILED'
+    assert (result["failureClass"], result["attempts"]) == ('json_decode', 2)
+    assert result["retryAfter"]
+    assert gemini.calls == [3, 1]
+
+    gemini.outcome = {"type": "bill", "billItems": [{"name": "AUGMENTIN 625", "amount": 120.0}]}
+    assert upload(server_env, page, force_retry=True)["type"] == 'bill'
+    assert server_env.get_extraction_failure(server_env._hash_document(page)) is None
+
+
+def test_quota_and_auth_errors_are_not_cached(server_env, gemini):
+    response = requests.Response()
+    response.status_code = 429
+    gemini.outcome = requests.HTTPError('rate limited', response=response)
+    page = png('black')
+    upload(server_env, page)
+    upload(server_env, page)
+    assert gemini.calls == [3, 3]
+    assert server_env.get_extraction_failure(server_env._hash_document(page)) is None
+
+
+def test_failures_can_be_cleared_over_the_api(server_env, gemini):
+    page = png('red')
+    upload(server_env, page)
+    upload(server_env, page)
+    client = server_env.app.test_client()
+    assert client.post('/api/cache/failures/clear', json={}).get_json()["cleared"] == 'all'
+    upload(server_env, page)
+    assert gemini.calls == [3, 1, 3]
@@ -0,0 +1,52 @@
+import os
+
+import packs
+
+
+def session(tmp_path, session_id, files):
+    session_dir = tmp_path / 'dataset' / 'Asha' / session_id
+    session_dir.mkdir(parents=True)
+    for name, data in files.items():
+        (session_dir / name).write_bytes(data)
+    return str(session_dir)
+
+
+def test_write_and_read_back(tmp_path):
+    path = packs.pack_path(str(tmp_path / 'packs'), 'Asha', '2025-10')
+    sessions = {
+        '20251008_100305': session(tmp_path, '20251008_100305', {'page1.png': b'same', 'summary.jsonz': b'a'}),
+        '20251009_090000': session(tmp_path, '20251009_090000', {'page1.png': b'same', 'page2.png': b'x'}),
+    }
+    result = packs.write_pack(path, sessions)
+    assert (result["sessions"], result["files"], result["kept"]) == (2, 4, 2)
+    # The shared page is stored once
+    assert result["bytesStored"] == len(b'same') + len(b'a') + len(b'x')
+
+    pack = packs.open_pack(path)
+    assert pack.session_ids() == sorted(sessions)
+    assert pack.names('20251009_090000') == ['page1.png', 'page2.png']
+    assert pack.read('20251008_100305', 'page1.png') == b'same'
+    assert pack.read('20251009_090000', 'page2.png') == b'x'
+    assert pack.read('20251009_090000', 'missing.png') is None
+    assert not [name for name in os.listdir(os.path.dirname(path)) if name.startswith('.tmp-')]
+
+
+def test_repacking_keeps_existing_sessions_and_drops(tmp_path):
+    path = packs.pack_path(str(tmp_path / 'packs'), 'Asha', '2025-10')
+    packs.write_pack(path, {'s1': session(tmp_path, 's1', {'page.png': b'one'})})
+    packs.write_pack(path, {'s2': session(tmp_path, 's2', {'page.png': b'two'})})
+    pack = packs.open_pack(path)
+    assert pack.session_ids() == ['s1', 's2']
+    assert pack.read('s1', 'page.png') == b'one'
+
+    result = packs.write_pack(path, {}, drop={'s1'})
+    assert result["kept"] == 1
+    assert packs.open_pack(path).session_ids() == ['s2']
+
+
+def test_pack_left_empty_is_deleted(tmp_path):
+    path = packs.pack_path(str(tmp_path / 'packs'), 'Asha', '2025-10')
+    packs.write_pack(path, {'s1': session(tmp_path, 's1', {'page.png': b'one'})})
+    assert packs.write_pack(path, {}, drop={'s1'})["kept"] == 0
+    assert not os.path.exists(path)
+    assert packs.open_pack(path) is None
@@ -0,0 +1,94 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import database
+import retention
+from conftest import write_session
+
+
+def created(days_ago: int) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=days_ago)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def record(server, employee, session_id, days_ago, files=None):
+    """A stored session directory and its sessions row, days_ago old"""
+    session_dir = write_session(server.DATASET_DIR, employee, session_id, files or {'page.png': b'x' * 1000})
+    database.get_writer(server.DB_PATH).submit(
+        server._write_session, employee, session_id, (1, 0, 0, 0.0), None, created(days_ago), wait=True
+    )
+    return session_dir
+
+
+def session_ids(db_path):
+    with database.connection(db_path) as conn:
+        return sorted(row[0] for row in conn.execute('SELECT session_id FROM sessions'))
+
+
+@pytest.fixture
+def sessions(server_env):
+    dirs = {
+        'a_old': record(server_env, 'Asha', 'a_old', 400),
+        'a_mid': record(server_env, 'Asha', 'a_mid', 30),
+        'a_new': record(server_env, 'Asha', 'a_new', 1),
+        'r_old': record(server_env, 'Ravi', 'r_old', 300),
+    }
+    return dirs
+
+
+def test_policy_selection(server_env, sessions):
+    db = server_env.DB_PATH
+    assert [v[1] for v in retention.expired_sessions(db, 200, 10)] == ['a_old', 'r_old']
+    assert [v[1] for v in retention.over_quota_sessions(db, 2, 10)] == ['a_old']
+    # Each employee's newest session and anything younger than min_age_days is spared
+    assert [v[1] for v in retention.oldest_sessions(db, 10, min_age_days=7)] == ['a_old', 'a_mid']
+    assert [v[1] for v in retention.oldest_sessions(db, 10, min_age_days=60)] == ['a_old']
+
+
+def test_age_policy_removes_directories_and_rows(server_env, sessions, monkeypatch):
+    monkeypatch.setattr(server_env, 'RETENTION_MAX_AGE_DAYS', 200)
+    monkeypatch.setattr(server_env, 'RETENTION_BATCH_PAUSE_MS', 0)
+
+    preview = server_env.run_retention(dry_run=True)
+    assert preview["byPolicy"] == {"age": 2}
+    assert session_ids(server_env.DB_PATH) == ['a_mid', 'a_new', 'a_old', 'r_old']
+
+    result = server_env.run_retention()
+    assert result["byPolicy"] == {"age": 2}
+    assert session_ids(server_env.DB_PATH) == ['a_mid', 'a_new']
+    assert not os.path.exists(sessions['a_old']) and not os.path.exists(sessions['r_old'])
+    assert os.path.isdir(sessions['a_mid'])
+    with database.connection(server_env.DB_PATH) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM employees WHERE name = 'Ravi'").fetchone()[0] == 0
+
+
+def test_quota_policy_keeps_the_newest_sessions(server_env, sessions, monkeypatch):
+    monkeypatch.setattr(server_env, 'RETENTION_MAX_SESSIONS_PER_EMPLOYEE', 1)
+    monkeypatch.setattr(server_env, 'RETENTION_BATCH_PAUSE_MS', 0)
+    result = server_env.run_retention()
+    assert result["byPolicy"] == {"quota": 2}
+    assert session_ids(server_env.DB_PATH) == ['a_new', 'r_old']
+
+
+def test_disk_budget_stops_when_deletions_stop_paying_off(server_env, sessions, monkeypatch):
+    monkeypatch.setattr(server_env, 'RETENTION_DISK_BUDGET_MB', 1)
+    monkeypatch.setattr(server_env, 'RETENTION_BATCH_PAUSE_MS', 0)
+    monkeypatch.setattr(server_env, 'RETENTION_BATCH_SIZE', 1)
+    # Spared sessions alone exceed the budget
+    with open(os.path.join(sessions['a_new'], 'big.png'), 'wb') as f:
+        f.write(b'\0' * (2 * 1048576))
+
+    result = server_env.run_retention()
+    assert result["overBudget"]
+    assert result["budgetStopped"]
+    assert result["byPolicy"]["budget"] == 1
+    assert 'a_new' in session_ids(server_env.DB_PATH)
+
+
+def test_throttle_paces_by_bytes(monkeypatch):
+    slept = []
+    monkeypatch.setattr(retention.time, 'sleep', slept.append)
+    throttle = retention.Throttle(mb_per_sec=1, pause_ms=0)
+    throttle.batch_done(2 * 1048576)
+    assert slept and slept[0] > 1.5
@@ -0,0 +1,88 @@
+import pytest
+
+import database
+from conftest import add_session
+
+
+def claim(bill_items=(), prescriptions=(), tests=()):
+    return {
+        "files": [{"filename": "page.png", "type": "bill", "billItems": [{"name": n, "amount": 10.0} for n in bill_items],
+                   "prescriptionNames": list(prescriptions), "testNames": list(tests)}],
+        "aggregated": {"prescriptions": [], "bills": [], "tests": []},
+        "matching": {}
+    }
+
+
+@pytest.fixture
+def items(server_env):
+    add_session(server_env, 'Asha', '20250101_100000', '2025-01-01 10:00:00',
+                summary=claim(['AUGMENTIN 625 DUO', 'PARACETAMOL 650'], ['Augmentin 625mg'], ['CBC']))
+    add_session(server_env, 'Ravi', '20250102_100000', '2025-01-02 10:00:00',
+                summary=claim(['<img src=x onerror=alert(1)> AUGMENTIN 375']))
+    return server_env
+
+
+def search(client, **params):
+    return client.get('/api/search/items', query_string=params).get_json()
+
+
+def test_prefix_phrase_and_filters(items):
+    client = items.app.test_client()
+    found = search(client, q='augm')
+    assert found["total"] == 3
+    assert {r["employee"] for r in found["results"]} == {'Asha', 'Ravi'}
+    assert [r["name"] for r in search(client, q='augm', kind='prescription')["results"]] == ['Augmentin 625mg']
+    assert search(client, q='augm', employee='Ravi')["total"] == 1
+    assert [r["name"] for r in search(client, q='paracetamol 650', mode='phrase')["results"]] == ['PARACETAMOL 650']
+    assert client.get('/api/search/items', query_string={'q': 'x', 'mode': 'bogus'}).status_code == 400
+
+
+def test_fuzzy_search_tolerates_ocr_spelling(items):
+    found = items.search_claim_items('augmentn 625', mode='fuzzy')
+    assert found["results"] and found["results"][0]["name"].startswith('AUGMENTIN 625')
+    assert all(r["score"] >= items.FUZZY_MIN_SCORE for r in found["results"])
+
+
+def test_snippets_escape_ocr_text(items):
+    [hit] = items.search_claim_items('augmentin', employee='Ravi')["results"]
+    assert '<img' not in hit["snippet"]
+    assert hit["snippet"] == '&lt;img src=x onerror=alert(1)&gt; <mark>AUGMENTIN</mark> 375'
+
+
+@pytest.fixture
+def employees(server_env):
+    rows = [('Asha_Rao', 5), ('Ash', 1), ('Ashwin_Nair', 40), ('Ravi_Ashok', 9), ('Prakash_Iyer', 30), ('Ravi', 2)]
+    database.get_writer(server_env.DB_PATH).submit(lambda conn: conn.executemany(
+        'INSERT INTO employees (name, total_sessions) VALUES (?, ?)', rows
+    ), wait=True)
+    return server_env
+
+
+def ranked(server, query, limit=10):
+    return [(r["name"], r["relevance"]) for r in server.search_employees_indexed(query, limit)]
+
+
+def test_employee_search_ranks_exact_prefix_word_start_substring(employees):
+    assert ranked(employees, 'ash') == [
+        ('Ash', 1.0), ('Ashwin_Nair', 0.9), ('Asha_Rao', 0.9), ('Ravi_Ashok', 0.7), ('Prakash_Iyer', 0.5)
+    ]
+    assert ranked(employees, 'ash', limit=2) == [('Ash', 1.0), ('Ashwin_Nair', 0.9)]
+
+
+@pytest.mark.parametrize('sort_max', [1000, 1])
+def test_short_queries_rank_by_sessions_over_wide_prefixes(employees, monkeypatch, sort_max):
+    # sort_max=1 sends the prefix through the rank-index walk
+    monkeypatch.setattr(employees, 'EMPLOYEE_PREFIX_SORT_MAX', sort_max)
+    assert ranked(employees, 'as') == [('Ashwin_Nair', 0.9), ('Asha_Rao', 0.9), ('Ash', 0.9)]
+    assert ranked(employees, 'ravi') == [('Ravi', 1.0), ('Ravi_Ashok', 0.9)]
+    assert ranked(employees, 'r', limit=1) == [('Ravi_Ashok', 0.9)]
+
+
+def test_employee_search_clamps_the_limit(employees):
+    client = employees.app.test_client()
+
+    def found(limit):
+        return client.get('/api/search/employees', query_string={'q': 'a', 'limit': limit}).get_json()["employees"]
+
+    assert len(found(-5)) == 1
+    assert len(found(0)) == 3  # missing or zero: the default page
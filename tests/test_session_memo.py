@@ -0,0 +1,65 @@
+import os
+import shutil
+
+import database
+from conftest import drain, write_session
+
+SUMMARY = {
+    "files": [{"filename": "bill.png", "type": "bill"}],
+    "aggregated": {"prescriptions": [], "bills": [], "tests": []},
+    "matching": {}
+}
+
+
+def resubmit(server, memo_key, employee='Asha'):
+    summary = server._answer_from_session_memo(server.get_session_memo(memo_key), memo_key, employee)
+    drain(server.DB_PATH)
+    return summary
+
+
+def session_dirs(server, employee='Asha'):
+    return sorted(os.listdir(os.path.join(server.DATASET_DIR, employee)))
+
+
+def test_resubmit_links_to_the_original_session(server_env):
+    write_session(server_env.DATASET_DIR, 'Asha', '20251008_100305', {'bill.png': b'page'})
+    key = server_env._session_memo_key(['h1'])
+    server_env.store_session_memo(key, SUMMARY, 'Asha', '20251008_100305')
+    drain(server_env.DB_PATH)
+
+    summary = resubmit(server_env, key)
+    assert summary["memoized"]
+    assert summary["saved"]["sessionDir"].endswith('20251008_100305')
+    assert summary["saved"]["linkedSession"] != '20251008_100305'
+    assert session_dirs(server_env) == ['20251008_100305']
+
+
+def test_memo_follows_a_session_that_is_gone(server_env):
+    original = write_session(server_env.DATASET_DIR, 'Asha', '20251008_100305', {'bill.png': b'page'})
+    key = server_env._session_memo_key(['h1'])
+    server_env.store_session_memo(key, SUMMARY, 'Asha', '20251008_100305')
+    drain(server_env.DB_PATH)
+    shutil.rmtree(original)  # deleted, archived or packed
+
+    saved = resubmit(server_env, key)["saved"]
+    new_session = os.path.basename(saved["sessionDir"])
+    assert session_dirs(server_env) == [new_session]
+    assert server_env.get_session_memo(key)["sessionId"] == new_session
+
+    # Later resubmits link to the new session instead of creating yet another one
+    assert resubmit(server_env, key)["saved"]["linkedSession"]
+    assert session_dirs(server_env) == [new_session]
+
+
+def test_other_employee_gets_a_copy_and_the_memo_stays(server_env):
+    write_session(server_env.DATASET_DIR, 'Asha', '20251008_100305', {'bill.png': b'page'})
+    key = server_env._session_memo_key(['h1'])
+    server_env.store_session_memo(key, SUMMARY, 'Asha', '20251008_100305')
+    drain(server_env.DB_PATH)
+
+    saved = resubmit(server_env, key, 'Ravi')["saved"]
+    assert saved["employee"] == 'Ravi'
+    assert len(session_dirs(server_env, 'Ravi')) == 1
+    assert server_env.get_session_memo(key)["sessionId"] == '20251008_100305'
+    with database.connection(server_env.DB_PATH) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sessions WHERE employee_name = 'Ravi'").fetchone()[0] == 1
@@ -0,0 +1,52 @@
+import json
+import os
+
+import summary_store
+
+SUMMARY = {
+    "employee": "Asha Rao",
+    "createdAt": "2025-10-08T10:03:05",
+    "files": [
+        {"filename": "bill.png", "type": "bill", "billItems": [{"name": "AUGMENTIN 625", "amount": 120.0}]},
+        {"filename": "rx.png", "type": "prescription", "prescriptionNames": ["Augmentin 625mg"]},
+    ],
+    "aggregated": {"prescriptions": ["Augmentin 625mg"], "bills": [], "tests": []},
+    "matching": {"matchedItems": [{"prescriptionName": "Augmentin 625mg", "billItemName": "AUGMENTIN 625"}]},
+    "note": "ünïcode ✓",
+}
+
+
+def test_round_trip(tmp_path):
+    path = summary_store.write_summary(str(tmp_path), SUMMARY)
+    assert os.path.basename(path) == summary_store.SUMMARY_FILE
+    assert summary_store.load_summary(str(tmp_path)) == SUMMARY
+    assert summary_store.decode(summary_store.encode(SUMMARY)) == SUMMARY
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('.tmp-')]
+
+
+def test_sections_and_single_files(tmp_path):
+    summary_store.write_summary(str(tmp_path), SUMMARY)
+    assert summary_store.load_section(str(tmp_path), 'matching') == SUMMARY["matching"]
+    assert summary_store.load_section(str(tmp_path), 'missing', 'default') == 'default'
+    assert summary_store.load_file_result(str(tmp_path), 1) == SUMMARY["files"][1]
+    assert summary_store.load_file_result(str(tmp_path), 'bill.png') == SUMMARY["files"][0]
+    assert summary_store.load_file_result(str(tmp_path), 5) is None
+    reader = summary_store.open_summary(str(tmp_path))
+    assert reader.keys() == list(SUMMARY)
+    assert reader.file_names() == ['bill.png', 'rx.png']
+
+
+def test_legacy_json_is_read_and_converted(tmp_path):
+    with open(tmp_path / summary_store.LEGACY_SUMMARY_FILE, 'w', encoding='utf-8') as f:
+        json.dump(SUMMARY, f)
+    assert summary_store.load_file_result(str(tmp_path), 'rx.png') == SUMMARY["files"][1]
+
+    assert summary_store.convert_legacy(str(tmp_path)) is not None
+    assert summary_store.summary_path(str(tmp_path)).endswith(summary_store.SUMMARY_FILE)
+    assert summary_store.load_summary(str(tmp_path)) == SUMMARY
+    assert summary_store.convert_legacy(str(tmp_path)) is None
+
+
+def test_missing_summary(tmp_path):
+    assert summary_store.open_summary(str(tmp_path)) is None
+    assert summary_store.load_summary(str(tmp_path)) is None
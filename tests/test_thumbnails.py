@@ -0,0 +1,46 @@
+import io
+
+from PIL import Image
+
+import thumbnails
+from conftest import write_session
+
+
+def png(width: int, height: int) -> bytes:
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(out, 'PNG')
+    return out.getvalue()
+
+
+def test_variants_are_rendered_once_per_page(server_env):
+    page = png(2000, 1000)
+    write_session(server_env.DATASET_DIR, 'Asha', '20251008_100305', {'page_1.png': page, 'page_2.png': page})
+    assert server_env.render_dataset_thumbnails() == {"pages": 2, "rendered": 1, "skipped": 1}
+    assert server_env.render_dataset_thumbnails() == {"pages": 2, "rendered": 0, "skipped": 2}
+    sizes = {}
+    for variant, max_px in thumbnails.VARIANTS.items():
+        with Image.open(thumbnails.variant_path(server_env.THUMBNAIL_DIR, server_env._hash_document(page),
+                                                variant)) as img:
+            sizes[variant] = img.size
+    assert sizes == {'thumb': (256, 128), 'preview': (1024, 512)}
+
+
+def test_file_endpoint_serves_cacheable_variants(server_env):
+    write_session(server_env.DATASET_DIR, 'Asha', '20251008_100305',
+                  {'page_1.png': png(600, 900), 'notes.txt': b'not an image'})
+    server_env.dedup_dataset()  # only files the session stored are served
+    client = server_env.app.test_client()
+    url = '/api/datasets/Asha/20251008_100305/files/'
+
+    # Rendered on demand when the worker has not got to it yet
+    response = client.get(url + 'page_1.png?size=thumb')
+    assert response.status_code == 200 and response.mimetype == 'image/jpeg'
+    assert Image.open(io.BytesIO(response.data)).size == (171, 256)
+    assert 'immutable' in response.headers['Cache-Control']
+    again = client.get(url + 'page_1.png?size=thumb', headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+
+    full = client.get(url + 'page_1.png')
+    assert Image.open(io.BytesIO(full.data)).size == (600, 900)
+    assert client.get(url + 'page_1.png?size=huge').status_code == 400
+    assert client.get(url + 'notes.txt?size=preview').status_code == 415
@@ -0,0 +1,98 @@
+"""
+Page thumbnails and previews
+Stored pages are full-resolution renders (several MB for a 2.5x PDF page).
+Smaller variants are rendered once per page content and kept on disk,
+named by the page's SHA-256 so identical pages share them:
+
+- thumbs/<aa>/<sha256>_<variant>.jpg
+
+Variants never change for a given digest, so they can be cached by browsers
+indefinitely.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+from typing import Dict, Optional
+
+from PIL import Image
+
+# Longest side in pixels
+VARIANTS = {
+    'thumb': 256,
+    'preview': 1024,
+}
+JPEG_QUALITY = 80
+
+
+def variant_path(thumb_dir: str, digest: str, variant: str) -> str:
+    return os.path.join(thumb_dir, digest[:2], f'{digest}_{variant}.jpg')
+
+
+def render(data: bytes, max_px: int) -> Optional[bytes]:
+    """JPEG of the image scaled to fit max_px, or None if data is not an image"""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft('RGB', (max_px, max_px))  # cheap JPEG downscale while decoding
+            img = img.convert('RGB')
+            img.thumbnail((max_px, max_px), Image.LANCZOS)
+            out = io.BytesIO()
+            img.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            return out.getvalue()
+    except Exception:
+        return None
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def ensure_variant(thumb_dir: str, data: bytes, variant: str, digest: str = None) -> Optional[str]:
+    """Path of the variant, rendering it first if needed; None if the page is not an image"""
+    digest = digest or hashlib.sha256(data).hexdigest()
+    path = variant_path(thumb_dir, digest, variant)
+    if os.path.exists(path):
+        return path
+    rendered = render(data, VARIANTS[variant])
+    if rendered is None:
+        return None
+    _write_atomic(path, rendered)
+    return path
+
+
+def remove_variants(thumb_dir: str, digest: str) -> int:
+    """Delete every rendered variant of a page; returns the bytes freed"""
+    freed = 0
+    for variant in VARIANTS:
+        path = variant_path(thumb_dir, digest, variant)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            freed += size
+        except FileNotFoundError:
+            pass
+    return freed
+
+
+def ensure_all(thumb_dir: str, data: bytes, digest: str = None) -> Dict[str, Optional[str]]:
+    """Render every variant of one page, each smaller one from the next larger"""
+    digest = digest or hashlib.sha256(data).hexdigest()
+    paths = {}
+    source = data
+    for variant in sorted(VARIANTS, key=VARIANTS.get, reverse=True):
+        paths[variant] = ensure_variant(thumb_dir, source, variant, digest)
+        if paths[variant] is None:
+            break
+        with open(paths[variant], 'rb') as f:
+            source = f.read()
+    return paths